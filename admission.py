@@ -0,0 +1,226 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from metrics import METRICS
+
+# 拒绝请求的原因（运行指标 requests_rejected_total 的 reason 标签）
+REJECT_TOO_LARGE = 'too_large'
+REJECT_QUEUE_FULL = 'queue_full'
+REJECT_QUEUE_TIMEOUT = 'queue_timeout'
+
+
+class RequestRejected(Exception):
+    """
+    请求未被接纳：文本过长（413）、等待队列已满（429）或排队超时（503）
+
+    属性:
+    status (int): HTTP状态码
+    reason (str): 拒绝原因
+    retry_after (int): 建议客户端等待的秒数，文本过长时为None
+    """
+
+    def __init__(self, status, reason, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def headers(self):
+        """响应头（Retry-After）"""
+        return {'Retry-After': str(self.retry_after)} if self.retry_after is not None else {}
+
+
+class Admission:
+    """
+    一个已接纳的请求占用的处理名额，处理结束后调用 release() 归还（可重复调用）
+    """
+    __slots__ = ('_controller', '_start', '_released')
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self):
+        """归还处理名额，交给排在最前面的等待请求"""
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    请求准入控制
+
+    最多 max_concurrent 个请求同时处理，其余请求按到达顺序在有界队列中等待：
+    超过 max_chars 个字符的请求直接拒绝（413），队列中已有 max_queue 个请求时立即拒绝（429），
+    排队超过 max_wait 秒仍未轮到时拒绝（503），后两种带有按平均处理耗时估计的 Retry-After。
+    处理名额归还时直接交给队首的请求，不会被新到达的请求插队，排队时间有上限，尾延迟也就有上限。
+    同步（Flask）和异步（asgi.py）的请求共用同一个队列。
+    """
+
+    def __init__(self, max_concurrent=1, max_queue=16, max_wait=10.0, max_chars=None):
+        """
+        初始化准入控制
+
+        参数:
+        max_concurrent (int): 同时处理的请求数
+        max_queue (int): 等待队列的最大长度，0 表示不排队
+        max_wait (float): 最长排队时间（秒）
+        max_chars (int): 单个请求的最大字符数，None 表示不限制
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.max_chars = max_chars
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        # 最近请求占用名额时间的指数滑动平均（秒），用于估计 Retry-After
+        self._average_hold = 1.0
+        self._rejected = {REJECT_TOO_LARGE: 0, REJECT_QUEUE_FULL: 0, REJECT_QUEUE_TIMEOUT: 0}
+
+    @property
+    def queued(self):
+        """正在排队的请求数"""
+        return len(self._waiters)
+
+    def retry_after(self):
+        """
+        估计排队请求全部处理完所需的秒数
+
+        返回:
+        int: 秒数，至少为1
+        """
+        rounds = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._average_hold))
+
+    def _reject(self, endpoint, status, reason, message, retry_after=None):
+        self._rejected[reason] += 1
+        if METRICS.enabled:
+            METRICS.request_rejected(endpoint, reason)
+        return RequestRejected(status, reason, message, retry_after)
+
+    def _enter(self, endpoint, chars):
+        """占用名额或排队，返回None（已占用）或排队的Future"""
+        if self.max_chars is not None and chars > self.max_chars:
+            raise self._reject(endpoint, 413, REJECT_TOO_LARGE, f'文本超过 {self.max_chars} 个字符')
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject(endpoint, 429, REJECT_QUEUE_FULL, '请求过多，请稍后重试', self.retry_after())
+            waiter = Future()
+            self._waiters.append(waiter)
+            return waiter
+
+    def _abandon(self, waiter):
+        """排队超时或被取消：仍在队列中时移出队列并返回True，已经轮到（名额已交给它）时返回False"""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            return True
+
+    def _admitted(self, endpoint, start):
+        if METRICS.enabled:
+            METRICS.observe_queue_wait(endpoint, time.monotonic() - start)
+        return Admission(self)
+
+    def _release(self, held=None):
+        with self._lock:
+            if held is not None:
+                self._average_hold = 0.8 * self._average_hold + 0.2 * held
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                # 已取消的等待者跳过，名额直接交给下一个
+                if waiter.set_running_or_notify_cancel():
+                    waiter.set_result(None)
+                    return
+            self.active -= 1
+
+    def admit(self, endpoint, chars=0):
+        """
+        接纳请求，没有空闲名额时阻塞排队
+
+        参数:
+        endpoint (str): 接口名，用于运行指标
+        chars (int): 请求的字符数
+
+        返回:
+        Admission: 处理名额，处理结束后调用 release() 或用 with 语句自动归还
+
+        异常:
+        RequestRejected: 请求未被接纳
+        """
+        start = time.monotonic()
+        waiter = self._enter(endpoint, chars)
+        if waiter is not None:
+            try:
+                waiter.result(timeout=self.max_wait)
+            except FutureTimeoutError:
+                if self._abandon(waiter):
+                    raise self._timeout(endpoint)
+            except BaseException:
+                if not self._abandon(waiter):
+                    self._release()
+                raise
+        return self._admitted(endpoint, start)
+
+    async def admit_async(self, endpoint, chars=0):
+        """
+        admit() 的异步版本，排队时不阻塞事件循环
+
+        参数与返回值同 admit()
+        """
+        start = time.monotonic()
+        waiter = self._enter(endpoint, chars)
+        if waiter is not None:
+            try:
+                # 超时或请求被取消时不能连带取消 waiter：名额是否已交给本请求只由 _abandon 在锁内判断，
+                # 否则 _release 可能把已取消的 waiter 当作放弃而直接减少 active，_abandon 又认为名额已交过来，
+                # 名额会被归还两次
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), self.max_wait)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise self._timeout(endpoint)
+            except BaseException:
+                # 请求被取消（如客户端断开连接）：名额已经交过来时立即归还
+                if not self._abandon(waiter):
+                    self._release()
+                raise
+        return self._admitted(endpoint, start)
+
+    def _timeout(self, endpoint):
+        return self._reject(endpoint, 503, REJECT_QUEUE_TIMEOUT, f'排队超过 {self.max_wait:g} 秒，请稍后重试',
+                            self.retry_after())
+
+    def stats(self):
+        """
+        返回准入控制的统计信息
+
+        返回:
+        dict: 正在处理和排队的请求数，以及各原因的拒绝次数
+        """
+        with self._lock:
+            return {
+                'active': self.active,
+                'queued': len(self._waiters),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'max_wait': self.max_wait,
+                'max_chars': self.max_chars,
+                'rejected': dict(self._rejected)
+            }
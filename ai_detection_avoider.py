@@ -1,20 +1,29 @@
-import random
+import bisect
 import re
 import math
 import jieba
 import nltk
-from text_preprocessor import TextPreprocessor
+from text_preprocessor import TextPreprocessor, make_rng
 from text_rewriter import TextRewriter
+from lexicon_matcher import LexiconMatcher
+from metrics import instrumented
+from scheduler import AVOID_STAGES
 
 class AIDetectionAvoider:
     """
     AI检测规避类，提供规避AI检测的功能
     """
     
-    def __init__(self):
-        """初始化AI检测规避器"""
-        self.preprocessor = TextPreprocessor()
-        self.rewriter = TextRewriter()
+    def __init__(self, preprocessor=None, rewriter=None):
+        """
+        初始化AI检测规避器
+        
+        参数:
+        preprocessor (TextPreprocessor): 共用的预处理器，默认使用改写器的预处理器或新建
+        rewriter (TextRewriter): 共用的改写器，默认新建
+        """
+        self.rewriter = rewriter or TextRewriter(preprocessor=preprocessor)
+        self.preprocessor = preprocessor or self.rewriter.preprocessor
         self.load_human_writing_features()
         self.load_ai_patterns()
     
@@ -89,14 +98,109 @@ class AIDetectionAvoider:
             "unprecedented", "revolutionary", "transformative", "cutting-edge",
             "state-of-the-art", "groundbreaking", "disruptive", "game-changing"
         ]
+        
+        self.compile_ai_patterns()
+    
+    def compile_ai_patterns(self):
+        """
+        把AI特征模式和AI偏好词汇编译进同一个多模式匹配器
+        
+        "首先.*其次.*最后" 这类模式被拆成若干固定短语，与偏好词汇一起只需扫描一遍文本；
+        含有其他正则语法的模式仍按正则表达式匹配。修改 ai_patterns 或 ai_preferred_words
+        之后需要重新调用本方法。
+        """
+        self.ai_matcher = LexiconMatcher(ignore_case=True)
+        self._pattern_parts = []
+        self._pattern_regexes = {}
+        for index, pattern in enumerate(self.ai_patterns):
+            parts = pattern.split('.*')
+            if all(part and re.escape(part) == part for part in parts):
+                for part_index, part in enumerate(parts):
+                    self.ai_matcher.add(part, ('pattern', index, part_index))
+                self._pattern_parts.append(parts)
+            else:
+                self._pattern_parts.append(None)
+                self._pattern_regexes[index] = re.compile(pattern)
+        
+        for word in self.ai_preferred_words:
+            self.ai_matcher.add(word, ('word', word))
+    
+    def find_ai_patterns(self, text):
+        """
+        扫描一遍文本，找出所有AI特征模式和AI偏好词汇
+        
+        参数:
+        text (str): 输入文本
+        
+        返回:
+        tuple: (pattern_spans, word_hits)，pattern_spans[i] 为第i个模式的匹配位置列表
+               [(start, end), ...]；word_hits 为偏好词汇的出现位置列表
+               [(start, end, word), ...]（不区分大小写）
+        """
+        part_hits = {}
+        word_hits = []
+        for start, end, value in self.ai_matcher.findall(text):
+            if value[0] == 'word':
+                word_hits.append((start, end, value[1]))
+                continue
+            _, index, part_index = value
+            # 匹配器不区分大小写，模式本身区分大小写
+            if text[start:end] == self._pattern_parts[index][part_index]:
+                part_hits.setdefault((index, part_index), []).append((start, end))
+        
+        pattern_spans = []
+        for index, parts in enumerate(self._pattern_parts):
+            if parts is None:
+                pattern_spans.append([match.span() for match in self._pattern_regexes[index].finditer(text)])
+            else:
+                hits = [part_hits.get((index, part_index), []) for part_index in range(len(parts))]
+                pattern_spans.append(self._chain_spans(text, hits))
+        
+        return pattern_spans, word_hits
+    
+    def _chain_spans(self, text, hits):
+        """
+        由各固定短语的出现位置计算 "A.*B.*C" 的匹配位置
+        
+        匹配限制在一个段落（一行）之内，并取最短的匹配：从A开始，依次取其后最早出现的
+        B和C，相当于非贪婪的 "A.*?B.*?C"。这样匹配长度不会随文档增长，
+        也不会出现相互嵌套的匹配。
+        """
+        starts = [[start for start, _ in part] for part in hits]
+        spans = []
+        position = 0
+        for start, end in hits[0]:
+            if start < position:
+                continue
+            line_end = text.find('\n', start)
+            if line_end < 0:
+                line_end = len(text)
+            
+            previous_end = end
+            for part, part_starts in zip(hits[1:], starts[1:]):
+                i = bisect.bisect_left(part_starts, previous_end)
+                if i == len(part) or part[i][1] > line_end:
+                    previous_end = None
+                    break
+                previous_end = part[i][1]
+            
+            if previous_end is None:
+                # 本行第一个A无法匹配时，本行其余的A也无法匹配
+                position = line_end
+                continue
+            spans.append((start, previous_end))
+            position = previous_end
+        
+        return spans
     
-    def add_human_writing_features(self, text, intensity=0.5):
+    def add_human_writing_features(self, text, intensity=0.5, rng=None):
         """
         添加人类写作特征
         
         参数:
         text (str): 输入文本
         intensity (float): 添加强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 处理后的文本
@@ -104,66 +208,88 @@ class AIDetectionAvoider:
         if not text:
             return ""
             
-        # 分句
-        sentences = self.preprocessor.split_sentences(text)
+        document = self.preprocessor.build_document(text)
+        self.add_human_writing_features_document(document, intensity, rng)
+        return document.text
+    
+    @instrumented('avoider.add_human_writing_features')
+    def add_human_writing_features_document(self, document, intensity=0.5, rng=None, scheduler=None):
+        """
+        在文档模型上原地添加人类写作特征
+        
+        参数:
+        document (Document): 文档对象
+        intensity (float): 添加强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        scheduler (StageScheduler): 截止时间调度器，到截止时间后停止处理
+        """
+        rng = make_rng(rng)
         
         # 处理每个句子
-        new_sentences = []
-        for i, sentence in enumerate(sentences):
-            new_sentence = sentence
-            
+        for i, sentence in enumerate(document.sentences()):
+            if scheduler is not None and scheduler.expired():
+                break
             # 根据强度决定是否添加人类写作特征
-            if random.random() < intensity:
+            if rng.random() < intensity:
+                length = len(sentence)
                 # 随机选择一种人类写作特征添加
-                feature_type = random.choice(['colloquial', 'idiom', 'transition', 'personal', 'rhetorical'])
+                feature_type = rng.choice(['colloquial', 'idiom', 'transition', 'personal', 'rhetorical'])
                 
-                if feature_type == 'colloquial' and len(sentence) > 10:
+                if feature_type == 'colloquial' and length > 10:
                     # 添加口语化表达
-                    expression = random.choice(self.colloquial_expressions)
-                    if random.random() < 0.5:
-                        new_sentence = expression + "，" + new_sentence
+                    expression = rng.choice(self.colloquial_expressions)
+                    tokens = self.preprocessor.tag_sentence(sentence)
+                    if rng.random() < 0.5:
+                        sentence.set_tokens([(expression, 'l'), ("，", 'x')] + tokens)
                     else:
-                        new_sentence = new_sentence.rstrip("。！？") + "，" + expression + "。"
+                        sentence.set_tokens(self._strip_end(tokens) + [("，", 'x'), (expression, 'l'), ("。", 'x')])
                 
-                elif feature_type == 'idiom' and len(sentence) > 15:
+                elif feature_type == 'idiom' and length > 15:
                     # 添加习语和成语
-                    idiom = random.choice(self.idioms)
-                    if "，" in new_sentence:
-                        parts = new_sentence.split("，", 1)
-                        new_sentence = parts[0] + "，" + idiom + "，" + parts[1]
+                    idiom = rng.choice(self.idioms)
+                    tokens = self.preprocessor.tag_sentence(sentence)
+                    for j, token in enumerate(tokens):
+                        if token.word == "，":
+                            sentence.set_tokens(tokens[:j + 1] + [(idiom, 'i'), ("，", 'x')] + tokens[j + 1:])
+                            break
                     else:
-                        new_sentence = new_sentence.rstrip("。！？") + "，" + idiom + "。"
+                        sentence.set_tokens(self._strip_end(tokens) + [("，", 'x'), (idiom, 'i'), ("。", 'x')])
                 
-                elif feature_type == 'transition' and i > 0 and len(sentence) > 10:
+                elif feature_type == 'transition' and i > 0 and length > 10:
                     # 添加转折连接词
-                    transition = random.choice(self.transition_words)
-                    new_sentence = transition + "，" + new_sentence
+                    transition = rng.choice(self.transition_words)
+                    tokens = self.preprocessor.tag_sentence(sentence)
+                    sentence.set_tokens([(transition, 'c'), ("，", 'x')] + tokens)
                 
-                elif feature_type == 'personal' and random.random() < 0.3:
+                elif feature_type == 'personal' and rng.random() < 0.3:
                     # 添加个人观点表达（使用较低概率，避免过度使用）
-                    opinion = random.choice(self.personal_opinions)
-                    new_sentence = opinion + "，" + new_sentence
+                    opinion = rng.choice(self.personal_opinions)
+                    tokens = self.preprocessor.tag_sentence(sentence)
+                    sentence.set_tokens([(opinion, 'l'), ("，", 'x')] + tokens)
                 
-                elif feature_type == 'rhetorical' and len(sentence) > 15:
+                elif feature_type == 'rhetorical' and length > 15:
                     # 添加修辞手法
-                    rhetorical = random.choice(self.rhetorical_devices)
-                    if new_sentence.endswith("。"):
-                        new_sentence = new_sentence[:-1] + rhetorical
-                    else:
-                        new_sentence = new_sentence + rhetorical
-            
-            new_sentences.append(new_sentence)
-        
-        # 合并句子
-        return ''.join(new_sentences)
+                    rhetorical = rng.choice(self.rhetorical_devices)
+                    tokens = self.preprocessor.tag_sentence(sentence)
+                    if tokens and tokens[-1].word == "。":
+                        tokens = tokens[:-1]
+                    sentence.set_tokens(tokens + [(rhetorical, 'x')])
+    
+    def _strip_end(self, tokens):
+        """去掉句末的句号、感叹号和问号（相当于 rstrip("。！？")）"""
+        end = len(tokens)
+        while end > 0 and tokens[end - 1].word in ("。", "！", "？"):
+            end -= 1
+        return tokens[:end]
     
-    def diversify_sentence_length(self, text, intensity=0.5):
+    def diversify_sentence_length(self, text, intensity=0.5, rng=None):
         """
         增加句子长度的多样性
         
         参数:
         text (str): 输入文本
         intensity (float): 处理强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 处理后的文本
@@ -171,11 +297,30 @@ class AIDetectionAvoider:
         if not text:
             return ""
             
-        # 分句
-        sentences = self.preprocessor.split_sentences(text)
+        document = self.preprocessor.build_document(text)
+        if not self.diversify_sentence_length_document(document, intensity, rng):
+            return text
+        return document.text
+    
+    @instrumented('avoider.diversify_sentence_length')
+    def diversify_sentence_length_document(self, document, intensity=0.5, rng=None, scheduler=None):
+        """
+        在文档模型上原地增加句子长度的多样性
+        
+        参数:
+        document (Document): 文档对象
+        intensity (float): 处理强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        scheduler (StageScheduler): 截止时间调度器，到截止时间后其余句子保持不变
+        
+        返回:
+        bool: 是否进行了处理
+        """
+        rng = make_rng(rng)
+        sentences = list(document.sentences())
         
         if len(sentences) <= 1:
-            return text
+            return False
             
         # 计算当前句子长度的标准差
         lengths = [len(s) for s in sentences]
@@ -185,54 +330,73 @@ class AIDetectionAvoider:
         
         # 如果标准差已经足够大，不需要进一步处理
         if std_dev > 10:
-            return text
+            return False
             
         # 处理句子
-        new_sentences = []
-        for i, sentence in enumerate(sentences):
-            if random.random() < intensity:
-                # 根据句子在序列中的位置决定处理方式
-                if i % 3 == 0 and len(sentence) < 30:
-                    # 扩展短句
-                    words = self.preprocessor.segment(sentence)
-                    expanded_words = []
-                    for word in words:
-                        expanded_words.append(word)
-                        # 随机添加修饰词
-                        if len(word) > 1 and random.random() < 0.3:
-                            if word in self.rewriter.synonym_dict:
-                                expanded_words.append("或者说" + random.choice(self.rewriter.synonym_dict[word]))
-                    new_sentence = ''.join(expanded_words)
-                    new_sentences.append(new_sentence)
-                elif i % 3 == 1 and len(sentence) > 20:
-                    # 分割长句
-                    mid = len(sentence) // 2
-                    # 寻找合适的分割点
-                    while mid < len(sentence) - 1 and sentence[mid] not in "，、；":
-                        mid += 1
-                    if sentence[mid] in "，、；":
-                        first_part = sentence[:mid+1]
-                        second_part = sentence[mid+1:]
-                        if not second_part.endswith(("。", "！", "？")):
-                            second_part += "。"
-                        new_sentences.append(first_part)
-                        new_sentences.append(second_part)
-                    else:
-                        new_sentences.append(sentence)
-                else:
-                    new_sentences.append(sentence)
-            else:
+        i = 0
+        stopped = False
+        for paragraph in document.paragraphs:
+            new_sentences = []
+            for sentence in paragraph.sentences:
                 new_sentences.append(sentence)
+                length = lengths[i]
+                stopped = stopped or (scheduler is not None and scheduler.expired())
+                if not stopped and rng.random() < intensity:
+                    # 根据句子在序列中的位置决定处理方式
+                    if i % 3 == 0 and length < 30:
+                        # 扩展短句
+                        self._expand_sentence(sentence, rng)
+                    elif i % 3 == 1 and length > 20:
+                        # 分割长句
+                        tail = self._split_sentence(sentence)
+                        if tail is not None:
+                            new_sentences.append(tail)
+                i += 1
+            paragraph.sentences = new_sentences
         
-        # 合并句子
-        return ''.join(new_sentences)
+        return True
     
-    def reduce_ai_patterns(self, text):
+    def _expand_sentence(self, sentence, rng):
+        """在句中随机添加"或者说……"形式的修饰词"""
+        tokens = self.preprocessor.tag_sentence(sentence)
+        expanded = []
+        for token in tokens:
+            expanded.append(token)
+            # 随机添加修饰词
+            if len(token.word) > 1 and rng.random() < 0.3:
+                synonyms = self.rewriter.get_synonyms(token.word)
+                if synonyms:
+                    expanded.append(("或者说" + rng.choice(synonyms), token.pos))
+        if len(expanded) != len(tokens):
+            sentence.set_tokens(expanded)
+    
+    def _split_sentence(self, sentence):
+        """
+        在句子中点之后的第一个逗号、顿号或分号处把句子一分为二
+        
+        返回:
+        Sentence: 后半句，无法分割时返回None
+        """
+        tokens = self.preprocessor.tag_sentence(sentence)
+        mid = len(sentence) // 2
+        # 寻找合适的分割点（不含最后一个字符）
+        for j, token in enumerate(tokens):
+            if token.start >= mid and token.end < len(sentence) and token.word in ("，", "、", "；"):
+                break
+        else:
+            return None
+        tail = sentence.split(j + 1)
+        if not tail.text.endswith(("。", "！", "？")):
+            tail.insert(len(tail.tokens), "。")
+        return tail
+    
+    def reduce_ai_patterns(self, text, rng=None):
         """
         减少AI生成文本的特征模式
         
         参数:
         text (str): 输入文本
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 处理后的文本
@@ -240,36 +404,124 @@ class AIDetectionAvoider:
         if not text:
             return ""
             
-        new_text = text
-        
-        # 替换AI常用的模式化表达
-        for pattern in self.ai_patterns:
-            if re.search(pattern, new_text):
-                # 找到匹配的模式
-                matches = re.finditer(pattern, new_text)
-                for match in matches:
-                    # 获取匹配的文本
-                    matched_text = match.group(0)
-                    # 使用改写器重写这部分文本
-                    rewritten_text = self.rewriter.rewrite_text(matched_text, methods=['synonym', 'word_order'], intensity=0.8)
-                    # 替换原文中的模式
-                    new_text = new_text.replace(matched_text, rewritten_text)
+        pieces = []
+        position = 0
+        for start, end, replacement in self._pattern_edits(text, make_rng(rng)):
+            pieces.append(text[position:start])
+            pieces.append(replacement)
+            position = end
+        pieces.append(text[position:])
+        
+        return ''.join(pieces)
+    
+    def _pattern_edits(self, text, rng):
+        """
+        计算减少AI特征模式所需的全部修改
+        
+        先收集所有模式的匹配位置，按起始位置（同一位置取较长者）选出互不重叠的片段，
+        每个片段只改写一次；AI偏好词汇只在这些片段之外替换。
+        
+        返回:
+        list: 按位置排序、互不重叠的修改列表 [(start, end, replacement), ...]
+        """
+        pattern_spans, word_hits = self.find_ai_patterns(text)
+        
+        # 选出互不重叠的模式片段
+        selected = []
+        position = 0
+        for start, end in sorted((span for spans in pattern_spans for span in spans),
+                                 key=lambda span: (span[0], -span[1])):
+            if start >= position:
+                selected.append((start, end))
+                position = end
+        
+        # 使用改写器重写这些片段
+        edits = [(start, end, self.rewriter.rewrite_text(text[start:end], methods=['synonym', 'word_order'], intensity=0.8, rng=rng))
+                 for start, end in selected]
         
         # 替换AI偏好使用的词汇
-        for word in self.ai_preferred_words:
-            if word in new_text.lower():
-                # 使用同义词替换
-                new_text = new_text.replace(word, self.rewriter.get_synonym(word))
+        i = 0
+        position = 0
+        for start, end, word in word_hits:
+            while i < len(selected) and selected[i][1] <= start:
+                i += 1
+            if start < position or (i < len(selected) and selected[i][0] < end):
+                continue
+            # 使用同义词替换
+            synonym = self.rewriter.get_synonym(word, rng=rng)
+            if synonym != word:
+                edits.append((start, end, synonym))
+                position = end
         
-        return new_text
+        edits.sort()
+        return edits
+    
+    @instrumented('avoider.reduce_ai_patterns')
+    def reduce_ai_patterns_document(self, document, rng=None, scheduler=None):
+        """
+        在文档模型上减少AI特征模式
+        
+        只有被修改片段覆盖的句子会重新分句（并在需要时重新分词），其余句子保持不变。
+        
+        参数:
+        document (Document): 文档对象
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        scheduler (StageScheduler): 截止时间调度器，到截止时间后停止处理其余段落
+        """
+        rng = make_rng(rng)
+        for paragraph in document.paragraphs:
+            if scheduler is not None and scheduler.expired():
+                break
+            text = paragraph.text
+            edits = self._pattern_edits(text, rng)
+            if not edits:
+                continue
+            
+            sentences = paragraph.sentences
+            bounds = []
+            offset = 0
+            for sentence in sentences:
+                bounds.append((offset, offset + len(sentence)))
+                offset += len(sentence)
+            
+            new_sentences = []
+            i = 0
+            j = 0
+            while j < len(sentences):
+                if i == len(edits) or edits[i][0] >= bounds[j][1]:
+                    new_sentences.append(sentences[j])
+                    j += 1
+                    continue
+                
+                # 合并被修改片段覆盖的连续句子，只对这部分重新分句
+                first = j
+                pieces = []
+                position = bounds[j][0]
+                while i < len(edits) and edits[i][0] < bounds[j][1]:
+                    start, end, replacement = edits[i]
+                    while bounds[j][1] < end:
+                        j += 1
+                    pieces.append(text[position:start])
+                    pieces.append(replacement)
+                    position = end
+                    i += 1
+                pieces.append(text[position:bounds[j][1]])
+                
+                rebuilt = self.preprocessor.build_paragraph(''.join(pieces), sentences[first].start,
+                                                           sentences[first].pos_mode)
+                new_sentences.extend(rebuilt.sentences)
+                j += 1
+            
+            paragraph.sentences = new_sentences
     
-    def adjust_perplexity(self, text, intensity=0.5):
+    def adjust_perplexity(self, text, intensity=0.5, rng=None):
         """
         调整文本的困惑度，使其更接近人类写作
         
         参数:
         text (str): 输入文本
         intensity (float): 处理强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 处理后的文本
@@ -277,40 +529,51 @@ class AIDetectionAvoider:
         if not text:
             return ""
             
-        # 分句
-        sentences = self.preprocessor.split_sentences(text)
+        document = self.preprocessor.build_document(text)
+        self.adjust_perplexity_document(document, intensity, rng)
+        return document.text
+    
+    @instrumented('avoider.adjust_perplexity')
+    def adjust_perplexity_document(self, document, intensity=0.5, rng=None, scheduler=None):
+        """
+        在文档模型上原地调整困惑度
+        
+        参数:
+        document (Document): 文档对象
+        intensity (float): 处理强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        scheduler (StageScheduler): 截止时间调度器，到截止时间后停止处理
+        """
+        # 随机插入语气词或填充词
+        filler_words = ["其实", "说实话", "确实", "的确", "当然", "无疑", "或许", "可能", "大概", "也许"]
+        
+        rng = make_rng(rng)
         
         # 处理每个句子
-        new_sentences = []
-        for sentence in sentences:
-            if random.random() < intensity and len(sentence) > 15:
+        for sentence in document.sentences():
+            if scheduler is not None and scheduler.expired():
+                break
+            if rng.random() < intensity and len(sentence) > 15:
                 # 增加文本的不可预测性
-                words = self.preprocessor.segment(sentence)
+                tokens = self.preprocessor.tag_sentence(sentence)
                 
-                # 随机插入语气词或填充词
-                filler_words = ["其实", "说实话", "确实", "的确", "当然", "无疑", "或许", "可能", "大概", "也许"]
-                
-                if len(words) > 5:
-                    insert_pos = random.randint(1, len(words) - 1)
-                    filler = random.choice(filler_words)
-                    words.insert(insert_pos, filler)
+                if len(tokens) > 5:
+                    insert_pos = rng.randint(1, len(tokens) - 1)
+                    filler = rng.choice(filler_words)
+                    sentence.insert(insert_pos, filler, 'd')
                 
                 # 随机替换一些常用词为不太常用的同义词
-                for i, word in enumerate(words):
-                    if len(word) > 1 and random.random() < 0.2:
-                        synonym = self.rewriter.get_synonym(word)
-                        if synonym != word:
-                            words[i] = synonym
-                
-                new_sentence = ''.join(words)
-                new_sentences.append(new_sentence)
-            else:
-                new_sentences.append(sentence)
-        
-        # 合并句子
-        return ''.join(new_sentences)
+                changed = False
+                for token in sentence.tokens:
+                    if len(token.word) > 1 and rng.random() < 0.2:
+                        synonym = self.rewriter.get_synonym(token.word, rng=rng)
+                        if synonym != token.word:
+                            token.word = synonym
+                            changed = True
+                if changed:
+                    sentence.set_tokens(sentence.tokens)
     
-    def avoid_ai_detection(self, text, methods=None, intensity=0.5):
+    def avoid_ai_detection(self, text, methods=None, intensity=0.5, rng=None):
         """
         综合使用多种方法规避AI检测
         
@@ -318,6 +581,7 @@ class AIDetectionAvoider:
         text (str): 输入文本
         methods (list): 使用的规避方法列表，可选值：'human_features', 'sentence_diversity', 'reduce_patterns', 'adjust_perplexity'
         intensity (float): 处理强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 处理后的文本
@@ -325,28 +589,60 @@ class AIDetectionAvoider:
         if not text:
             return ""
             
+        document = self.preprocessor.build_document(text)
+        self.avoid_ai_detection_document(document, methods=methods, intensity=intensity, rng=rng)
+        return document.text
+    
+    @instrumented('avoider.avoid_ai_detection')
+    def avoid_ai_detection_document(self, document, methods=None, intensity=0.5, rng=None, scheduler=None):
+        """
+        在文档模型上原地综合规避AI检测，各阶段共用同一份分词结果
+        
+        参数:
+        document (Document): 文档对象，可以是 TextRewriter.rewrite_document 处理过的文档
+        methods (list): 使用的规避方法列表，可选值：'human_features', 'sentence_diversity', 'reduce_patterns', 'adjust_perplexity'
+        intensity (float): 处理强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        scheduler (StageScheduler): 截止时间调度器，传入时只执行计划中的方法，到截止时间后停止处理
+        
+        返回:
+        Document: 处理后的文档（即传入的对象）
+        """
         if methods is None:
             methods = ['human_features', 'sentence_diversity', 'reduce_patterns', 'adjust_perplexity']
         
-        new_text = text
+        rng = make_rng(rng)
+        
+        def run(method):
+            if method not in methods:
+                return False
+            return scheduler is None or scheduler.should_run(AVOID_STAGES[method])
+        
+        def done(method):
+            if scheduler is not None:
+                scheduler.finish(AVOID_STAGES[method])
         
         # 添加人类写作特征
-        if 'human_features' in methods:
-            new_text = self.add_human_writing_features(new_text, intensity)
+        if run('human_features'):
+            self.add_human_writing_features_document(document, intensity, rng, scheduler)
+            done('human_features')
         
         # 增加句子长度的多样性
-        if 'sentence_diversity' in methods:
-            new_text = self.diversify_sentence_length(new_text, intensity)
+        if run('sentence_diversity'):
+            self.diversify_sentence_length_document(document, intensity, rng, scheduler)
+            done('sentence_diversity')
         
         # 减少AI生成文本的特征模式
-        if 'reduce_patterns' in methods:
-            new_text = self.reduce_ai_patterns(new_text)
+        if run('reduce_patterns'):
+            self.reduce_ai_patterns_document(document, rng, scheduler)
+            done('reduce_patterns')
         
         # 调整文本的困惑度
-        if 'adjust_perplexity' in methods:
-            new_text = self.adjust_perplexity(new_text, intensity)
+        if run('adjust_perplexity'):
+            self.adjust_perplexity_document(document, intensity, rng, scheduler)
+            done('adjust_perplexity')
         
-        return new_text
+        return document
 
 # 示例用法
 if __name__ == "__main__":
@@ -1,65 +1,468 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, abort, g, render_template, request, jsonify, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import ClosingIterator, get_input_stream
 import os
 import sys
-from text_preprocessor import TextPreprocessor
-from text_rewriter import TextRewriter
-from ai_detection_avoider import AIDetectionAvoider
+import time
+from urllib.parse import quote
+from pipeline import (PipelineCancelled, cache_options, cacheable_result, full_report, parse_options,
+                      run_pipeline_paragraphs, stream_paragraphs, stream_pipeline)
+from document_io import iter_file_paragraphs
+from result_cache import make_cache_key
+from resources import get_resources
+from metrics import METRICS
+from admission import RequestRejected
+from similarity import parse_similarity, with_similarity
+from http_codec import (MIN_COMPRESS_BYTES, UnsupportedEncoding, compress, compress_stream, decompress_file, dumps,
+                        is_compressible, loads, negotiate_encoding, parse_fields, select_fields)
 import nltk
 
-app = Flask(__name__)
-
 # 创建必要的目录
 os.makedirs('templates', exist_ok=True)
 os.makedirs('static', exist_ok=True)
 os.makedirs('static/css', exist_ok=True)
 os.makedirs('static/js', exist_ok=True)
 
-# 初始化处理器
-preprocessor = TextPreprocessor()
-rewriter = TextRewriter()
-avoider = AIDetectionAvoider()
-
-@app.route('/')
-def index():
-    """渲染主页"""
-    return render_template('index.html')
-
-@app.route('/process', methods=['POST'])
-def process():
-    """处理文本"""
-    # 获取请求数据
-    data = request.get_json()
-    
+# 请求体（包括上传文件）的最大字节数
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 200 * 1024 * 1024))
+
+
+def request_chars(data):
+    """
+    请求中待处理文本的字符数，用于准入控制
+
+    参数:
+    data (dict): 请求数据，/process_batch 的请求为所有文档的字符数之和
+
+    返回:
+    int: 字符数
+    """
+    if not isinstance(data, dict):
+        return 0
+    if isinstance(data.get('text'), str):
+        return len(data['text'])
+    documents = data.get('documents')
+    if isinstance(documents, list):
+        return sum(len(item['text']) for item in documents
+                   if isinstance(item, dict) and isinstance(item.get('text'), str))
+    return 0
+
+
+def process_document(resources, data, profile=False, cancel=None):
+    """
+    /process 的处理逻辑，Flask 和 ASGI 服务（asgi.py）共用
+
+    参数:
+    resources (Resources): 共用的资源
+    data (dict): 请求数据
+    profile (bool): 是否对本次处理进行性能分析
+    cancel (threading.Event): 取消标志
+
+    返回:
+    tuple: (响应数据, HTTP状态码)
+
+    异常:
+    PipelineCancelled: 处理被取消
+    """
     if not data or 'text' not in data:
-        return jsonify({'error': '请提供文本'}), 400
-    
+        return {'error': '请提供文本'}, 400
+
     text = data['text']
-    
-    # 获取处理参数
-    rewrite_methods = data.get('rewrite_methods', ['synonym', 'restructure', 'word_order'])
-    avoid_methods = data.get('avoid_methods', ['human_features', 'sentence_diversity', 'reduce_patterns', 'adjust_perplexity'])
-    intensity = float(data.get('intensity', 0.5))
-    
+
+    # 获取处理参数，fields 指定只返回哪些字段（如只要 final_text），不影响处理和缓存
+    try:
+        options = parse_options(data)
+        fields = parse_fields(data.get('fields'))
+        similarity = parse_similarity(data.get('similarity'))
+    except ValueError as e:
+        return {'error': f'参数错误: {str(e)}'}, 400
+
+    # 各阶段输出与原文的相似度在处理（或读取缓存）之后计算，不写入缓存；fields 中没有 similarity 时不计算
+    if fields is not None and 'similarity' not in fields:
+        similarity = None
+
+    # 需要性能分析的请求跳过结果缓存，确保分析的是完整的处理过程
+    profile = profile or bool(data.get('profile'))
+
+    # 各段落总是用由 seed 推导出的段落种子独立处理，串行、并行、流式和增量处理的结果相同
+    # parallel 为真时把各段落分发到批量处理进程池中并行执行
+    parallel = bool(data.get('parallel'))
+    # incremental 为真时只重新处理新增或修改过的段落
+    incremental = bool(data.get('incremental'))
+    extra = {}
+    if parallel:
+        extra['pool'] = resources.batch_processor
+    if incremental:
+        extra['cache'] = resources.paragraph_cache
+
+    # 相同文本和参数的请求直接返回缓存结果（增量处理按段落缓存，不使用整篇的缓存）
+    cache_key = make_cache_key(text, **cache_options(options))
+    if not profile and not incremental:
+        result = resources.result_cache.get(cache_key)
+        if result is not None:
+            if options['deadline'] is not None:
+                result = dict(result, stages=full_report(options))
+            result = with_similarity(result, similarity, resources.preprocessor.segment)
+            return select_fields(result, fields), 200
+
     # 处理文本
     try:
-        # 预处理
-        cleaned_text = preprocessor.clean_text(text)
-        
-        # 改写
-        rewritten_text = rewriter.rewrite_text(cleaned_text, methods=rewrite_methods, intensity=intensity)
-        
-        # 规避AI检测
-        final_text = avoider.avoid_ai_detection(rewritten_text, methods=avoid_methods, intensity=intensity)
-        
-        # 返回结果
+        if profile:
+            result, profile_id = resources.request_profiler.run(run_pipeline_paragraphs, text, *resources.models,
+                                                                cancel=cancel, **options, **extra)
+        else:
+            result = run_pipeline_paragraphs(text, *resources.models, cancel=cancel, **options, **extra)
+    except PipelineCancelled:
+        raise
+    except Exception as e:
+        return {'error': f'处理文本时出错: {str(e)}'}, 500
+
+    # 因截止时间只完成了部分处理的结果不缓存
+    if not incremental and cacheable_result(result) is not None:
+        resources.result_cache.put(cache_key, cacheable_result(result))
+    result = with_similarity(result, similarity, resources.preprocessor.segment)
+    if profile:
+        result = dict(result, profile_id=profile_id, profile_url=f'/profiles/{profile_id}')
+    return select_fields(result, fields), 200
+
+
+def open_upload(files, form):
+    """
+    校验 /process_file 的上传文件和处理参数
+
+    参数:
+    files: 上传的文件（字段 file）
+    form: 表单字段，rewrite_methods、avoid_methods 可重复出现或以逗号分隔，
+          另有 intensity、seed、pos_mode 和 output（txt 或 ndjson）
+
+    返回:
+    tuple: (段落生成器, 处理参数, 输出格式, 下载文件名)
+
+    异常:
+    ValueError: 没有上传文件、文件类型不支持或参数不正确
+    """
+    upload = files.get('file')
+    if upload is None or not upload.filename:
+        raise ValueError('请上传文件')
+
+    data = {}
+    for name in ('rewrite_methods', 'avoid_methods'):
+        if name in form:
+            data[name] = [method for value in form.getlist(name) for method in value.split(',') if method]
+    for name in ('intensity', 'seed', 'pos_mode'):
+        if form.get(name):
+            data[name] = form[name]
+    try:
+        options = parse_options(data)
+    except ValueError as e:
+        raise ValueError(f'参数错误: {str(e)}')
+
+    output_format = form.get('output', 'txt')
+    if output_format not in ('txt', 'ndjson'):
+        raise ValueError('output 只能是 txt 或 ndjson')
+
+    paragraphs = iter_file_paragraphs(upload.stream, upload.filename)
+    download_name = os.path.splitext(os.path.basename(upload.filename))[0] + '_rewritten.' + output_format
+    return paragraphs, options, output_format, download_name
+
+
+def content_disposition(filename):
+    """
+    生成下载文件的 Content-Disposition 响应头，文件名可以包含中文（RFC 5987）
+
+    参数:
+    filename (str): 文件名
+
+    返回:
+    str: 响应头的值（只包含ASCII字符）
+    """
+    fallback = filename.encode('ascii', 'ignore').decode().replace('"', '') or 'download'
+    return f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename)}'
+
+
+def format_results(results, output_format, fields=None):
+    """
+    把逐段处理结果编码为输出内容
+
+    参数:
+    results (iterable): stream_paragraphs 的结果
+    output_format (str): 'txt' 时逐段输出最终文本（每段一行），'ndjson' 时每段输出一行JSON
+    fields (tuple): ndjson 每行只输出这些字段（段落序号 index 总是输出），None 表示全部
+
+    返回:
+    generator: 编码后的内容片段（txt 为 str，ndjson 为UTF-8编码的 bytes）
+    """
+    if output_format == 'txt':
+        for result in results:
+            yield ('\n' if result['index'] else '') + result['final_text']
+        return
+    if fields is not None:
+        fields += ('index',)
+    try:
+        for result in results:
+            yield dumps(select_fields(result, fields)) + b'\n'
+        yield dumps({'done': True}) + b'\n'
+    except PipelineCancelled:
+        raise
+    except Exception as e:
+        yield dumps({'error': f'处理文本时出错: {str(e)}'}) + b'\n'
+
+
+class UTF8JSONProvider(DefaultJSONProvider):
+    """
+    jsonify 和 request.get_json 使用的JSON编解码：直接输出UTF-8，中文不转义为 \\uXXXX，
+    安装了 orjson 时用 orjson 序列化和解析
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(dumps(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
+
+def decompress_requests(wsgi_app, max_bytes):
+    """
+    WSGI中间件：把 Content-Encoding 为 gzip 或 deflate 的请求体解压到临时文件后再交给应用
+
+    参数:
+    wsgi_app: WSGI应用
+    max_bytes (int): 压缩和解压后请求体的最大字节数
+
+    返回:
+    callable: 包装后的WSGI应用，不支持的压缩格式返回415，数据损坏返回400，超出大小返回413
+    """
+    def middleware(environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return wsgi_app(environ, start_response)
+        try:
+            body, size = decompress_file(get_input_stream(environ, max_content_length=max_bytes), encoding, max_bytes)
+        except UnsupportedEncoding as e:
+            status, message = 415, str(e)
+        except (OverflowError, RequestEntityTooLarge):
+            status, message = 413, f'请求体超过 {max_bytes} 字节'
+        except ValueError as e:
+            status, message = 400, str(e)
+        else:
+            environ = dict(environ, **{'wsgi.input': body, 'CONTENT_LENGTH': str(size)})
+            environ.pop('HTTP_CONTENT_ENCODING')
+            environ.pop('HTTP_TRANSFER_ENCODING', None)
+            return ClosingIterator(wsgi_app(environ, start_response), body.close)
+        response = Response(dumps({'error': message}), status, mimetype='application/json')
+        return response(environ, start_response)
+
+    return middleware
+
+
+def create_app(resources=None):
+    """
+    创建Flask应用
+
+    参数:
+    resources (Resources): 共用的资源，默认使用当前进程的共享资源（第一次调用时加载）
+
+    返回:
+    Flask: 应用对象，资源保存在 app.extensions['paper_rewriter']
+    """
+    resources = resources or get_resources()
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+    app.extensions['paper_rewriter'] = resources
+    app.json = UTF8JSONProvider(app)
+    app.wsgi_app = decompress_requests(app.wsgi_app, MAX_UPLOAD_BYTES)
+
+    @app.before_request
+    def start_request_metrics():
+        """记录请求开始时间和正在处理的请求数"""
+        if METRICS.enabled:
+            g.metrics_endpoint = request.endpoint or 'unknown'
+            g.metrics_start = time.perf_counter()
+            METRICS.request_started(g.metrics_endpoint)
+
+    @app.teardown_request
+    def finish_request_metrics(exc=None):
+        """请求结束（流式响应在输出完毕后）时记录耗时，被准入控制拒绝的请求不计入"""
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            start = g.pop('metrics_start')
+            METRICS.request_finished(endpoint, None if g.pop('rejected', False) else time.perf_counter() - start)
+
+    @app.after_request
+    def compress_response(response):
+        """按 Accept-Encoding 压缩JSON、NDJSON和文本响应，流式响应逐块压缩"""
+        if (not is_compressible(response.content_type) or 'Content-Encoding' in response.headers
+                or response.direct_passthrough):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding)
+        else:
+            body = response.get_data()
+            if len(body) < MIN_COMPRESS_BYTES:
+                return response
+            response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @app.errorhandler(RequestRejected)
+    def request_rejected(e):
+        """准入控制拒绝的请求：413（文本过长）、429（队列已满）或503（排队超时），后两种带 Retry-After"""
+        g.rejected = True
+        return jsonify({'error': str(e)}), e.status, e.headers
+
+    def admit(chars=0):
+        """
+        接纳当前请求，没有空闲名额时排队，排队时间不计入请求耗时
+
+        参数:
+        chars (int): 请求的字符数
+
+        返回:
+        Admission: 处理名额
+
+        异常:
+        RequestRejected: 请求未被接纳
+        """
+        admission = resources.admission.admit(request.endpoint, chars)
+        if 'metrics_start' in g:
+            g.metrics_start = time.perf_counter()
+        return admission
+
+    @app.route('/')
+    def index():
+        """渲染主页"""
+        return render_template('index.html')
+
+    @app.route('/process', methods=['POST'])
+    def process():
+        """处理文本"""
+        profile = request.headers.get('X-Profile', '0') not in ('', '0')
+        data = request.get_json()
+        with admit(request_chars(data)):
+            result, status = process_document(resources, data, profile=profile)
+        return jsonify(result), status
+
+    @app.route('/process_stream', methods=['POST'])
+    def process_stream():
+        """逐段处理文本，以NDJSON格式（每行一个JSON对象）流式返回每段的结果"""
+        data = request.get_json()
+
+        if not data or 'text' not in data:
+            return jsonify({'error': '请提供文本'}), 400
+
+        text = data['text']
+        try:
+            options = parse_options(data)
+            fields = parse_fields(data.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': f'参数错误: {str(e)}'}), 400
+
+        admission = admit(len(text) if isinstance(text, str) else 0)
+
+        def generate():
+            try:
+                cache = resources.paragraph_cache if data.get('incremental') else None
+                yield from format_results(stream_pipeline(text, *resources.models, cache=cache, **options),
+                                          'ndjson', fields)
+            finally:
+                admission.release()
+
+        # 处理名额在输出完毕或连接关闭时归还
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.call_on_close(admission.release)
+        return response
+
+    @app.route('/process_file', methods=['POST'])
+    def process_file():
+        """逐段读取上传的 .txt 或 .docx 文件并流式返回处理结果，内存占用与文件大小无关"""
+        # 上传文件的字符数事先未知，大小由 MAX_UPLOAD_BYTES 限制
+        admission = admit()
+        try:
+            paragraphs, options, output_format, download_name = open_upload(request.files, request.form)
+        except ValueError as e:
+            admission.release()
+            return jsonify({'error': str(e)}), 400
+
+        def generate():
+            try:
+                yield from format_results(stream_paragraphs(paragraphs, *resources.models, **options), output_format)
+            finally:
+                admission.release()
+
+        mimetype = 'text/plain' if output_format == 'txt' else 'application/x-ndjson'
+        response = Response(stream_with_context(generate()), mimetype=mimetype,
+                            headers={'Content-Disposition': content_disposition(download_name)})
+        response.call_on_close(admission.release)
+        return response
+
+    @app.route('/process_batch', methods=['POST'])
+    def process_batch():
+        """批量处理文本，每篇文档可以单独指定处理参数"""
+        # 各文档的 deadline_ms 从收到请求时开始计时，而不是从工作进程开始处理该文档时
+        received = time.monotonic()
+        data = request.get_json()
+
+        if not data or not isinstance(data.get('documents'), list):
+            return jsonify({'error': '请提供文档列表'}), 400
+        try:
+            fields = parse_fields(data.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': f'参数错误: {str(e)}'}), 400
+
+        # 结果顺序与输入一致，单篇出错不影响其他文档
+        with admit(request_chars(data)):
+            results = resources.batch_processor.process(data['documents'], received=received)
+
+        return jsonify({'results': [select_fields(result, fields) for result in results]})
+
+    @app.route('/cache_stats')
+    def cache_stats():
+        """返回处理结果缓存和分词缓存的统计信息，以及准入控制的状态"""
         return jsonify({
-            'original_text': text,
-            'cleaned_text': cleaned_text,
-            'rewritten_text': rewritten_text,
-            'final_text': final_text
+            'admission': resources.admission.stats(),
+            'result_cache': resources.result_cache.stats(),
+            'paragraph_cache': resources.paragraph_cache.stats(),
+            'preprocessor_cache': resources.preprocessor.cache_stats()
         })
-    except Exception as e:
-        return jsonify({'error': f'处理文本时出错: {str(e)}'}), 500
+
+    @app.route('/profiles/<profile_id>')
+    def download_profile(profile_id):
+        """下载单次请求的性能分析结果（.pstats，可用 python -m pstats 或 snakeviz 查看）"""
+        profiler = resources.request_profiler
+        if not profiler.exists(profile_id):
+            abort(404)
+        return send_file(os.path.abspath(profiler.path_for(profile_id)), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=profile_id + '.pstats')
+
+    @app.route('/profiler/samples')
+    def profiler_samples():
+        """返回后台采样器累计的折叠栈，可直接交给 flamegraph.pl 或 speedscope 生成火焰图"""
+        sampler = resources.stack_sampler
+        if sampler is None:
+            return jsonify({'error': '采样器未启用，请设置环境变量 SAMPLING_PROFILER=1'}), 404
+        if request.args.get('reset'):
+            sampler.reset()
+            return jsonify({'reset': True})
+        return Response(sampler.collapsed(), content_type='text/plain; charset=utf-8')
+
+    @app.route('/metrics')
+    def metrics():
+        """以Prometheus文本格式返回各阶段耗时、请求数、队列深度和缓存统计"""
+        return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    return app
+
+
+# 模块级应用对象，供 python app.py、gunicorn 和 Vercel 使用
+app = create_app()
 
 if __name__ == '__main__':
     # 设置 NLTK 数据路径为项目目录中的 nltk_data
@@ -67,4 +470,4 @@ if __name__ == '__main__':
     nltk.data.path.append(nltk_data_path)
 
     # 启动 Flask 应用
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,548 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.formparser import parse_form_data
+from app import (MAX_UPLOAD_BYTES, app, content_disposition, format_results, open_upload, process_document,
+                 request_chars)
+from http_codec import (MIN_COMPRESS_BYTES, StreamCompressor, UnsupportedEncoding, compress, decompress,
+                        decompress_file, dumps, loads, negotiate_encoding, parse_fields, select_fields)
+from admission import RequestRejected
+from metrics import METRICS
+from pipeline import parse_options, stream_paragraphs, stream_pipeline
+from resources import worker_share
+
+# 生产环境的ASGI服务入口：uvicorn asgi:application --host 0.0.0.0 --port 5000
+# /process、/process_stream 和 /process_batch 由事件循环直接处理，耗CPU的处理流程放到有界线程池中执行，
+# 处理期间事件循环仍然可以响应其他请求；其余路由（主页、静态文件等）转交给Flask应用
+
+# 执行处理流程的线程数和单个请求的超时时间（秒）
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 0)) or worker_share(os.cpu_count() or 1)
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 60))
+# 上传文件处理（/process_file）的超时时间（秒）
+FILE_REQUEST_TIMEOUT = float(os.environ.get('FILE_REQUEST_TIMEOUT', 3600))
+
+pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='pipeline')
+
+# 其余路由都很轻量，使用单独的小线程池执行，不会排在耗时的处理请求后面
+wsgi_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='wsgi')
+
+# 与Flask应用共用同一组已加载的模型和进程池
+resources = app.extensions['paper_rewriter']
+
+
+async def read_body(receive):
+    """
+    读取完整的请求体
+
+    返回:
+    bytes: 请求体，客户端在发送完成前断开连接时返回None
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def read_body_to_file(receive, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    把请求体写入临时文件（较小时保存在内存中），用于接收上传的大文件
+
+    返回:
+    tuple: (文件对象, 是否超出大小限制)，客户端在发送完成前断开连接时文件对象为None
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None, False
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > max_bytes:
+            body.close()
+            return body, True
+        body.write(chunk)
+        if not message.get('more_body'):
+            body.seek(0)
+            return body, False
+
+
+async def wait_for_disconnect(receive):
+    """等待客户端断开连接"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def read_json(scope, receive, send):
+    """
+    读取并解析JSON请求体，支持 gzip 和 deflate 压缩的请求体（Content-Encoding）
+
+    出错时直接发送错误响应：不支持的压缩格式415，解压后过大413，数据损坏或不是JSON 400。
+
+    返回:
+    tuple: (是否成功, 解析后的数据)，客户端断开连接或出错时为 (False, None)
+    """
+    body = await read_body(receive)
+    if body is None:
+        return False, None
+    encoding = dict(scope['headers']).get(b'content-encoding', b'').decode('latin-1')
+    try:
+        body = decompress(body, encoding, MAX_UPLOAD_BYTES)
+    except UnsupportedEncoding as e:
+        await send_json(send, {'error': str(e)}, 415)
+        return False, None
+    except OverflowError as e:
+        await send_json(send, {'error': str(e)}, 413)
+        return False, None
+    except ValueError as e:
+        await send_json(send, {'error': str(e)}, 400)
+        return False, None
+    try:
+        return True, loads(body or b'null')
+    except ValueError:
+        await send_json(send, {'error': '请求体不是有效的JSON'}, 400)
+        return False, None
+
+
+def accepted_encoding(scope):
+    """按 Accept-Encoding 请求头选择响应的压缩格式，不压缩时返回None"""
+    return negotiate_encoding(dict(scope['headers']).get(b'accept-encoding', b'').decode('latin-1'))
+
+
+async def send_json(send, data, status=200, headers=(), encoding=None):
+    """
+    发送JSON响应（UTF-8编码）
+
+    参数:
+    send: ASGI send
+    data: 响应数据
+    status (int): HTTP状态码
+    headers (iterable): 其他响应头
+    encoding (str): 压缩格式（'br' 或 'gzip'），响应体较小时不压缩
+    """
+    body = dumps(data)
+    extra = [(b'vary', b'accept-encoding')]
+    if encoding is not None and len(body) >= MIN_COMPRESS_BYTES:
+        body = compress(body, encoding)
+        extra.append((b'content-encoding', encoding.encode()))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+                   + extra + list(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def build_environ(scope, body):
+    """根据ASGI的scope构建WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    """
+    调用Flask应用并收集完整响应
+
+    返回:
+    tuple: (状态码, 响应头列表, 响应体)
+    """
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return chunks.append
+
+    iterable = app(environ, start_response)
+    try:
+        for chunk in iterable:
+            chunks.append(chunk)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+async def flask_application(scope, receive, send):
+    """把请求转交给Flask应用（在 wsgi_executor 中执行）"""
+    body = await read_body(receive)
+    if body is None:
+        return
+    loop = asyncio.get_running_loop()
+    status, headers, content = await loop.run_in_executor(wsgi_executor, call_wsgi, build_environ(scope, body))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+async def admit(scope, send, chars=0):
+    """
+    接纳请求，没有空闲名额时在准入队列中等待（不阻塞事件循环）
+
+    被拒绝时直接发送错误响应（413、429 或 503，后两种带 Retry-After）。
+    接纳时间记录在 scope 中，排队时间和被拒绝的请求不计入请求耗时。
+
+    参数:
+    scope: ASGI scope
+    send: ASGI send
+    chars (int): 请求的字符数
+
+    返回:
+    Admission: 处理名额，被拒绝时返回None
+    """
+    try:
+        admission = await resources.admission.admit_async(scope['path'].lstrip('/'), chars)
+    except RequestRejected as e:
+        scope['paper_rewriter.rejected'] = True
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in e.headers.items()]
+        await send_json(send, {'error': str(e)}, e.status, headers)
+        return None
+    scope['paper_rewriter.admitted'] = time.perf_counter()
+    return admission
+
+
+def release_when_done(future, admission):
+    """
+    线程池中的任务结束后再归还处理名额
+
+    取消只是设置标志，线程要处理完当前句子才会停止；在此之前名额仍被占用，
+    新的请求不会越过准入控制堆积在 pipeline_executor 的队列中。
+
+    参数:
+    future (asyncio.Future): 线程池中的任务，为None时立即归还
+    admission (Admission): 处理名额
+    """
+    if future is None or future.done():
+        admission.release()
+    else:
+        future.add_done_callback(lambda f: admission.release())
+
+
+async def run_cancellable(func, receive, cancel, admission):
+    """
+    在线程池中执行func，同时等待客户端断开连接和请求超时
+
+    断开连接或超时时设置取消标志，处理流程在处理完当前句子后停止；处理名额在线程中的任务结束后才归还。
+
+    参数:
+    func (callable): 无参函数
+    receive: ASGI receive
+    cancel (threading.Event): 传给处理流程的取消标志
+    admission (Admission): 本次请求的处理名额
+
+    返回:
+    tuple: (状态, 结果)，状态为 'done'、'disconnected' 或 'timeout'
+    """
+    loop = asyncio.get_running_loop()
+    future = None
+    try:
+        future = loop.run_in_executor(pipeline_executor, func)
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait({future, disconnect}, timeout=REQUEST_TIMEOUT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+    except BaseException:
+        cancel.set()
+        raise
+    finally:
+        release_when_done(future, admission)
+
+    if future in done:
+        return 'done', future.result()
+
+    cancel.set()
+    # 取消后线程中的异常（PipelineCancelled）不再需要处理
+    future.add_done_callback(lambda f: f.exception())
+    return ('disconnected' if disconnect in done else 'timeout'), None
+
+
+async def handle_process(scope, receive, send):
+    """/process：与Flask版本相同的处理逻辑，在线程池中执行"""
+    ok, data = await read_json(scope, receive, send)
+    if not ok:
+        return
+
+    headers = dict(scope['headers'])
+    profile = headers.get(b'x-profile', b'0') not in (b'', b'0')
+    admission = await admit(scope, send, request_chars(data))
+    if admission is None:
+        return
+    cancel = threading.Event()
+    state, outcome = await run_cancellable(
+        lambda: process_document(resources, data, profile=profile, cancel=cancel), receive, cancel, admission)
+    if state == 'done':
+        result, status = outcome
+        await send_json(send, result, status, encoding=accepted_encoding(scope))
+    elif state == 'timeout':
+        await send_json(send, {'error': f'处理超时（超过 {REQUEST_TIMEOUT:g} 秒）'}, 504)
+
+
+async def handle_process_stream(scope, receive, send):
+    """/process_stream：每处理完一段就发送一行NDJSON，客户端断开后停止处理剩余段落"""
+    ok, data = await read_json(scope, receive, send)
+    if not ok:
+        return
+    if not data or 'text' not in data:
+        await send_json(send, {'error': '请提供文本'}, 400)
+        return
+    try:
+        options = parse_options(data)
+        fields = parse_fields(data.get('fields'))
+    except ValueError as e:
+        await send_json(send, {'error': f'参数错误: {str(e)}'}, 400)
+        return
+
+    admission = await admit(scope, send, request_chars(data))
+    if admission is None:
+        return
+    cancel = threading.Event()
+    cache = resources.paragraph_cache if data.get('incremental') else None
+    results = stream_pipeline(data['text'], *resources.models, cancel=cancel, cache=cache, **options)
+    await send_stream(format_results(results, 'ndjson', fields), receive, send, cancel, b'application/x-ndjson',
+                      REQUEST_TIMEOUT, admission, encoding=accepted_encoding(scope))
+
+
+async def send_stream(chunks, receive, send, cancel, content_type, timeout, admission, headers=(), encoding=None):
+    """
+    在线程池中逐个取出输出片段并发送，客户端断开连接或超时后停止处理
+
+    参数:
+    chunks (iterator): 输出片段（str），每取一个会处理一个段落
+    receive, send: ASGI receive、send
+    cancel (threading.Event): 处理流程的取消标志
+    content_type (bytes): 响应的Content-Type
+    timeout (float): 整个流式响应的超时时间（秒）
+    admission (Admission): 本次请求的处理名额，结束时（仍在处理的段落停止后）归还
+    headers (iterable): 其他响应头
+    encoding (str): 压缩格式（'br' 或 'gzip'），每个片段压缩后立即发送
+    """
+    deadline = time.monotonic() + timeout
+    compressor = StreamCompressor(encoding) if encoding is not None else None
+    extra = [(b'vary', b'accept-encoding')]
+    if compressor is not None:
+        extra.append((b'content-encoding', encoding.encode()))
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', content_type)] + extra + list(headers)})
+
+    async def send_chunk(chunk):
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        elif isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+    # 整个流式请求共用一个超时时间
+    loop = asyncio.get_running_loop()
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    # 线程池中正在处理的段落，停止后才归还处理名额
+    running = None
+    try:
+        while True:
+            running = loop.run_in_executor(pipeline_executor, next, chunks, None)
+            done, _ = await asyncio.wait({running, disconnect}, timeout=max(0, deadline - time.monotonic()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if running not in done:
+                cancel.set()
+                running.add_done_callback(lambda f: f.exception())
+                if disconnect not in done and content_type == b'application/x-ndjson':
+                    await send_chunk(dumps({'error': f'处理超时（超过 {timeout:g} 秒）'}) + b'\n')
+                break
+            try:
+                chunk = running.result()
+            except Exception as e:
+                if content_type == b'application/x-ndjson':
+                    await send_chunk(dumps({'error': f'处理文本时出错: {str(e)}'}) + b'\n')
+                break
+            if chunk is None:
+                break
+            await send_chunk(chunk)
+    except BaseException:
+        cancel.set()
+        raise
+    finally:
+        disconnect.cancel()
+        release_when_done(running, admission)
+
+    await send({'type': 'http.response.body', 'body': compressor.finish() if compressor is not None else b''})
+
+
+async def handle_process_file(scope, receive, send):
+    """/process_file：上传文件先写入临时文件，再逐段处理并流式返回"""
+    body, too_large = await read_body_to_file(receive)
+    if body is None:
+        return
+    if too_large:
+        await send_json(send, {'error': f'上传文件超过 {MAX_UPLOAD_BYTES} 字节'}, 413)
+        return
+    size = None
+    content_encoding = dict(scope['headers']).get(b'content-encoding', b'').decode('latin-1')
+    if content_encoding.strip().lower() not in ('', 'identity'):
+        # 压缩上传的文件解压到另一个临时文件
+        loop = asyncio.get_running_loop()
+        try:
+            compressed = body
+            body, size = await loop.run_in_executor(wsgi_executor, decompress_file, compressed, content_encoding,
+                                                    MAX_UPLOAD_BYTES)
+        except UnsupportedEncoding as e:
+            await send_json(send, {'error': str(e)}, 415)
+            return
+        except OverflowError as e:
+            await send_json(send, {'error': str(e)}, 413)
+            return
+        except ValueError as e:
+            await send_json(send, {'error': str(e)}, 400)
+            return
+        finally:
+            compressed.close()
+
+    # 上传文件的字符数事先未知，大小由 MAX_UPLOAD_BYTES 限制
+    admission = await admit(scope, send)
+    if admission is None:
+        body.close()
+        return
+
+    environ = build_environ(scope, b'')
+    environ['wsgi.input'] = body
+    if size is not None:
+        environ['CONTENT_LENGTH'] = str(size)
+        environ.pop('HTTP_CONTENT_ENCODING')
+    loop = asyncio.get_running_loop()
+    try:
+        _, form, files = await loop.run_in_executor(wsgi_executor, parse_form_data, environ)
+        paragraphs, options, output_format, download_name = open_upload(files, form)
+    except BaseException as e:
+        admission.release()
+        body.close()
+        if not isinstance(e, ValueError):
+            raise
+        await send_json(send, {'error': str(e)}, 400)
+        return
+
+    cancel = threading.Event()
+    results = stream_paragraphs(paragraphs, *resources.models, cancel=cancel, **options)
+    content_type = b'text/plain; charset=utf-8' if output_format == 'txt' else b'application/x-ndjson'
+    try:
+        await send_stream(format_results(results, output_format), receive, send, cancel, content_type,
+                          FILE_REQUEST_TIMEOUT, admission,
+                          [(b'content-disposition', content_disposition(download_name).encode('ascii'))],
+                          encoding=accepted_encoding(scope))
+    finally:
+        body.close()
+
+
+async def handle_process_batch(scope, receive, send):
+    """/process_batch：在批量处理进程池中执行，等待结果时不阻塞事件循环"""
+    received = time.monotonic()
+    ok, data = await read_json(scope, receive, send)
+    if not ok:
+        return
+    if not data or not isinstance(data.get('documents'), list):
+        await send_json(send, {'error': '请提供文档列表'}, 400)
+        return
+    try:
+        fields = parse_fields(data.get('fields'))
+    except ValueError as e:
+        await send_json(send, {'error': f'参数错误: {str(e)}'}, 400)
+        return
+
+    admission = await admit(scope, send, request_chars(data))
+    if admission is None:
+        return
+    cancel = threading.Event()
+    # 取消后撤销进程池中尚未开始处理的文档
+    state, results = await run_cancellable(
+        lambda: resources.batch_processor.process(data['documents'], cancel, received), receive, cancel, admission)
+    if state == 'done':
+        await send_json(send, {'results': [select_fields(result, fields) for result in results]},
+                        encoding=accepted_encoding(scope))
+    elif state == 'timeout':
+        await send_json(send, {'error': f'处理超时（超过 {REQUEST_TIMEOUT:g} 秒）'}, 504)
+
+
+async def handle_lifespan(receive, send):
+    """服务关闭时释放线程池和批量处理进程池"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            pipeline_executor.shutdown(wait=False, cancel_futures=True)
+            wsgi_executor.shutdown(wait=False, cancel_futures=True)
+            resources.batch_processor.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+ROUTES = {
+    '/process': handle_process,
+    '/process_stream': handle_process_stream,
+    '/process_batch': handle_process_batch,
+    '/process_file': handle_process_file,
+}
+
+
+async def application(scope, receive, send):
+    """ASGI应用入口"""
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+        return
+
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get(scope['path'])
+    if handler is None or scope['method'] != 'POST':
+        await flask_application(scope, receive, send)
+        return
+
+    endpoint = scope['path'].lstrip('/')
+    start = time.perf_counter()
+    if METRICS.enabled:
+        METRICS.request_started(endpoint)
+    try:
+        await handler(scope, receive, send)
+    finally:
+        if METRICS.enabled:
+            # 请求耗时从被接纳时开始计算，被准入控制拒绝的请求不计入
+            start = scope.get('paper_rewriter.admitted', start)
+            rejected = scope.get('paper_rewriter.rejected', False)
+            METRICS.request_finished(endpoint, None if rejected else time.perf_counter() - start)
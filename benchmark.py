@@ -0,0 +1,325 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import jieba
+from lru_cache import LRUCache
+from text_preprocessor import TextPreprocessor, get_shared_cache
+from text_rewriter import TextRewriter
+from ai_detection_avoider import AIDetectionAvoider
+
+# 合成语料使用的学术写作片段
+SUBJECTS = ["本文", "本研究", "该方法", "实验结果", "研究者", "这一模型", "相关数据", "上述分析", "现有文献", "该系统"]
+TOPICS = ["自然语言处理", "深度学习", "文本改写", "学术写作", "信息检索", "知识图谱", "机器翻译", "数据挖掘",
+          "语义分析", "社会网络", "教育评价", "城市规划", "公共政策", "供应链管理", "环境监测"]
+VERBS = ["表明", "分析了", "提出了", "验证了", "探讨了", "研究了", "提高了", "降低了", "揭示了", "发现了"]
+OBJECTS = ["重要意义", "显著影响", "有效方法", "主要问题", "基本特点", "研究结果", "关键数据", "潜在价值",
+           "内在机制", "发展趋势"]
+CLAUSES = ["在一定程度上", "从理论和实践两个方面", "通过大量实验", "基于多维特征", "结合具体案例",
+           "在不同条件下", "与已有方法相比", "随着技术的不断发展"]
+CONNECTIVES = ["首先，", "其次，", "最后，", "此外，", "然而，", "因此，", "总而言之，", "一方面，", "另一方面，",
+               "值得注意的是，", "综上所述，", ""]
+
+# 默认测试的文档大小（UTF-8字节数）
+DEFAULT_SIZES = ['1K', '10K', '100K', '1M']
+
+# 拟合的时间-规模指数超过该值时视为超线性增长
+SUPERLINEAR_EXPONENT = 1.15
+
+
+def parse_size(value):
+    """把 '10K'、'1M' 这样的字符串解析为字节数"""
+    value = value.strip().upper()
+    units = {'K': 1024, 'M': 1024 * 1024}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def generate_corpus(size_bytes, seed=0):
+    """
+    生成确定性的中文学术合成语料
+
+    参数:
+    size_bytes (int): 目标大小（UTF-8字节数）
+    seed (int): 随机种子，相同的种子和大小总是生成相同的文本
+
+    返回:
+    str: 合成文本，段落之间以换行分隔
+    """
+    rng = random.Random(f"{seed}:{size_bytes}")
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            sentence = (rng.choice(CONNECTIVES) + rng.choice(SUBJECTS) + rng.choice(CLAUSES) +
+                        rng.choice(VERBS) + rng.choice(TOPICS) + "的" + rng.choice(OBJECTS))
+            if rng.random() < 0.3:
+                sentence += "，" + rng.choice(SUBJECTS) + rng.choice(VERBS) + rng.choice(OBJECTS)
+            sentences.append(sentence + rng.choice("。。。！？"))
+        paragraph = ''.join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph.encode('utf-8')) + 1
+    text = '\n'.join(paragraphs)
+    # 截断到目标大小附近的句子边界
+    encoded = text.encode('utf-8')
+    if len(encoded) > size_bytes:
+        text = encoded[:size_bytes].decode('utf-8', errors='ignore')
+        cut = max(text.rfind('。'), text.rfind('！'), text.rfind('？'))
+        if cut > 0:
+            text = text[:cut + 1]
+    return text
+
+
+class Corpus:
+    """一份测试语料及其预先计算好的清洗文本和句子列表（不计入计时）"""
+
+    def __init__(self, size_bytes, seed=0):
+        self.size_bytes = size_bytes
+        self.text = generate_corpus(size_bytes, seed)
+        preprocessor = TextPreprocessor(LRUCache(max_entries=0))
+        self.cleaned = preprocessor.clean_text(self.text)
+        self.sentences = list(preprocessor.split_sentences(self.cleaned))
+
+
+def build_stages(preprocessor, rewriter, avoider, client=None):
+    """
+    定义需要测试的各个阶段
+
+    返回:
+    list: [(阶段名, 函数(corpus, rng)), ...]
+    """
+    stages = [
+        ('preprocessor.clean_text', lambda c, rng: preprocessor.clean_text(c.text)),
+        ('preprocessor.split_sentences', lambda c, rng: preprocessor.split_sentences(c.cleaned)),
+        ('preprocessor.segment', lambda c, rng: [preprocessor.segment(s) for s in c.sentences]),
+        ('preprocessor.pos_tagging', lambda c, rng: [preprocessor.pos_tagging(s, 'accurate') for s in c.sentences]),
+        ('preprocessor.pos_tagging_fast', lambda c, rng: [preprocessor.pos_tagging(s, 'fast') for s in c.sentences]),
+        ('rewriter.synonym_replacement', lambda c, rng: [rewriter.synonym_replacement(s, 0.5, rng) for s in c.sentences]),
+        ('rewriter.sentence_restructuring', lambda c, rng: [rewriter.sentence_restructuring(s, rng) for s in c.sentences]),
+        ('rewriter.word_order_adjustment', lambda c, rng: [rewriter.word_order_adjustment(s) for s in c.sentences]),
+        ('rewriter.rewrite_text', lambda c, rng: rewriter.rewrite_text(c.cleaned, rng=rng)),
+        ('avoider.add_human_writing_features', lambda c, rng: avoider.add_human_writing_features(c.cleaned, rng=rng)),
+        ('avoider.diversify_sentence_length', lambda c, rng: avoider.diversify_sentence_length(c.cleaned, rng=rng)),
+        ('avoider.reduce_ai_patterns', lambda c, rng: avoider.reduce_ai_patterns(c.cleaned, rng=rng)),
+        ('avoider.adjust_perplexity', lambda c, rng: avoider.adjust_perplexity(c.cleaned, rng=rng)),
+        ('avoider.avoid_ai_detection', lambda c, rng: avoider.avoid_ai_detection(c.cleaned, rng=rng)),
+    ]
+    if client is not None:
+        def make_process(pos_mode):
+            def process(c, rng):
+                # 每次使用不同的种子，避免命中结果缓存
+                response = client.post('/process', json={'text': c.text, 'seed': rng.getrandbits(32),
+                                                          'pos_mode': pos_mode})
+                if response.status_code != 200:
+                    raise RuntimeError(response.get_json())
+            return process
+        stages.append(('app./process', make_process('accurate')))
+        stages.append(('app./process_fast_pos', make_process('fast')))
+    return stages
+
+
+def percentile(values, q):
+    """最近秩法计算百分位数"""
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def measure(fn, corpus, repeats, max_seconds, seed):
+    """
+    多次运行一个阶段，返回各次耗时和峰值内存
+
+    每次运行前清空分词缓存，测得的是冷缓存下的耗时；峰值内存在额外的一次运行中用
+    tracemalloc 测量，不影响计时。
+    """
+    timings = []
+    started = time.perf_counter()
+    for i in range(repeats):
+        get_shared_cache().clear()
+        rng = random.Random(f"{seed}:{i}")
+        start = time.perf_counter()
+        fn(corpus, rng)
+        timings.append(time.perf_counter() - start)
+        if time.perf_counter() - started > max_seconds:
+            break
+
+    get_shared_cache().clear()
+    tracemalloc.start()
+    fn(corpus, random.Random(seed))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timings, peak
+
+
+def scaling_exponent(points):
+    """
+    对 (规模, 耗时) 做对数最小二乘拟合，返回耗时随规模增长的指数（1表示线性）
+    """
+    points = [(size, seconds) for size, seconds in points if size > 0 and seconds > 0]
+    if len(points) < 2:
+        return None
+    xs = [math.log(size) for size, _ in points]
+    ys = [math.log(seconds) for _, seconds in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    if denominator == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denominator
+
+
+def run_benchmark(sizes, repeats=5, max_seconds=30.0, seed=0, stages=None, include_app=True, log=print):
+    """
+    运行基准测试
+
+    参数:
+    sizes (list): 文档大小列表（字节数）
+    repeats (int): 每个阶段每种大小的最多运行次数
+    max_seconds (float): 每个阶段每种大小的时间预算，超出后不再重复
+    seed (int): 语料和随机数种子
+    stages (list): 只测试名称中包含这些字符串的阶段，可选
+    include_app (bool): 是否测试完整的 /process 请求
+    log (callable): 进度输出函数
+
+    返回:
+    dict: 测试结果，可保存为JSON
+    """
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter()
+    avoider = AIDetectionAvoider()
+    jieba.initialize()
+
+    client = None
+    if include_app:
+        from admission import AdmissionController
+        from app import create_app
+        from resources import Resources
+        # 默认规模包含超过 MAX_REQUEST_CHARS 的1M文档，测试用的应用不限制请求字符数
+        resources = Resources(preprocessor, rewriter, avoider, admission=AdmissionController(max_chars=None))
+        client = create_app(resources).test_client()
+
+    all_stages = build_stages(preprocessor, rewriter, avoider, client)
+    if stages:
+        all_stages = [(name, fn) for name, fn in all_stages if any(s in name for s in stages)]
+
+    results = []
+    for size in sizes:
+        corpus = Corpus(size, seed)
+        chars = len(corpus.text)
+        log(f"语料 {size} 字节（{chars} 字符，{len(corpus.sentences)} 句）")
+        for name, fn in all_stages:
+            timings, peak = measure(fn, corpus, repeats, max_seconds, seed)
+            p50 = percentile(timings, 50)
+            result = {
+                'stage': name,
+                'size_bytes': size,
+                'chars': chars,
+                'runs': len(timings),
+                'latency_ms': {
+                    'min': min(timings) * 1000,
+                    'mean': sum(timings) / len(timings) * 1000,
+                    'p50': p50 * 1000,
+                    'p90': percentile(timings, 90) * 1000,
+                    'p99': percentile(timings, 99) * 1000,
+                },
+                'throughput_chars_per_sec': chars / p50 if p50 > 0 else None,
+                'peak_memory_bytes': peak
+            }
+            results.append(result)
+            log(f"  {name:<36} p50 {p50 * 1000:10.2f} ms  "
+                f"{result['throughput_chars_per_sec'] or 0:14.0f} 字符/秒  峰值内存 {peak / 1024:10.1f} KB")
+
+    scaling = {}
+    for name, _ in all_stages:
+        points = [(r['size_bytes'], r['latency_ms']['p50']) for r in results if r['stage'] == name]
+        exponent = scaling_exponent(points)
+        scaling[name] = {
+            'exponent': exponent,
+            'superlinear': exponent is not None and exponent > SUPERLINEAR_EXPONENT
+        }
+
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'jieba': jieba.__version__,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'sizes': sizes,
+            'repeats': repeats,
+            'seed': seed
+        },
+        'results': results,
+        'scaling': scaling
+    }
+
+
+def compare_with_baseline(report, baseline, threshold=1.2):
+    """
+    与基准结果比较p50耗时
+
+    返回:
+    list: [(阶段名, 大小, 基准p50毫秒, 当前p50毫秒, 比值, 是否退化), ...]
+    """
+    previous = {(r['stage'], r['size_bytes']): r for r in baseline.get('results', [])}
+    rows = []
+    for result in report['results']:
+        old = previous.get((result['stage'], result['size_bytes']))
+        if old is None:
+            continue
+        old_p50 = old['latency_ms']['p50']
+        new_p50 = result['latency_ms']['p50']
+        ratio = new_p50 / old_p50 if old_p50 > 0 else float('inf')
+        rows.append((result['stage'], result['size_bytes'], old_p50, new_p50, ratio, ratio > threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    jieba.setLogLevel(60)
+
+    parser = argparse.ArgumentParser(description='论文降重工具各处理阶段的性能基准测试')
+    parser.add_argument('--sizes', default=','.join(DEFAULT_SIZES),
+                        help='文档大小列表，逗号分隔，如 1K,10K,100K,1M,10M')
+    parser.add_argument('--repeats', type=int, default=5, help='每个阶段每种大小的最多运行次数')
+    parser.add_argument('--max-seconds', type=float, default=30.0, help='每个阶段每种大小的时间预算（秒）')
+    parser.add_argument('--seed', type=int, default=0, help='语料和随机数种子')
+    parser.add_argument('--stages', default='', help='只测试名称中包含这些字符串的阶段，逗号分隔')
+    parser.add_argument('--no-app', action='store_true', help='不测试完整的 /process 请求')
+    parser.add_argument('--output', default=None, help='结果JSON文件路径')
+    parser.add_argument('--baseline', default=None, help='用于比较的基准结果JSON文件')
+    parser.add_argument('--threshold', type=float, default=1.2, help='p50耗时超过基准的该倍数时标记为退化')
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    report = run_benchmark(sizes, repeats=args.repeats, max_seconds=args.max_seconds, seed=args.seed,
+                           stages=stages, include_app=not args.no_app)
+
+    print("\n规模增长指数（1.0为线性）:")
+    for name, item in report['scaling'].items():
+        if item['exponent'] is None:
+            continue
+        flag = '  ← 超线性增长' if item['superlinear'] else ''
+        print(f"  {name:<36} {item['exponent']:.2f}{flag}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\n与基准比较（p50）:")
+        regressions = 0
+        for stage, size, old_p50, new_p50, ratio, regressed in compare_with_baseline(report, baseline, args.threshold):
+            regressions += regressed
+            flag = '  ← 退化' if regressed else ''
+            print(f"  {stage:<36} {size:>10} 字节  {old_p50:10.2f} → {new_p50:10.2f} ms  ×{ratio:.2f}{flag}")
+        if regressions:
+            sys.exit(1)
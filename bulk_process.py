@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import random
+import signal
+import sys
+import time
+from collections import deque
+import jieba
+from text_preprocessor import POS_MODES, TextPreprocessor
+from text_rewriter import TextRewriter
+from ai_detection_avoider import AIDetectionAvoider
+from document_io import SUPPORTED_EXTENSIONS, iter_file_paragraphs
+from http_codec import dumps
+from similarity import SIMILARITY_MODES
+from pipeline import DEFAULT_AVOID_METHODS, DEFAULT_REWRITE_METHODS, BatchProcessor, share_worker_models
+from warmup import warm_up
+
+# 离线批量处理工具：python bulk_process.py 输入目录或.jsonl 输出.jsonl
+# 在所有CPU核上并行处理，定期记录检查点，中断后再次运行同一命令从中断处继续
+
+CHECKPOINT_VERSION = 1
+
+# 每组提交给工作进程的文档数
+DEFAULT_CHUNK_SIZE = 16
+
+
+def iter_directory(path, skip=0):
+    """
+    按相对路径顺序逐篇读取目录（包括子目录）中的 .txt 和 .docx 文件
+
+    参数:
+    path (str): 目录路径
+    skip (int): 跳过前skip个文件（不读取）
+
+    返回:
+    generator: {'id': 相对路径, 'text': 文本}，文件中的段落以换行连接
+    """
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in names:
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                files.append(os.path.relpath(os.path.join(root, name), path))
+    for relative in sorted(files)[skip:]:
+        try:
+            with open(os.path.join(path, relative), 'rb') as f:
+                text = '\n'.join(iter_file_paragraphs(f, relative))
+        except (OSError, ValueError) as e:
+            yield {'id': relative, 'error': f'读取文件失败: {str(e)}'}
+            continue
+        yield {'id': relative, 'text': text}
+
+
+def iter_jsonl(path, skip=0):
+    """
+    逐行读取JSONL文件中的文档
+
+    每行一个JSON对象，包含 text 以及可选的 id、rewrite_methods、avoid_methods、intensity、seed、pos_mode，
+    空行跳过。没有 id 时使用行号（从1开始）。
+
+    参数:
+    path (str): 文件路径
+    skip (int): 跳过前skip篇文档（不解析）
+
+    返回:
+    generator: 文档字典，无法解析的行为 {'id': 行号, 'error': ...}
+    """
+    with open(path, encoding='utf-8-sig') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            if skip:
+                skip -= 1
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield {'id': number, 'error': '不是有效的JSON'}
+                continue
+            if not isinstance(item, dict):
+                yield {'id': number, 'error': '每行应为一个JSON对象'}
+                continue
+            item.setdefault('id', number)
+            yield item
+
+
+def iter_documents(path, skip=0):
+    """
+    按输入类型（目录或 .jsonl 文件）逐篇读取文档
+
+    参数:
+    path (str): 输入路径
+    skip (int): 跳过前skip篇文档，用于从检查点继续
+
+    返回:
+    generator: 文档字典
+
+    异常:
+    ValueError: 输入不是目录也不是 .jsonl 文件
+    """
+    if os.path.isdir(path):
+        return iter_directory(path, skip)
+    if os.path.isfile(path) and path.lower().endswith('.jsonl'):
+        return iter_jsonl(path, skip)
+    raise ValueError(f'输入应为目录或 .jsonl 文件: {path}')
+
+
+def load_checkpoint(path):
+    """
+    读取检查点
+
+    参数:
+    path (str): 检查点文件路径
+
+    返回:
+    dict: 检查点内容，文件不存在时返回None
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    原子地写入检查点：先写临时文件，再替换原文件，中断时不会留下不完整的检查点
+
+    参数:
+    path (str): 检查点文件路径
+    checkpoint (dict): 检查点内容
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def document_seed(seed, index):
+    """
+    由整批的随机种子和文档序号推导每篇文档的随机种子
+
+    文档按输入顺序编号，中断后继续处理时同一篇文档得到与之前相同的种子。
+
+    参数:
+    seed (int): 检查点中记录的整批随机种子
+    index (int): 文档在输入中的序号
+
+    返回:
+    str: 文档的随机种子
+    """
+    return f'{seed}:{index}'
+
+
+class ProgressReporter:
+    """
+    定期输出处理进度和吞吐量（篇/秒、字符/秒）
+    """
+
+    def __init__(self, interval=10.0, completed=0):
+        """
+        参数:
+        interval (float): 输出间隔（秒）
+        completed (int): 之前的运行已完成的文档数
+        """
+        self.interval = interval
+        self.start = self.last = time.monotonic()
+        self.previous = completed
+        self.docs = 0
+        self.chars = 0
+        self.errors = 0
+
+    def add(self, chars, error=False):
+        """记录处理完一篇文档，到了输出间隔时返回True"""
+        self.docs += 1
+        self.chars += chars
+        self.errors += error
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
+
+    def summary(self):
+        """
+        返回进度说明
+
+        返回:
+        str: 包括累计完成数、本次运行的平均吞吐量和出错数
+        """
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        return (f"已完成 {self.previous + self.docs} 篇（本次 {self.docs} 篇，出错 {self.errors} 篇），"
+                f"{self.docs / elapsed:.1f} 篇/秒，{self.chars / elapsed:.0f} 字符/秒，耗时 {elapsed:.1f} 秒")
+
+
+def bulk_process(input_path, output_path, checkpoint_path=None, workers=None, rewrite_methods=None,
+                 avoid_methods=None, intensity=0.5, seed=None, pos_mode=None, similarity=None, restart=False,
+                 chunk_size=DEFAULT_CHUNK_SIZE, report_interval=10.0, checkpoint_interval=10.0):
+    """
+    并行处理目录或JSONL文件中的全部文档，结果按输入顺序写入JSONL文件
+
+    输出每行为 {'id': 文档标识, ...run_pipeline 的结果}，单篇出错时为 {'id': ..., 'error': ...}。
+    检查点记录已按顺序写完的文档数和此时输出文件的长度，再次运行时截掉输出文件中检查点之后的内容，
+    跳过已完成的文档继续处理。每篇文档的随机种子由本次任务的种子和文档序号推导，
+    中断后继续处理的结果与一次处理完全相同。
+
+    参数:
+    input_path (str): 输入目录（读取其中的 .txt 和 .docx 文件）或 .jsonl 文件
+    output_path (str): 输出的 .jsonl 文件
+    checkpoint_path (str): 检查点文件，默认为输出文件名加 .checkpoint
+    workers (int): 工作进程数，默认为CPU核数
+    rewrite_methods, avoid_methods, intensity, pos_mode: 默认的处理参数，JSONL中每篇文档可以单独指定
+    seed (int): 任务的随机种子，默认随机选择并记录在检查点中
+    similarity (str): 'full' 或 'char' 时在每篇的结果中附加各阶段输出与原文的相似度，JSONL中每篇文档可以单独指定
+    restart (bool): 忽略已有的检查点，从头开始
+    chunk_size (int): 每组提交给工作进程的文档数
+    report_interval (float): 输出进度的间隔（秒）
+    checkpoint_interval (float): 写入检查点的间隔（秒）
+
+    返回:
+    dict: 检查点内容（completed 为完成的文档数）
+
+    异常:
+    ValueError: 输入路径不正确，或检查点与本次任务的输入、参数不一致
+    """
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint'
+    options = {
+        'rewrite_methods': rewrite_methods if rewrite_methods is not None else DEFAULT_REWRITE_METHODS,
+        'avoid_methods': avoid_methods if avoid_methods is not None else DEFAULT_AVOID_METHODS,
+        'intensity': intensity,
+        'pos_mode': pos_mode
+    }
+    if similarity is not None:
+        options['similarity'] = similarity
+    checkpoint = None if restart else load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint['input'] != os.path.abspath(input_path):
+            raise ValueError(f'检查点 {checkpoint_path} 属于其他任务，可使用 --restart 从头开始')
+        if checkpoint['options'] != options or (seed is not None and checkpoint['seed'] != seed):
+            raise ValueError(f'处理参数与检查点 {checkpoint_path} 不一致，可使用 --restart 从头开始')
+        if checkpoint['done']:
+            print(f"任务已完成，共 {checkpoint['completed']} 篇: {output_path}")
+            return checkpoint
+        print(f"从检查点继续: 已完成 {checkpoint['completed']} 篇")
+    else:
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'input': os.path.abspath(input_path),
+            'options': options,
+            'seed': seed if seed is not None else random.getrandbits(63),
+            'completed': 0,
+            'offset': 0,
+            'done': False
+        }
+
+    # 已完成的文档直接跳过，不再读取
+    start = checkpoint['completed']
+    documents = iter_documents(input_path, start)
+
+    # 在主进程中加载一次模型，以fork方式创建的工作进程直接继承
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter(preprocessor=preprocessor)
+    warm_up(preprocessor)
+    share_worker_models(preprocessor, rewriter, AIDetectionAvoider(preprocessor=preprocessor, rewriter=rewriter))
+    processor = BatchProcessor(workers=workers)
+
+    # 已按顺序提交、尚未写出结果的文档标识和字符数
+    submitted = deque()
+
+    def pending_documents():
+        for index, item in enumerate(documents, start):
+            text = item.get('text')
+            submitted.append((item.get('id', index), len(text) if isinstance(text, str) else 0, item.get('error')))
+            document = dict(options)
+            document.update((name, value) for name, value in item.items() if name != 'id')
+            if document.get('seed') is None:
+                document['seed'] = document_seed(checkpoint['seed'], index)
+            yield document
+
+    # 截掉上次中断时写入但未记录到检查点中的内容
+    output = open(output_path, 'r+b' if checkpoint['completed'] else 'wb')
+    reporter = ProgressReporter(report_interval, checkpoint['completed'])
+    last_checkpoint = time.monotonic()
+
+    # 已完整写出的文档数和这些结果在输出文件中的结束位置，写完一行后用一次赋值同时更新：
+    # 信号在写入和计数之间到达时，检查点不会记录写了但未计数的结果，继续时不会重复输出
+    committed = (checkpoint['completed'], checkpoint['offset'])
+
+    def commit():
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint['completed'], checkpoint['offset'] = committed
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    try:
+        output.truncate(checkpoint['offset'])
+        output.seek(checkpoint['offset'])
+        for result in processor.imap(pending_documents(), chunk_size=chunk_size):
+            doc_id, chars, read_error = submitted.popleft()
+            if read_error is not None:
+                result = {'error': read_error}
+            line = dumps(dict({'id': doc_id}, **result)) + b'\n'
+            output.write(line)
+            committed = (committed[0] + 1, committed[1] + len(line))
+            if reporter.add(chars, 'error' in result):
+                print(reporter.summary())
+            if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                commit()
+                last_checkpoint = time.monotonic()
+        checkpoint['done'] = True
+    except KeyboardInterrupt:
+        print(f"已中断，再次运行同一命令可从第 {committed[0] + 1} 篇继续")
+        raise
+    finally:
+        commit()
+        output.close()
+        processor.shutdown()
+
+    print(reporter.summary())
+    print(f"结果已保存到: {output_path}")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    jieba.setLogLevel(60)
+
+    parser = argparse.ArgumentParser(description='离线批量处理工具：并行处理目录或JSONL文件中的文档，支持中断后继续')
+    parser.add_argument('input', help='输入目录（其中的 .txt 和 .docx 文件）或 .jsonl 文件（每行一个含 text 的JSON对象）')
+    parser.add_argument('output', help='输出的 .jsonl 文件')
+    parser.add_argument('--checkpoint', default=None, help='检查点文件，默认为输出文件名加 .checkpoint')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认为CPU核数')
+    parser.add_argument('--rewrite-methods', default=','.join(DEFAULT_REWRITE_METHODS), help='改写方法，逗号分隔')
+    parser.add_argument('--avoid-methods', default=','.join(DEFAULT_AVOID_METHODS), help='AI检测规避方法，逗号分隔')
+    parser.add_argument('--intensity', type=float, default=0.5, help='处理强度（0-1）')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，指定后结果可复现')
+    parser.add_argument('--pos-mode', choices=POS_MODES, default=None, help='词性标注模式')
+    parser.add_argument('--similarity', choices=SIMILARITY_MODES, default=None,
+                        help='在结果中附加各阶段输出与原文的相似度：full 为字符和词语相似度，char 只计算字符相似度')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每组提交给工作进程的文档数')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='输出进度的间隔（秒）')
+    parser.add_argument('--checkpoint-interval', type=float, default=10.0, help='写入检查点的间隔（秒）')
+    parser.add_argument('--restart', action='store_true', help='忽略已有的检查点，从头开始')
+    args = parser.parse_args()
+
+    def terminate(signum, frame):
+        # 收到SIGTERM（如任务被调度系统停止）时与Ctrl+C一样写入检查点后退出
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+
+    try:
+        bulk_process(args.input, args.output, checkpoint_path=args.checkpoint, workers=args.workers,
+                     rewrite_methods=[m for m in args.rewrite_methods.split(',') if m],
+                     avoid_methods=[m for m in args.avoid_methods.split(',') if m],
+                     intensity=args.intensity, seed=args.seed, pos_mode=args.pos_mode, similarity=args.similarity,
+                     restart=args.restart, chunk_size=args.chunk_size, report_interval=args.report_interval,
+                     checkpoint_interval=args.checkpoint_interval)
+    except ValueError as e:
+        print(f"错误: {str(e)}")
+        sys.exit(2)
+    except KeyboardInterrupt:
+        sys.exit(130)
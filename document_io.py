@@ -0,0 +1,247 @@
+import codecs
+import os
+import re
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+from pipeline import stream_paragraphs
+
+# 支持上传和处理的文件类型
+SUPPORTED_EXTENSIONS = ('.txt', '.docx')
+
+# 逐块读取文本文件的块大小（字节）和单个段落的最大长度（字符），
+# 超长的段落在句末标点处切开，保证内存占用与文件大小无关
+READ_CHUNK_SIZE = 64 * 1024
+MAX_PARAGRAPH_CHARS = 64 * 1024
+
+_SENTENCE_END = re.compile(r'.*[。！？?!]', re.S)
+
+# docx 正文（word/document.xml）中用到的元素
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_BODY = _W + 'body'
+_W_P = _W + 'p'
+_W_T = _W + 't'
+_W_TAB = _W + 'tab'
+_W_BR = _W + 'br'
+_W_CR = _W + 'cr'
+
+
+def detect_encoding(sample):
+    """
+    根据文件开头的内容判断文本文件的编码
+
+    参数:
+    sample (bytes): 文件开头的字节
+
+    返回:
+    str: 'utf-16'（有UTF-16字节序标记时）、'utf-8-sig' 或 'gb18030'
+    """
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # 末尾可能截断了一个多字节字符，不作为错误
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'gb18030'
+
+
+def detect_stream_encoding(stream, chunk_size=READ_CHUNK_SIZE):
+    """
+    读取整个文件判断文本文件的编码，读完后回到原来的位置
+
+    只看开头一块时，开头全是ASCII字符的GB18030文件会被当作UTF-8，后面的中文无法正确解码；
+    这里先按UTF-8完整解码一遍，出错时再验证GB18030。
+
+    参数:
+    stream: 以二进制方式打开的可随机访问的文件对象
+    chunk_size (int): 每次读取的字节数
+
+    返回:
+    str: 'utf-16'（有UTF-16字节序标记时）、'utf-8-sig' 或 'gb18030'
+
+    异常:
+    ValueError: 文件既不是有效的UTF-8也不是有效的GB18030编码
+    """
+    start = stream.tell()
+    try:
+        if stream.read(2) in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+            return 'utf-16'
+        for encoding in ('utf-8-sig', 'gb18030'):
+            stream.seek(start)
+            decoder = codecs.getincrementaldecoder(encoding)()
+            try:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    decoder.decode(chunk, final=not chunk)
+                    if not chunk:
+                        return encoding
+            except UnicodeDecodeError:
+                continue
+        raise ValueError('无法识别文本文件的编码，请保存为UTF-8或GB18030编码后上传')
+    finally:
+        stream.seek(start)
+
+
+def _split_long(buffer, max_chars):
+    """在最后一个句末标点后切开超长的段落，没有句末标点时直接按长度切开"""
+    match = _SENTENCE_END.match(buffer, 0, max_chars)
+    cut = match.end() if match else max_chars
+    return buffer[:cut], buffer[cut:]
+
+
+def iter_txt_paragraphs(stream, encoding=None, chunk_size=READ_CHUNK_SIZE, max_chars=MAX_PARAGRAPH_CHARS,
+                        errors=None):
+    """
+    逐块读取文本文件并产生段落（每行一段）
+
+    参数:
+    stream: 以二进制方式打开的文件对象
+    encoding (str): 文件编码，默认根据第一块内容自动判断
+    chunk_size (int): 每次读取的字节数
+    max_chars (int): 单个段落的最大长度，超出时在句末标点处切开
+    errors (str): 解码错误的处理方式，默认自动判断编码时为 'strict'，指定编码时为 'replace'（替换为U+FFFD）
+
+    返回:
+    generator: 去除首尾空白后的非空段落
+
+    异常:
+    ValueError: errors 为 'strict' 时文件中有无法按该编码解码的内容
+    """
+    if errors is None:
+        errors = 'replace' if encoding else 'strict'
+    decoder = None
+    buffer = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if decoder is None:
+            encoding = encoding or detect_encoding(chunk)
+            decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        try:
+            buffer += decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError:
+            raise ValueError(f'文件中有无法按 {encoding} 编码解码的内容，请保存为UTF-8编码后上传')
+
+        lines = buffer.split('\n')
+        buffer = lines.pop()
+        for line in lines:
+            while len(line) > max_chars:
+                paragraph, line = _split_long(line, max_chars)
+                if paragraph.strip():
+                    yield paragraph.strip()
+            if line.strip():
+                yield line.strip()
+        while len(buffer) > max_chars:
+            paragraph, buffer = _split_long(buffer, max_chars)
+            if paragraph.strip():
+                yield paragraph.strip()
+
+        if not chunk:
+            break
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _docx_paragraphs(document_xml):
+    """逐个解析 w:p 元素，解析过的元素立即释放"""
+    with document_xml:
+        stack = []
+        for event, elem in ElementTree.iterparse(document_xml, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+            stack.pop()
+            if elem.tag == _W_P:
+                parts = []
+                for node in elem.iter():
+                    if node.tag == _W_T:
+                        parts.append(node.text or '')
+                    elif node.tag == _W_TAB:
+                        parts.append('\t')
+                    elif node.tag in (_W_BR, _W_CR):
+                        parts.append('\n')
+                for line in ''.join(parts).split('\n'):
+                    if line.strip():
+                        yield line.strip()
+                elem.clear()
+            # 正文下已处理完的段落、表格等从树中移除，避免整篇文档留在内存中
+            if stack and stack[-1].tag == _W_BODY:
+                stack[-1].remove(elem)
+
+
+def iter_docx_paragraphs(fileobj):
+    """
+    流式解析 .docx 文件并产生段落（表格中的段落按顺序包含在内）
+
+    参数:
+    fileobj: 以二进制方式打开的可随机访问的文件对象或文件路径
+
+    返回:
+    generator: 去除首尾空白后的非空段落
+
+    异常:
+    ValueError: 不是有效的 .docx 文件
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+        document_xml = archive.open('word/document.xml')
+    except (zipfile.BadZipFile, KeyError):
+        raise ValueError('不是有效的 .docx 文件')
+    return _docx_paragraphs(document_xml)
+
+
+def iter_file_paragraphs(fileobj, filename):
+    """
+    按文件扩展名选择读取方式，逐段产生文件中的段落
+
+    参数:
+    fileobj: 以二进制方式打开的文件对象
+    filename (str): 文件名，用于判断文件类型
+
+    返回:
+    generator: 段落
+
+    异常:
+    ValueError: 不支持的文件类型、文件格式不正确或文本文件的编码无法识别
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.txt':
+        # 可随机访问的文件（上传的文件和本地文件）先完整检查一遍编码，编码无法识别时在开始处理之前就报错
+        seekable = getattr(fileobj, 'seekable', None)
+        if seekable is not None and seekable():
+            return iter_txt_paragraphs(fileobj, detect_stream_encoding(fileobj), errors='strict')
+        return iter_txt_paragraphs(fileobj)
+    if extension == '.docx':
+        return iter_docx_paragraphs(fileobj)
+    raise ValueError(f'仅支持 {" 和 ".join(SUPPORTED_EXTENSIONS)} 文件')
+
+
+def process_file(input_path, output_path, preprocessor, rewriter, avoider, **options):
+    """
+    逐段处理 .txt 或 .docx 文件，最终文本逐段写入UTF-8文本文件
+
+    输出先写入同目录下的临时文件，处理完成后再替换目标文件。
+
+    参数:
+    input_path (str): 输入文件路径
+    output_path (str): 输出文件路径
+    preprocessor, rewriter, avoider: 处理器
+    options: 传给 stream_paragraphs 的处理参数（rewrite_methods、avoid_methods、intensity、seed、cancel）
+
+    返回:
+    int: 处理的段落数
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    count = 0
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as output, open(input_path, 'rb') as source:
+            paragraphs = iter_file_paragraphs(source, input_path)
+            for result in stream_paragraphs(paragraphs, preprocessor, rewriter, avoider, **options):
+                output.write(('\n' if count else '') + result['final_text'])
+                count += 1
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return count
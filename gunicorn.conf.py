@@ -0,0 +1,32 @@
+import logging
+import os
+from resources import get_resources, process_limits
+
+# 多进程部署配置：gunicorn -c gunicorn.conf.py app:app
+# 主进程在fork之前加载一次模型（jieba词典、同义词词典、模板），各工作进程直接继承，
+# 启动只需几毫秒，模型占用的内存页在进程间写时复制共享
+# ASGI服务可使用 gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:application
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_WORKERS', 0)) or os.cpu_count() or 1
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+
+# 准入控制和批量处理进程池是每个工作进程各一份，写入实际的进程数后，
+# 未单独配置的容量按进程数均分（见 resources.worker_share），整台服务器合计不超过CPU核数
+os.environ['WEB_WORKERS'] = str(workers)
+
+# 每个线程处理一个请求：线程数要容纳正在处理和排队的请求再多一个，
+# 队列已满、排队超时的请求才会由准入控制返回429/503，而不是在gunicorn的连接队列中等待
+_limits = process_limits()
+threads = int(os.environ.get('WEB_THREADS', 0)) or _limits['max_concurrent'] + _limits['max_queue'] + 1
+
+# 在主进程中导入应用（即加载模型），而不是在每个工作进程中各自导入
+preload_app = True
+
+# 输出应用模块的日志（如模型加载耗时）
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(process)d] [%(levelname)s] %(name)s: %(message)s')
+
+
+def post_fork(server, worker):
+    """工作进程fork完成后重新启动不会被继承的后台线程"""
+    get_resources().after_fork()
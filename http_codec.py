@@ -0,0 +1,330 @@
+import gzip
+import json
+import tempfile
+import zlib
+
+# orjson 和 brotli 是可选依赖：安装后分别用于JSON序列化和 br 压缩，未安装时使用标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 响应体小于该字节数时不压缩
+MIN_COMPRESS_BYTES = 1024
+
+# 可以压缩的响应类型
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# fields 参数可以选择的字段：处理结果中可能出现的全部字段
+RESULT_FIELDS = ('original_text', 'cleaned_text', 'rewritten_text', 'final_text', 'stages', 'recomputed', 'seed',
+                 'similarity', 'profile_id', 'profile_url', 'index', 'error')
+
+
+class UnsupportedEncoding(ValueError):
+    """请求体使用了不支持的压缩格式（HTTP 415）"""
+
+
+def dumps(data):
+    """
+    把数据序列化为UTF-8编码的JSON，中文等非ASCII字符不转义为 \\uXXXX
+
+    安装了 orjson 时使用 orjson，速度是标准库的数倍；orjson 不支持的数据（如超过64位的整数）回退到标准库。
+
+    参数:
+    data: 可JSON序列化的数据
+
+    返回:
+    bytes: JSON
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(body):
+    """
+    解析JSON
+
+    参数:
+    body (bytes or str): JSON
+
+    返回:
+    解析后的数据
+
+    异常:
+    ValueError: 不是有效的JSON
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def supported_encodings():
+    """
+    返回支持的压缩格式，按优先顺序排列
+
+    返回:
+    tuple: 如 ('br', 'gzip')
+    """
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    根据 Accept-Encoding 请求头选择响应的压缩格式
+
+    客户端给出的q值最高的格式优先，q值相同时 br 优先于 gzip；q=0 表示不接受。
+
+    参数:
+    accept_encoding (str): Accept-Encoding 请求头
+
+    返回:
+    str: 'br'、'gzip'，不压缩时返回None
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(content_type):
+    """响应类型是否值得压缩（JSON、NDJSON和文本）"""
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body, encoding):
+    """
+    压缩响应体
+
+    参数:
+    body (bytes): 响应体
+    encoding (str): 'br' 或 'gzip'
+
+    返回:
+    bytes: 压缩后的内容
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """
+    流式响应的压缩器：每块内容压缩后立即刷新，客户端可以随时解压出已收到的内容
+    """
+
+    def __init__(self, encoding):
+        """
+        参数:
+        encoding (str): 'br' 或 'gzip'
+        """
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        """
+        压缩一块内容并刷新
+
+        参数:
+        chunk (str or bytes): 内容
+
+        返回:
+        bytes: 压缩后的内容
+        """
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """结束压缩流，返回最后的内容"""
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """
+    逐块压缩流式响应
+
+    参数:
+    chunks (iterable): 原始内容片段（str 或 bytes）
+    encoding (str): 'br' 或 'gzip'
+
+    返回:
+    generator: 压缩后的内容片段
+    """
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        # 提前结束（如客户端断开连接）时关闭原始的生成器，执行其中的清理代码
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def iter_decompress(chunks, encoding, max_bytes):
+    """
+    逐块解压请求体，解压后累计超过 max_bytes 时停止（防止压缩炸弹）
+
+    br 压缩的请求体不支持：brotli 的 Decompressor.process 没有输出上限，很小的输入就能一次解压出
+    任意大的数据，在检查 max_bytes 之前就耗尽内存。响应仍然可以使用 br 压缩。
+
+    参数:
+    chunks (iterable): 压缩的内容片段（bytes）
+    encoding (str): Content-Encoding 请求头，支持 gzip 和 deflate
+    max_bytes (int): 解压后的最大字节数
+
+    返回:
+    generator: 解压后的内容片段
+
+    异常:
+    UnsupportedEncoding: 不支持的压缩格式
+    ValueError: 压缩数据损坏或不完整
+    OverflowError: 解压后超过 max_bytes
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding not in ('gzip', 'x-gzip', 'deflate'):
+        raise UnsupportedEncoding(f'不支持的请求体压缩格式: {encoding}')
+    # gzip 带有gzip头，deflate 按 zlib 格式处理
+    decompressor = zlib.decompressobj(15 if encoding == 'deflate' else 31)
+
+    size = 0
+    for chunk in chunks:
+        # 每次只解压一小块输入，单次解压的输出有上限
+        for i in range(0, len(chunk), 4096):
+            try:
+                data = decompressor.decompress(chunk[i:i + 4096])
+            except zlib.error:
+                raise ValueError(f'{encoding} 压缩数据损坏')
+            size += len(data)
+            if size > max_bytes:
+                raise OverflowError(f'解压后的请求体超过 {max_bytes} 字节')
+            if data:
+                yield data
+    if not decompressor.eof:
+        raise ValueError(f'{encoding} 压缩数据不完整')
+
+
+def decompress(body, encoding, max_bytes):
+    """
+    解压请求体
+
+    参数:
+    body (bytes): 请求体
+    encoding (str): Content-Encoding 请求头，为空或 identity 时原样返回
+    max_bytes (int): 解压后的最大字节数
+
+    返回:
+    bytes: 解压后的请求体
+
+    异常:
+    同 iter_decompress
+    """
+    if (encoding or '').strip().lower() in ('', 'identity'):
+        return body
+    return b''.join(iter_decompress((body,), encoding, max_bytes))
+
+
+def decompress_file(fileobj, encoding, max_bytes):
+    """
+    把压缩的请求体解压到临时文件（较小时保存在内存中），用于上传的大文件
+
+    参数:
+    fileobj: 压缩的请求体（文件对象）
+    encoding (str): Content-Encoding 请求头
+    max_bytes (int): 解压后的最大字节数
+
+    返回:
+    tuple: (临时文件对象，已定位到开头, 解压后的字节数)
+
+    异常:
+    同 iter_decompress
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    size = 0
+    try:
+        for data in iter_decompress(iter(lambda: fileobj.read(64 * 1024), b''), encoding, max_bytes):
+            output.write(data)
+            size += len(data)
+    except BaseException:
+        output.close()
+        raise
+    output.seek(0)
+    return output, size
+
+
+def select_fields(result, fields):
+    """
+    只保留客户端需要的字段，错误信息总是保留
+
+    参数:
+    result (dict): 处理结果
+    fields (tuple): 需要的字段名，None 表示全部
+
+    返回:
+    dict: 选出的字段
+    """
+    if fields is None or not isinstance(result, dict):
+        return result
+    return {name: value for name, value in result.items() if name in fields or name == 'error'}
+
+
+def parse_fields(value):
+    """
+    解析请求中的 fields 参数
+
+    参数:
+    value (list or str): 字段名列表或以逗号分隔的字符串，None 表示返回全部字段
+
+    返回:
+    tuple: 字段名，None 表示全部
+
+    异常:
+    ValueError: 格式不正确，或包含 RESULT_FIELDS 以外的字段名
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [name.strip() for name in value.split(',') if name.strip()]
+    if not isinstance(value, list) or not value or not all(isinstance(name, str) for name in value):
+        raise ValueError('fields 应为非空的字段名列表')
+    unknown = [name for name in value if name not in RESULT_FIELDS]
+    if unknown:
+        raise ValueError(f'未知的字段: {"、".join(unknown)}，可选: {"、".join(RESULT_FIELDS)}')
+    return tuple(value)
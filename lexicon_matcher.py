@@ -0,0 +1,119 @@
+from collections import deque
+
+
+class LexiconMatcher:
+    """
+    基于Aho-Corasick自动机的多模式匹配器
+
+    构建一次后，只需对文本扫描一遍即可找出所有词条的全部出现位置，
+    扫描耗时与词条数量无关。
+    """
+
+    def __init__(self, phrases=None, ignore_case=False):
+        """
+        初始化匹配器
+
+        参数:
+        phrases (iterable): 初始词条，可选
+        ignore_case (bool): 是否忽略大小写
+        """
+        self.ignore_case = ignore_case
+        self._goto = [{}]
+        self._fail = [0]
+        # _own 为 add() 添加到各状态的词条，_out 为 build() 合并失败链后的全部输出，每次构建都从 _own 重新计算
+        self._own = [[]]
+        self._out = [[]]
+        self._built = False
+        self._size = 0
+        if phrases:
+            for phrase in phrases:
+                self.add(phrase)
+
+    def add(self, phrase, value=None):
+        """
+        添加词条
+
+        参数:
+        phrase (str): 词条
+        value: 匹配时返回的值，默认为词条本身；同一词条可以添加多个值
+        """
+        if not phrase:
+            return
+        if value is None:
+            value = phrase
+        if self.ignore_case:
+            phrase = phrase.lower()
+        state = 0
+        for ch in phrase:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            state = nxt
+        self._own[state].append((len(phrase), value))
+        self._size += 1
+        self._built = False
+
+    def build(self):
+        """计算失败指针（添加词条后首次匹配时会自动调用）"""
+        goto, fail = self._goto, self._fail
+        out = [list(own) for own in self._own]
+        queue = deque()
+        for state in goto[0].values():
+            fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self._out = out
+        self._built = True
+
+    def finditer(self, text):
+        """
+        扫描文本，按结束位置顺序产生全部匹配（包括相互重叠的匹配）
+
+        参数:
+        text (str): 输入文本
+
+        返回:
+        generator: 每个元素为 (start, end, value)
+        """
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        ignore_case = self.ignore_case
+        state = 0
+        for i, ch in enumerate(text):
+            if ignore_case:
+                lowered = ch.lower()
+                if len(lowered) == 1:
+                    ch = lowered
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                for length, value in out[state]:
+                    yield end - length, end, value
+
+    def findall(self, text):
+        """返回按起始位置排序的全部匹配列表"""
+        return sorted(self.finditer(text), key=lambda match: (match[0], match[1]))
+
+    def search(self, text):
+        """文本中是否出现任一词条"""
+        for _ in self.finditer(text):
+            return True
+        return False
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,147 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# 表示缓存未命中的哨兵对象
+MISSING = object()
+
+
+def estimate_size(value):
+    """
+    粗略估计缓存值占用的内存字节数（支持字符串及其嵌套的元组、列表和字典）
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        for item in value:
+            size += estimate_size(item)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    return size
+
+
+class LRUCache:
+    """
+    线程安全的LRU缓存，同时按条目数和字节数限制容量，可选过期时间，
+    并统计命中、未命中和淘汰次数
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=None):
+        """
+        初始化缓存
+
+        参数:
+        max_entries (int): 最大条目数，为0时不缓存
+        max_bytes (int): 最大字节数（按 estimate_size 估算）
+        ttl (float): 条目的有效期（秒），为None时不过期
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        """
+        读取缓存
+
+        参数:
+        key: 缓存键
+        default: 未命中时的返回值
+
+        返回:
+        缓存值，未命中或已过期时返回default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self._bytes -= size
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+
+        参数:
+        key: 缓存键
+        value: 缓存值，应为不可变对象或调用方不再修改的对象
+        """
+        if self.max_entries <= 0:
+            return
+
+        size = estimate_size(key) + estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        读取缓存，未命中时调用compute计算并写入缓存
+
+        缓存值应为不可变对象（如元组），调用方修改返回值不会影响缓存内容。
+
+        参数:
+        key: 缓存键
+        compute (callable): 无参函数，返回要缓存的值
+
+        返回:
+        缓存值
+        """
+        value = self.get(key)
+        if value is MISSING:
+            # 在锁外计算，避免分词阻塞其他线程
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        """清空缓存（不重置统计）"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        返回缓存统计信息
+
+        返回:
+        dict: 包含entries、bytes、hits、misses、evictions和hit_rate
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,239 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+# 耗时直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 相似度直方图的桶上界
+SIMILARITY_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+METRIC_PREFIX = 'paper_rewriter'
+
+
+class Histogram:
+    """
+    固定分桶的直方图，记录每个桶的计数、总和与总次数
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """按Prometheus格式返回 [(上界, 累计计数), ...]，最后一项上界为 +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    items = ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for key, value in labels)
+    return '{' + items + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表
+
+    记录各处理阶段的耗时直方图（_count 即调用次数）和输入字符总数、各接口的请求耗时、排队时间、
+    被拒绝的请求数和正在处理的请求数、最终文本与原文的相似度分布，
+    以及通过 add_collector 注册的其他指标（如队列深度、缓存命中数）。
+    每次记录只做一次加锁的计数更新，开销很小，可以在生产环境中一直开启。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stage_durations = {}
+        self._stage_chars = {}
+        self._request_durations = {}
+        self._queue_waits = {}
+        self._rejected = {}
+        self._in_flight = {}
+        self._similarities = {}
+        self._collectors = []
+
+    def observe_stage(self, stage, seconds, chars=0):
+        """记录一次阶段调用"""
+        with self._lock:
+            histogram = self._stage_durations.get(stage)
+            if histogram is None:
+                histogram = self._stage_durations[stage] = Histogram()
+                self._stage_chars[stage] = 0
+            histogram.observe(seconds)
+            self._stage_chars[stage] += chars
+
+    def request_started(self, endpoint):
+        """记录一个请求开始处理"""
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 0) + 1
+
+    def request_finished(self, endpoint, seconds=None):
+        """记录一个请求处理结束，seconds 为None（如请求被拒绝）时不计入请求耗时"""
+        with self._lock:
+            self._in_flight[endpoint] = self._in_flight.get(endpoint, 1) - 1
+            if seconds is None:
+                return
+            histogram = self._request_durations.get(endpoint)
+            if histogram is None:
+                histogram = self._request_durations[endpoint] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_queue_wait(self, endpoint, seconds):
+        """记录一个请求被接纳前的排队时间"""
+        with self._lock:
+            histogram = self._queue_waits.get(endpoint)
+            if histogram is None:
+                histogram = self._queue_waits[endpoint] = Histogram()
+            histogram.observe(seconds)
+
+    def request_rejected(self, endpoint, reason):
+        """记录一个被准入控制拒绝的请求"""
+        with self._lock:
+            key = (endpoint, reason)
+            self._rejected[key] = self._rejected.get(key, 0) + 1
+
+    def observe_similarity(self, measure, value):
+        """记录一次最终文本与原文的相似度，measure 为 'char' 或 'token'"""
+        with self._lock:
+            histogram = self._similarities.get(measure)
+            if histogram is None:
+                histogram = self._similarities[measure] = Histogram(SIMILARITY_BUCKETS)
+            histogram.observe(value)
+
+    def add_collector(self, collector):
+        """
+        注册额外的指标来源
+
+        参数:
+        collector (callable): 无参函数，返回 [(指标名, 类型, 说明, [(标签元组, 值), ...]), ...]，
+                              指标名不含前缀，标签元组形如 (('queue', 'batch'),)
+        """
+        self._collectors.append(collector)
+
+    def stage_snapshot(self):
+        """
+        返回各阶段的统计快照
+
+        返回:
+        dict: {阶段名: {'calls', 'seconds', 'chars'}}
+        """
+        with self._lock:
+            return {stage: {'calls': histogram.count, 'seconds': histogram.sum, 'chars': self._stage_chars[stage]}
+                    for stage, histogram in self._stage_durations.items()}
+
+    def render(self):
+        """
+        以Prometheus文本格式输出全部指标
+
+        返回:
+        str: 指标文本
+        """
+        lines = []
+
+        def histogram_lines(name, help_text, label_name, histograms):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} histogram')
+            for key, histogram in sorted(histograms.items()):
+                for bound, count in histogram.cumulative():
+                    labels = _format_labels(((label_name, key), ('le', _format_value(float(bound)))))
+                    lines.append(f'{METRIC_PREFIX}_{name}_bucket{labels} {count}')
+                labels = _format_labels(((label_name, key),))
+                lines.append(f'{METRIC_PREFIX}_{name}_sum{labels} {_format_value(histogram.sum)}')
+                lines.append(f'{METRIC_PREFIX}_{name}_count{labels} {histogram.count}')
+
+        def simple_lines(name, metric_type, help_text, samples):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {metric_type}')
+            for labels, value in samples:
+                lines.append(f'{METRIC_PREFIX}_{name}{_format_labels(labels)} {_format_value(value)}')
+
+        with self._lock:
+            histogram_lines('stage_duration_seconds', '各处理阶段的耗时（_count 为调用次数）',
+                            'stage', self._stage_durations)
+            simple_lines('stage_input_chars_total', 'counter', '各处理阶段累计处理的输入字符数',
+                         [((('stage', stage),), chars) for stage, chars in sorted(self._stage_chars.items())])
+            histogram_lines('request_duration_seconds', '各接口的请求处理耗时（不含排队时间和被拒绝的请求）',
+                            'endpoint', self._request_durations)
+            histogram_lines('queue_wait_seconds', '各接口的请求被接纳前的排队时间',
+                            'endpoint', self._queue_waits)
+            simple_lines('requests_rejected_total', 'counter', '被准入控制拒绝的请求数',
+                         [((('endpoint', endpoint), ('reason', reason)), count)
+                          for (endpoint, reason), count in sorted(self._rejected.items())])
+            histogram_lines('final_text_similarity', '最终文本与原文的相似度（MinHash估计的Jaccard相似度）',
+                            'measure', self._similarities)
+            simple_lines('requests_in_flight', 'gauge', '正在处理的请求数',
+                         [((('endpoint', endpoint),), count) for endpoint, count in sorted(self._in_flight.items())])
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            for name, metric_type, help_text, samples in collector():
+                simple_lines(name, metric_type, help_text, samples)
+
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标注册表，可通过环境变量 METRICS_ENABLED=0 关闭
+METRICS = MetricsRegistry(enabled=os.environ.get('METRICS_ENABLED', '1') != '0')
+
+
+def count_chars(target):
+    """计算阶段输入的字符数，支持字符串、句子和文档对象"""
+    if isinstance(target, str):
+        return len(target)
+    sentences = getattr(target, 'sentences', None)
+    if callable(sentences):
+        return sum(len(sentence) for sentence in sentences())
+    try:
+        return len(target)
+    except TypeError:
+        return 0
+
+
+def instrumented(stage):
+    """
+    装饰处理阶段的方法，记录耗时、调用次数和输入字符数
+
+    被装饰方法的第一个参数（self之后）视为该阶段的输入。
+
+    参数:
+    stage (str): 阶段名，如 'rewriter.synonym_replacement'
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, target, *args, **kwargs):
+            if not METRICS.enabled:
+                return func(self, target, *args, **kwargs)
+            chars = count_chars(target)
+            start = time.perf_counter()
+            try:
+                return func(self, target, *args, **kwargs)
+            finally:
+                METRICS.observe_stage(stage, time.perf_counter() - start, chars)
+        return wrapper
+    return decorator
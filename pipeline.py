@@ -0,0 +1,643 @@
+import functools
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from text_preprocessor import DEFAULT_POS_MODE, POS_MODES, TextPreprocessor, make_rng
+from text_rewriter import TextRewriter
+from ai_detection_avoider import AIDetectionAvoider
+from warmup import warm_up
+from result_cache import make_cache_key
+from scheduler import FULL, PipelineCancelled, StageScheduler, check_cancelled, merge_reports, stage_names
+from similarity import parse_similarity, with_similarity
+
+DEFAULT_REWRITE_METHODS = ['synonym', 'restructure', 'word_order']
+DEFAULT_AVOID_METHODS = ['human_features', 'sentence_diversity', 'reduce_patterns', 'adjust_perplexity']
+
+# 等待进程池结果时检查取消标志的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.1
+
+
+def parse_options(data, received=None):
+    """
+    从请求数据中读取处理参数
+
+    参数:
+    data (dict): 请求数据
+    received (float): 收到请求的时间（time.monotonic() 的值），默认为当前时间；
+                      批量请求在工作进程中解析参数时传入，排队等待的时间同样计入 deadline_ms
+
+    返回:
+    dict: run_pipeline 的关键字参数（rewrite_methods、avoid_methods、intensity、seed、pos_mode、deadline）；
+          请求中的 deadline_ms（毫秒）在此换算为截止时间，即从收到请求时开始计时
+
+    异常:
+    ValueError: 参数格式不正确
+    """
+    seed = data.get('seed')
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, (int, str))):
+        raise ValueError('seed 必须是整数或字符串')
+    # 未指定时使用默认模式，缓存键中记录的是实际使用的模式
+    pos_mode = data.get('pos_mode') or DEFAULT_POS_MODE
+    if pos_mode not in POS_MODES:
+        raise ValueError(f'pos_mode 只能是 {" 或 ".join(POS_MODES)}')
+    intensity = data.get('intensity', 0.5)
+    try:
+        if isinstance(intensity, bool):
+            raise TypeError
+        intensity = float(intensity)
+    except (TypeError, ValueError):
+        raise ValueError('intensity 必须是数字')
+    # 取反比较，NaN 同样被拒绝
+    if not 0 <= intensity <= 1:
+        raise ValueError('intensity 必须在0到1之间')
+    deadline = None
+    if data.get('deadline_ms') is not None:
+        deadline_ms = data['deadline_ms']
+        if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0:
+            raise ValueError('deadline_ms 必须是正数')
+        deadline = (received if received is not None else time.monotonic()) + deadline_ms / 1000
+    return {
+        'rewrite_methods': data.get('rewrite_methods', DEFAULT_REWRITE_METHODS),
+        'avoid_methods': data.get('avoid_methods', DEFAULT_AVOID_METHODS),
+        'intensity': intensity,
+        'seed': seed,
+        'pos_mode': pos_mode,
+        'deadline': deadline
+    }
+
+
+def cache_options(options):
+    """
+    返回计算缓存键时使用的处理参数：截止时间不影响完整处理的结果，不计入缓存键
+
+    参数:
+    options (dict): parse_options 返回的处理参数
+
+    返回:
+    dict: 去掉 deadline 的处理参数
+    """
+    return {name: value for name, value in options.items() if name != 'deadline'}
+
+
+def is_complete(result):
+    """
+    处理结果是否完整（没有因截止时间跳过或中断任何阶段），只有完整的结果可以缓存
+
+    参数:
+    result (dict): run_pipeline 等返回的结果
+
+    返回:
+    bool: 是否完整
+    """
+    return all(status == FULL for status in result.get('stages', {}).values())
+
+
+def cacheable_result(result):
+    """
+    返回可以写入缓存的结果：不完整的结果不缓存（返回None），完整结果去掉只与本次请求有关的 stages
+
+    参数:
+    result (dict): 处理结果
+
+    返回:
+    dict: 写入缓存的结果，不可缓存时返回None
+    """
+    if 'stages' not in result:
+        return result
+    if not is_complete(result):
+        return None
+    return {name: value for name, value in result.items() if name != 'stages'}
+
+
+def full_report(options):
+    """
+    返回全部阶段都完整执行时的 stages，用于设置了截止时间、但结果直接来自缓存的请求
+
+    参数:
+    options (dict): 处理参数
+
+    返回:
+    dict: {阶段名: 'full'}
+    """
+    rewrite_methods = options.get('rewrite_methods')
+    avoid_methods = options.get('avoid_methods')
+    stages = stage_names(rewrite_methods if rewrite_methods is not None else DEFAULT_REWRITE_METHODS,
+                         avoid_methods if avoid_methods is not None else DEFAULT_AVOID_METHODS)
+    return {stage: FULL for stage in stages}
+
+
+def run_pipeline(text, preprocessor, rewriter, avoider, rewrite_methods=None, avoid_methods=None, intensity=0.5,
+                 seed=None, rng=None, pos_mode=None, deadline=None, cancel=None, plan=None, costs=None):
+    """
+    依次执行预处理 → 改写 → 规避AI检测
+
+    参数:
+    text (str): 原始文本
+    preprocessor (TextPreprocessor): 预处理器
+    rewriter (TextRewriter): 改写器
+    avoider (AIDetectionAvoider): AI检测规避器
+    rewrite_methods (list): 改写方法
+    avoid_methods (list): 规避方法
+    intensity (float): 处理强度，范围0-1
+    seed (int or str): 随机种子，相同的文本、参数和种子总是得到相同的结果
+    rng (random.Random): 随机数生成器，传入时忽略seed
+    pos_mode (str): 词性标注模式，'accurate' 或 'fast'，见 TextPreprocessor.pos_tagging
+    deadline (float): 截止时间（time.monotonic() 的值），传入时由 StageScheduler 安排各阶段，
+                      到时跳过或中断耗时的阶段，尽快返回部分处理的结果
+    cancel (threading.Event): 取消标志，每个阶段开始前和各阶段逐句处理时检查，已设置时抛出 PipelineCancelled
+    plan (list): 已经为整篇文档选好的阶段（见 plan_document），传入时不再按本段的长度安排
+    costs (dict): 各阶段每个字符的耗时（秒），见 StageScheduler
+
+    返回:
+    dict: 包含原始、清洗、改写和最终文本；传入deadline时还包含 stages（各阶段为 full、partial 或 skipped）
+    """
+    rng = make_rng(rng if rng is not None else seed)
+
+    # 预处理
+    check_cancelled(cancel)
+    cleaned_text = preprocessor.clean_text(text)
+
+    # 构建文档模型，改写和规避AI检测共用同一份分词结果
+    check_cancelled(cancel)
+    document = preprocessor.build_document(cleaned_text, pos_mode=pos_mode)
+
+    # 按截止时间安排改写和规避AI检测的各个阶段；只传入取消标志时所有阶段都执行，由调度器逐句检查取消标志
+    scheduler = None
+    if deadline is not None or cancel is not None:
+        stages = stage_names(rewrite_methods if rewrite_methods is not None else DEFAULT_REWRITE_METHODS,
+                             avoid_methods if avoid_methods is not None else DEFAULT_AVOID_METHODS)
+        scheduler = StageScheduler(deadline, len(cleaned_text), intensity, costs=costs, cancel=cancel)
+        if plan is None:
+            scheduler.plan(stages)
+        else:
+            scheduler.assign(stages, plan)
+
+    # 改写
+    check_cancelled(cancel)
+    rewriter.rewrite_document(document, methods=rewrite_methods, intensity=intensity, rng=rng, scheduler=scheduler)
+    rewritten_text = document.text
+
+    # 规避AI检测
+    check_cancelled(cancel)
+    avoider.avoid_ai_detection_document(document, methods=avoid_methods, intensity=intensity, rng=rng,
+                                        scheduler=scheduler)
+    final_text = document.text
+
+    result = {
+        'original_text': text,
+        'cleaned_text': cleaned_text,
+        'rewritten_text': rewritten_text,
+        'final_text': final_text
+    }
+    if deadline is not None:
+        result['stages'] = scheduler.report(stages)
+    return result
+
+
+def plan_document(options, chars, costs=None):
+    """
+    按整篇文档的字符数一次性选出能在截止时间前完成的阶段（从耗时最少的阶段开始）
+
+    参数:
+    options (dict): rewrite_methods、avoid_methods、intensity、deadline
+    chars (int): 需要处理的字符数
+    costs (dict): 各阶段每个字符的耗时（秒），见 StageScheduler
+
+    返回:
+    list: 选中的阶段名，未设置截止时间时返回None
+    """
+    if options.get('deadline') is None:
+        return None
+    scheduler = StageScheduler(options['deadline'], chars, options.get('intensity', 0.5), costs=costs)
+    return scheduler.plan(list(full_report(options)))
+
+
+def paragraph_seed(seed, paragraph, occurrence=0):
+    """
+    由整篇文本的随机种子和段落内容推导出段落的随机种子
+
+    各段落的随机数互不影响，因此段落可以按任意顺序、在任意进程中处理，结果都相同。种子只与段落内容
+    （及相同内容在文中第几次出现）有关，与段落位置无关，插入或删除段落不会改变其他段落的种子。
+
+    参数:
+    seed (int or str): 整篇文本的随机种子
+    paragraph (str): 段落文本
+    occurrence (int): 相同内容的段落在此之前出现的次数，使重复的段落各自使用不同的随机数
+
+    返回:
+    str: 段落的随机种子
+    """
+    digest = hashlib.sha256(paragraph.encode('utf-8')).hexdigest()[:16]
+    return f'{seed}:{digest}:{occurrence}'
+
+
+def with_paragraph_seeds(paragraphs, seed):
+    """
+    为段落序列中的每个段落推导随机种子
+
+    参数:
+    paragraphs (iterable): 段落文本，可以是生成器
+    seed (int or str): 整篇文本的随机种子
+
+    返回:
+    generator: (段落, 段落的随机种子)
+    """
+    # 按内容摘要计数，逐段读取的大文件不需要保存已处理的段落
+    occurrences = {}
+    for paragraph in paragraphs:
+        digest = hashlib.sha256(paragraph.encode('utf-8')).digest()
+        occurrence = occurrences.get(digest, 0)
+        occurrences[digest] = occurrence + 1
+        yield paragraph, paragraph_seed(seed, paragraph, occurrence)
+
+
+def paragraph_key(paragraph, seed, options):
+    """
+    计算段落处理结果的指纹，用于增量处理时复用未修改段落的结果
+
+    参数:
+    paragraph (str): 段落文本
+    seed (str): 段落的随机种子（由 paragraph_seed 推导）
+    options (dict): rewrite_methods、avoid_methods、intensity、pos_mode
+
+    返回:
+    str: 缓存键
+    """
+    return make_cache_key(paragraph, seed=seed, scope='paragraph', **cache_options(options))
+
+
+def _base_seed(seed):
+    # 未指定种子时随机选一个，保证同一次调用内各段落的随机数仍然互相独立
+    return seed if seed is not None else random.getrandbits(64)
+
+
+def stream_pipeline(text, preprocessor, rewriter, avoider, rewrite_methods=None, avoid_methods=None, intensity=0.5,
+                    seed=None, pos_mode=None, deadline=None, cancel=None, cache=None, costs=None):
+    """
+    逐段执行预处理 → 改写 → 规避AI检测，每处理完一段就产出一段结果
+
+    参数与 run_pipeline 相同，每个段落使用由 paragraph_seed 按段落内容推导出的随机种子，
+    结果与 run_pipeline_paragraphs 逐段相同；cache 和 costs 见 stream_paragraphs
+
+    返回:
+    generator: 每个元素为一个段落的处理结果，额外包含段落序号index
+    """
+    return stream_paragraphs(preprocessor.iter_paragraphs(text), preprocessor, rewriter, avoider,
+                             rewrite_methods=rewrite_methods, avoid_methods=avoid_methods, intensity=intensity,
+                             seed=seed, pos_mode=pos_mode, deadline=deadline, cancel=cancel, cache=cache,
+                             chars=len(text), costs=costs)
+
+
+def stream_paragraphs(paragraphs, preprocessor, rewriter, avoider, rewrite_methods=None, avoid_methods=None,
+                      intensity=0.5, seed=None, pos_mode=None, deadline=None, cancel=None, cache=None, chars=None,
+                      costs=None):
+    """
+    逐段处理任意段落序列（如逐段读取的上传文件），每次只读取和处理一个段落
+
+    参数:
+    paragraphs (iterable): 段落文本，可以是生成器
+    cache (ResultCache): 段落结果缓存，传入时文本、参数和种子都未改变的段落直接使用缓存结果
+    chars (int): 全部段落的字符数，设置了deadline时按它为整篇文档一次性安排各阶段；
+                 为None时（如逐段读取的上传文件，总长度未知）各段落按自身长度安排
+    costs (dict): 各阶段每个字符的耗时（秒），见 StageScheduler
+    其余参数与 stream_pipeline 相同
+
+    返回:
+    generator: 每个元素为一个段落的处理结果，额外包含段落序号index；
+               传入cache时还包含 recomputed（该段是否重新处理）
+    """
+    base = _base_seed(seed)
+    options = {'rewrite_methods': rewrite_methods, 'avoid_methods': avoid_methods, 'intensity': intensity,
+               'pos_mode': pos_mode, 'deadline': deadline}
+    plan = plan_document(options, chars, costs) if chars is not None else None
+    for index, (paragraph, seed) in enumerate(with_paragraph_seeds(paragraphs, base)):
+        if cache is None:
+            result = run_pipeline(paragraph, preprocessor, rewriter, avoider, seed=seed, cancel=cancel, plan=plan,
+                                  **options)
+        else:
+            key = paragraph_key(paragraph, seed, options)
+            result = cache.get(key)
+            if result is None:
+                result = run_pipeline(paragraph, preprocessor, rewriter, avoider, seed=seed, cancel=cancel,
+                                      plan=plan, **options)
+                if cacheable_result(result) is not None:
+                    cache.put(key, cacheable_result(result))
+                result = dict(result, recomputed=True)
+            else:
+                result = dict(result, recomputed=False)
+                if deadline is not None:
+                    result['stages'] = full_report(options)
+        result['index'] = index
+        yield result
+
+
+def run_pipeline_paragraphs(text, preprocessor, rewriter, avoider, rewrite_methods=None, avoid_methods=None,
+                            intensity=0.5, seed=None, pos_mode=None, deadline=None, pool=None, cancel=None,
+                            cache=None, costs=None):
+    """
+    把文本按段落切分，各段落独立执行预处理 → 改写 → 规避AI检测，再按原顺序拼接
+
+    这是处理整篇文本的标准方式，/process、/process_batch 和离线批量处理都使用它。段落之间没有
+    共享状态（随机种子由 paragraph_seed 推导），因此传入进程池并行处理、串行处理、stream_pipeline
+    逐段处理的结果完全相同。传入cache时按段落指纹（文本、参数和段落种子）复用已处理过的段落，
+    修改一段后重新提交只需处理这一段。设置了deadline时按需要处理的段落的总字符数一次性安排各阶段
+    （并行处理时按每个进程分到的字符数），各段落执行同一组阶段。
+
+    参数:
+    text (str): 原始文本
+    preprocessor, rewriter, avoider: 串行处理时使用的处理器
+    rewrite_methods, avoid_methods, intensity, seed, pos_mode, deadline: 与 run_pipeline 相同
+    pool (BatchProcessor): 传入时在其进程池中并行处理各段落
+    cancel (threading.Event): 取消标志，串行处理时逐句检查，并行处理时在等待结果期间检查并撤销尚未开始的段落
+    cache (ResultCache): 段落结果缓存
+    costs (dict): 各阶段每个字符的耗时（秒），见 StageScheduler
+
+    返回:
+    dict: 与 run_pipeline 相同，各文本字段为各段落结果以换行符拼接；传入cache时还包含
+          recomputed（重新处理的段落序号列表）和 seed（本次使用的随机种子，再次提交时传入才能复用结果）
+    """
+    base = _base_seed(seed)
+    paragraphs = preprocessor.split_paragraphs(text)
+    seeds = [seed for _, seed in with_paragraph_seeds(paragraphs, base)]
+    options = {'rewrite_methods': rewrite_methods, 'avoid_methods': avoid_methods, 'intensity': intensity,
+               'pos_mode': pos_mode, 'deadline': deadline}
+
+    # 只处理缓存中没有的段落
+    results = [None] * len(paragraphs)
+    if cache is not None:
+        keys = [paragraph_key(paragraph, seed, options) for paragraph, seed in zip(paragraphs, seeds)]
+        results = [cache.get(key) for key in keys]
+    missing = [index for index, result in enumerate(results) if result is None]
+
+    # 按整篇文档一次性安排各阶段，不让前面的段落按自身长度各自占用全部剩余时间
+    parallel = pool is not None and len(missing) > 1
+    chars = sum(len(paragraphs[i]) for i in missing)
+    if parallel:
+        chars = -(-chars // min(pool.workers, len(missing)))
+    run_options = dict(options, plan=plan_document(options, chars, costs))
+
+    check_cancelled(cancel)
+    if parallel:
+        computed = pool.map_paragraphs([paragraphs[i] for i in missing], [seeds[i] for i in missing], run_options,
+                                       cancel=cancel)
+    else:
+        computed = [run_pipeline(paragraphs[i], preprocessor, rewriter, avoider, seed=seeds[i], cancel=cancel,
+                                 **run_options)
+                    for i in missing]
+    for index, result in zip(missing, computed):
+        results[index] = result
+        if cache is not None and cacheable_result(result) is not None:
+            cache.put(keys[index], cacheable_result(result))
+
+    output = {
+        'original_text': text,
+        'cleaned_text': '\n'.join(result['cleaned_text'] for result in results),
+        'rewritten_text': '\n'.join(result['rewritten_text'] for result in results),
+        'final_text': '\n'.join(result['final_text'] for result in results)
+    }
+    if deadline is not None:
+        # 来自缓存的段落没有 stages，视为全部完整执行
+        output['stages'] = merge_reports([result.get('stages') for result in results], list(full_report(options)))
+    if cache is not None:
+        output['recomputed'] = missing
+        output['seed'] = base
+    return output
+
+
+# 工作进程中预先加载的处理器
+_worker_models = None
+
+
+def share_worker_models(preprocessor, rewriter, avoider):
+    """
+    登记主进程中已加载的处理器
+
+    以fork方式创建的工作进程会直接继承这些处理器，不需要重新加载。
+
+    参数:
+    preprocessor, rewriter, avoider: 已加载的处理器
+    """
+    global _worker_models
+    _worker_models = (preprocessor, rewriter, avoider)
+
+
+def _init_worker():
+    """工作进程初始化：没有从主进程继承处理器时，加载jieba词典并创建处理器"""
+    global _worker_models
+    if _worker_models is None:
+        preprocessor = TextPreprocessor()
+        rewriter = TextRewriter(preprocessor=preprocessor)
+        _worker_models = (preprocessor, rewriter, AIDetectionAvoider(preprocessor=preprocessor, rewriter=rewriter))
+        warm_up(preprocessor)
+
+
+def _process_item(item, received=None):
+    """
+    在工作进程中处理单篇文档，出错时返回错误信息而不是抛出异常；similarity 参数指定时附加各阶段的相似度
+
+    received 为主进程收到请求的时间，deadline_ms 从此时而不是从工作进程开始处理时计时
+    （time.monotonic() 是系统范围的单调时钟，在fork出的工作进程中同样有效）
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('text'), str):
+        return {'error': '请提供文本'}
+    try:
+        similarity = parse_similarity(item.get('similarity'))
+        result = run_pipeline_paragraphs(item['text'], *_worker_models, **parse_options(item, received))
+        return with_similarity(result, similarity, _worker_models[0].segment)
+    except Exception as e:
+        return {'error': f'处理文本时出错: {str(e)}'}
+
+
+def _process_items(items):
+    """在工作进程中依次处理一组文档"""
+    return [_process_item(item) for item in items]
+
+
+def _process_paragraphs(chunk):
+    """在工作进程中依次处理一组段落"""
+    paragraphs, seeds, options = chunk
+    return [run_pipeline(paragraph, *_worker_models, seed=seed, **options)
+            for paragraph, seed in zip(paragraphs, seeds)]
+
+
+class BatchProcessor:
+    """
+    批量处理器，将多篇文档分发到预先加载好模型的工作进程池中并行处理
+    """
+
+    def __init__(self, workers=None):
+        """
+        初始化批量处理器
+
+        参数:
+        workers (int): 工作进程数，默认为CPU核数
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        # 已提交但尚未完成的文档数，即进程池的队列深度
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+
+    def _get_executor(self):
+        # 进程池在第一次批量请求时才创建
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self._executor
+
+    def process(self, documents, cancel=None, received=None):
+        """
+        并行处理多篇文档
+
+        参数:
+        documents (list): 文档列表，每个元素为包含text及可选rewrite_methods、avoid_methods、intensity、seed的字典
+        cancel (threading.Event): 取消标志，设置后取消尚未开始处理的文档
+        received (float): 收到请求的时间（time.monotonic() 的值），各文档的 deadline_ms 从此时开始计时，
+                          默认从工作进程开始处理该文档时计时
+
+        返回:
+        list: 与输入顺序一致的结果列表，单篇出错时对应元素为 {'error': ...}
+
+        异常:
+        PipelineCancelled: 处理被取消
+        """
+        executor = self._get_executor()
+        process_item = functools.partial(_process_item, received=received)
+        futures = [self._submit(executor, process_item, item) for item in documents]
+
+        results = []
+        broken = False
+        for future in futures:
+            try:
+                results.append(self._result(future, futures, cancel))
+            except PipelineCancelled:
+                raise
+            except BrokenProcessPool:
+                broken = True
+                results.append({'error': '工作进程异常退出'})
+            except Exception as e:
+                results.append({'error': f'处理文本时出错: {str(e)}'})
+
+        if broken:
+            # 进程池损坏后丢弃，下次请求重新创建
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        return results
+
+    def map_paragraphs(self, paragraphs, seeds, options, cancel=None):
+        """
+        在进程池中并行处理一篇文本的各个段落
+
+        段落按顺序分成若干组提交（每个进程约4组），减少进程间通信次数。
+
+        参数:
+        paragraphs (list): 段落列表
+        seeds (list): 各段落的随机种子
+        options (dict): rewrite_methods、avoid_methods、intensity、pos_mode，以及可选的 deadline 和 plan
+        cancel (threading.Event): 取消标志，设置后取消尚未开始处理的各组段落
+
+        返回:
+        list: 与段落顺序一致的 run_pipeline 结果
+
+        异常:
+        RuntimeError: 工作进程异常退出
+        PipelineCancelled: 处理被取消
+        """
+        executor = self._get_executor()
+        size = max(1, -(-len(paragraphs) // (self.workers * 4)))
+        futures = [self._submit(executor, _process_paragraphs, (paragraphs[i:i + size], seeds[i:i + size], options))
+                   for i in range(0, len(paragraphs), size)]
+
+        results = []
+        try:
+            for future in futures:
+                results.extend(self._result(future, futures, cancel))
+        except BrokenProcessPool:
+            # 进程池损坏后丢弃，下次请求重新创建
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            raise RuntimeError('工作进程异常退出')
+        return results
+
+    def imap(self, documents, chunk_size=16, window=None):
+        """
+        并行处理文档流，按输入顺序逐篇产出结果
+
+        文档按 chunk_size 篇一组提交，同时提交的组数不超过 window，只在需要时从 documents 中读取，
+        内存占用与文档总数无关，适合离线处理大量文档（bulk_process.py）。
+
+        参数:
+        documents (iterable): 文档，格式与 process() 相同
+        chunk_size (int): 每组的文档数
+        window (int): 同时提交的最大组数，默认为进程数的2倍
+
+        返回:
+        generator: 与输入顺序一致的结果，单篇出错时对应元素为 {'error': ...}
+
+        异常:
+        RuntimeError: 工作进程异常退出
+        """
+        executor = self._get_executor()
+        window = window or self.workers * 2
+        futures = deque()
+        documents = iter(documents)
+        try:
+            while True:
+                while len(futures) < window:
+                    chunk = [item for _, item in zip(range(chunk_size), documents)]
+                    if not chunk:
+                        break
+                    futures.append(self._submit(executor, _process_items, chunk))
+                if not futures:
+                    return
+                yield from futures.popleft().result()
+        except BrokenProcessPool:
+            # 进程池损坏后丢弃，下次调用重新创建
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            raise RuntimeError('工作进程异常退出')
+        finally:
+            # 提前停止（如中断）时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def _result(future, futures, cancel):
+        """等待一个任务的结果，期间每隔 CANCEL_POLL_INTERVAL 秒检查取消标志，已取消时撤销 futures 中尚未开始的任务"""
+        if cancel is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_INTERVAL)
+            except FutureTimeoutError:
+                if cancel.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    raise PipelineCancelled()
+
+    def _submit(self, executor, func, arg):
+        """提交一个任务并计入队列深度"""
+        with self._pending_lock:
+            self.pending += 1
+        try:
+            future = executor.submit(func, arg)
+        except Exception:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
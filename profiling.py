@@ -0,0 +1,201 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+
+# 单次请求性能分析结果的保存目录和最多保留的文件数
+DEFAULT_PROFILE_DIR = os.environ.get('PROFILE_DIR', './profiles')
+DEFAULT_MAX_PROFILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class RequestProfiler:
+    """
+    对单次处理调用进行确定性性能分析（cProfile），并把结果保存为可下载的 .pstats 文件
+    """
+
+    def __init__(self, profile_dir=None, max_profiles=None):
+        """
+        初始化请求分析器
+
+        参数:
+        profile_dir (str): 分析结果保存目录
+        max_profiles (int): 最多保留的分析文件数，超出时删除最早的文件
+        """
+        self.profile_dir = profile_dir or DEFAULT_PROFILE_DIR
+        self.max_profiles = max_profiles if max_profiles is not None else DEFAULT_MAX_PROFILES
+        self._lock = threading.Lock()
+
+    def run(self, func, *args, **kwargs):
+        """
+        在性能分析器中调用函数
+
+        参数:
+        func (callable): 被分析的函数
+        args, kwargs: 传给函数的参数
+
+        返回:
+        tuple: (函数返回值, 分析结果ID)
+        """
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args, **kwargs)
+
+        profile_id = uuid.uuid4().hex
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profiler.dump_stats(self.path_for(profile_id))
+        self._prune()
+        return result, profile_id
+
+    def path_for(self, profile_id):
+        """
+        返回分析结果文件路径
+
+        参数:
+        profile_id (str): 分析结果ID
+
+        返回:
+        str: 文件路径，ID格式不正确时返回None
+        """
+        if not PROFILE_ID_PATTERN.match(profile_id or ''):
+            return None
+        return os.path.join(self.profile_dir, profile_id + '.pstats')
+
+    def exists(self, profile_id):
+        path = self.path_for(profile_id)
+        return path is not None and os.path.exists(path)
+
+    def _prune(self):
+        """删除超出保留数量的最早的分析文件"""
+        with self._lock:
+            files = [os.path.join(self.profile_dir, name) for name in os.listdir(self.profile_dir)
+                     if name.endswith('.pstats')]
+            if len(files) <= self.max_profiles:
+                return
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self.max_profiles]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """
+    后台调用栈采样器
+
+    按固定间隔采集所有线程的调用栈并累计次数，输出火焰图工具（如 flamegraph.pl、speedscope）
+    可直接读取的折叠栈格式。只在后台线程中读取栈帧，不影响被采样的线程，可以长期开启。
+    """
+
+    def __init__(self, interval=0.01, max_stacks=10000):
+        """
+        初始化采样器
+
+        参数:
+        interval (float): 采样间隔（秒）
+        max_stacks (int): 最多记录的不同调用栈数，超出后计入 [other]
+        """
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台采样线程"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def restart(self):
+        """在fork出的子进程中重新启动采样线程（父进程的线程不会被继承），已停止的采样器保持停止"""
+        if self._thread is None:
+            return
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self.samples = 0
+        self._thread = None
+        self.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(skip_thread=own_id)
+
+    def sample(self, skip_thread=None):
+        """采集一次所有线程的调用栈"""
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == skip_thread:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.reverse()
+            stacks.append(';'.join(labels))
+
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                if stack in self._stacks or len(self._stacks) < self.max_stacks:
+                    self._stacks[stack] += 1
+                else:
+                    self._stacks['[other]'] += 1
+
+    def collapsed(self):
+        """
+        返回折叠栈格式的采样结果
+
+        返回:
+        str: 每行为 "帧1;帧2;...;帧N 次数"，按次数从多到少排列
+        """
+        with self._lock:
+            items = self._stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def reset(self):
+        """清空已采集的数据"""
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+
+def create_sampler_from_env():
+    """
+    根据环境变量创建并启动采样器
+
+    SAMPLING_PROFILER=1 时启用，采样间隔由 SAMPLING_PROFILER_INTERVAL（秒）配置。
+
+    返回:
+    StackSampler: 已启动的采样器，未启用时返回None
+    """
+    if os.environ.get('SAMPLING_PROFILER', '0') in ('', '0'):
+        return None
+    sampler = StackSampler(interval=float(os.environ.get('SAMPLING_PROFILER_INTERVAL', 0.01)))
+    sampler.start()
+    return sampler
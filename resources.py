@@ -0,0 +1,213 @@
+import gc
+import logging
+import os
+import time
+from text_preprocessor import TextPreprocessor
+from text_rewriter import TextRewriter
+from ai_detection_avoider import AIDetectionAvoider
+from result_cache import ResultCache
+from admission import AdmissionController
+from pipeline import BatchProcessor, share_worker_models
+from profiling import RequestProfiler, create_sampler_from_env
+from metrics import METRICS
+from warmup import warm_up
+
+logger = logging.getLogger(__name__)
+
+
+def worker_share(total):
+    """
+    把整台服务器的容量平均分给各服务工作进程
+
+    每个服务进程都有自己的准入控制和批量处理进程池，gunicorn.conf.py 把工作进程数写入环境变量
+    WEB_WORKERS，未单独配置的容量按进程数均分，整台服务器合计与单进程部署相同，
+    不会出现每个进程各启动CPU核数个批量处理进程的情况。
+
+    参数:
+    total (int): 整台服务器的容量
+
+    返回:
+    int: 每个服务进程的份额，至少为1
+    """
+    return max(1, total // (int(os.environ.get('WEB_WORKERS', 0)) or 1))
+
+
+def process_limits():
+    """
+    按环境变量计算当前服务进程的处理容量
+
+    返回:
+    dict: max_concurrent（同时处理的请求数）、max_queue（等待队列长度）和 batch_workers（批量处理进程数），
+          环境变量给出的是每个进程的值，未设置时由整台服务器的默认值（CPU核数、16、CPU核数）按进程数均分
+    """
+    cpus = os.cpu_count() or 1
+    # MAX_QUEUE_DEPTH=0 表示不排队，只有未设置时才使用默认值
+    max_queue = os.environ.get('MAX_QUEUE_DEPTH')
+    return {
+        'max_concurrent': int(os.environ.get('MAX_CONCURRENT_REQUESTS', 0)) or worker_share(cpus),
+        'max_queue': int(max_queue) if max_queue else worker_share(16),
+        'batch_workers': int(os.environ.get('BATCH_WORKERS', 0)) or worker_share(cpus)
+    }
+
+
+class Resources:
+    """
+    应用共用的资源：处理器、结果缓存、批量处理进程池、准入控制和性能分析工具
+
+    预处理器、改写器和AI检测规避器只各创建一个，规避器直接使用同一个改写器和预处理器，
+    同义词词典、句式模板和AI特征模式不会重复构建。
+    """
+
+    def __init__(self, preprocessor=None, rewriter=None, avoider=None, result_cache=None, batch_processor=None,
+                 request_profiler=None, stack_sampler=None, paragraph_cache=None, admission=None):
+        """
+        初始化资源，未传入的部分按默认配置创建
+
+        参数:
+        preprocessor (TextPreprocessor): 预处理器
+        rewriter (TextRewriter): 改写器
+        avoider (AIDetectionAvoider): AI检测规避器
+        result_cache (ResultCache): 处理结果缓存
+        paragraph_cache (ResultCache): 增量处理使用的段落结果缓存
+        batch_processor (BatchProcessor): 批量处理进程池
+        request_profiler (RequestProfiler): 单次请求性能分析器
+        stack_sampler (StackSampler): 后台调用栈采样器，可选
+        admission (AdmissionController): 处理请求的准入控制
+        """
+        self.preprocessor = preprocessor or TextPreprocessor()
+        self.rewriter = rewriter or TextRewriter(preprocessor=self.preprocessor)
+        self.avoider = avoider or AIDetectionAvoider(preprocessor=self.preprocessor, rewriter=self.rewriter)
+        self.result_cache = result_cache or ResultCache()
+        self.paragraph_cache = paragraph_cache or ResultCache(max_entries=4096)
+        self.batch_processor = batch_processor or BatchProcessor()
+        self.request_profiler = request_profiler or RequestProfiler()
+        self.stack_sampler = stack_sampler
+        self.admission = admission or AdmissionController(max_concurrent=os.cpu_count() or 1)
+
+    @classmethod
+    def from_env(cls):
+        """
+        按环境变量的配置创建资源
+
+        返回:
+        Resources: 资源对象
+        """
+        limits = process_limits()
+        return cls(
+            # 处理结果缓存：内存层 + 可选的SQLite磁盘层（设置 RESULT_CACHE_PATH 后启用）
+            result_cache=ResultCache(
+                max_entries=int(os.environ.get('RESULT_CACHE_ENTRIES', 256)),
+                max_bytes=int(os.environ.get('RESULT_CACHE_BYTES', 64 * 1024 * 1024)),
+                ttl=float(os.environ.get('RESULT_CACHE_TTL', 24 * 3600)),
+                path=os.environ.get('RESULT_CACHE_PATH') or None
+            ),
+            # 增量处理的段落结果缓存，一篇论文有数百个段落，容量按段落数配置
+            paragraph_cache=ResultCache(
+                max_entries=int(os.environ.get('PARAGRAPH_CACHE_ENTRIES', 4096)),
+                max_bytes=int(os.environ.get('PARAGRAPH_CACHE_BYTES', 64 * 1024 * 1024)),
+                ttl=float(os.environ.get('RESULT_CACHE_TTL', 24 * 3600)),
+                path=os.environ.get('PARAGRAPH_CACHE_PATH') or None
+            ),
+            # 批量处理进程池，进程数可通过环境变量 BATCH_WORKERS 配置
+            batch_processor=BatchProcessor(workers=limits['batch_workers']),
+            # 后台调用栈采样器，设置环境变量 SAMPLING_PROFILER=1 后启用
+            stack_sampler=create_sampler_from_env(),
+            # 准入控制：同时处理的请求数、等待队列长度、最长排队时间（秒）和单个请求的最大字符数（0 表示不限制）
+            admission=AdmissionController(
+                max_concurrent=limits['max_concurrent'],
+                max_queue=limits['max_queue'],
+                max_wait=float(os.environ.get('MAX_QUEUE_WAIT', 10)),
+                max_chars=int(os.environ.get('MAX_REQUEST_CHARS', 300000)) or None
+            )
+        )
+
+    @property
+    def models(self):
+        """(预处理器, 改写器, AI检测规避器)"""
+        return self.preprocessor, self.rewriter, self.avoider
+
+    def collect_metrics(self):
+        """导出队列深度、准入控制和缓存统计"""
+        admission_stats = self.admission.stats()
+        result_stats = self.result_cache.stats()
+        paragraph_stats = self.paragraph_cache.stats()
+        preprocessor_stats = self.preprocessor.cache_stats()
+        return [
+            ('queue_depth', 'gauge', '已提交但尚未完成的任务数',
+             [((('queue', 'batch'),), self.batch_processor.pending),
+              ((('queue', 'admission'),), admission_stats['queued'])]),
+            ('admitted_requests', 'gauge', '已接纳、正在处理的请求数',
+             [((), admission_stats['active'])]),
+            ('cache_hits_total', 'counter', '缓存命中次数',
+             [((('cache', 'result'),), result_stats['hits']),
+              ((('cache', 'paragraph'),), paragraph_stats['hits']),
+              ((('cache', 'preprocessor'),), preprocessor_stats['hits'])]),
+            ('cache_misses_total', 'counter', '缓存未命中次数',
+             [((('cache', 'result'),), result_stats['misses']),
+              ((('cache', 'paragraph'),), paragraph_stats['misses']),
+              ((('cache', 'preprocessor'),), preprocessor_stats['misses'])]),
+            ('cache_entries', 'gauge', '内存缓存条目数',
+             [((('cache', 'result'),), result_stats['memory']['entries']),
+              ((('cache', 'paragraph'),), paragraph_stats['memory']['entries']),
+              ((('cache', 'preprocessor'),), preprocessor_stats['entries'])]),
+        ]
+
+    def after_fork(self):
+        """
+        在fork出的服务工作进程中调用（如gunicorn的post_fork钩子）
+
+        线程不会被fork继承，需要在子进程中重新启动后台采样器。
+        """
+        if self.stack_sampler is not None:
+            self.stack_sampler.restart()
+
+
+# 当前进程共用的资源
+_shared = None
+
+
+def load_resources(freeze=True):
+    """
+    创建并预热当前进程共用的资源
+
+    在多进程部署中应在主进程fork之前调用（如 gunicorn --preload）：jieba词典、同义词词典和
+    各种模板只加载一次，工作进程直接继承已加载的对象。freeze为真时把加载完成的对象移出
+    垃圾回收的追踪范围，避免工作进程的垃圾回收遍历这些对象导致共享的内存页被复制。
+
+    参数:
+    freeze (bool): 加载完成后是否调用 gc.freeze()
+
+    返回:
+    Resources: 资源对象
+    """
+    global _shared
+    start = time.perf_counter()
+    resources = Resources.from_env()
+
+    # 预热jieba模型，避免第一个请求承担加载开销
+    # 词典缓存目录可通过环境变量 JIEBA_CACHE_DIR 配置，缓存由 python warmup.py build 生成
+    warm_up(resources.preprocessor)
+
+    # 批量处理进程池以fork方式创建时直接继承这些处理器
+    share_worker_models(*resources.models)
+    METRICS.add_collector(resources.collect_metrics)
+
+    if freeze and hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+    logger.info('模型加载完成，耗时 %.2f 秒', time.perf_counter() - start)
+    _shared = resources
+    return resources
+
+
+def get_resources():
+    """
+    返回当前进程共用的资源，第一次调用时加载
+
+    返回:
+    Resources: 资源对象
+    """
+    if _shared is None:
+        return load_resources()
+    return _shared
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from lru_cache import LRUCache, MISSING
+
+# 启用了磁盘层的缓存，fork出的子进程需要重新打开数据库连接
+_disk_caches = weakref.WeakSet()
+
+
+def make_cache_key(text, rewrite_methods=None, avoid_methods=None, intensity=0.5, seed=None, **options):
+    """
+    根据文本内容和处理参数计算缓存键
+
+    参数:
+    text (str): 原始文本
+    rewrite_methods, avoid_methods, intensity, seed: 与 run_pipeline 的参数相同
+    options: 其他影响结果的参数
+
+    返回:
+    str: SHA-256 十六进制摘要
+    """
+    payload = json.dumps([text, rewrite_methods, avoid_methods, float(intensity), seed, options],
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    处理结果缓存：内存LRU层 + 可选的SQLite磁盘层
+
+    两层都有过期时间，并分别按条目数和字节数限制容量。磁盘层在进程重启后仍然有效，
+    也可以被多个工作进程共用。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=24 * 3600,
+                 path=None, disk_max_entries=100000, disk_max_bytes=1024 * 1024 * 1024):
+        """
+        初始化结果缓存
+
+        参数:
+        max_entries (int): 内存层最大条目数，为0时关闭内存层
+        max_bytes (int): 内存层最大字节数
+        ttl (float): 有效期（秒）
+        path (str): SQLite数据库路径，为None时不使用磁盘层
+        disk_max_entries (int): 磁盘层最大条目数
+        disk_max_bytes (int): 磁盘层最大字节数
+        """
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries, max_bytes, ttl)
+        self.path = path
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._db = None
+        self._inherited_dbs = []
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connect()
+            _disk_caches.add(self)
+
+    def _connect(self):
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS results (
+                                key TEXT PRIMARY KEY,
+                                value TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+        self._db.commit()
+
+    def _reconnect_after_fork(self):
+        """SQLite连接不能跨进程使用：子进程保留（但不再使用）继承来的连接，另开新连接"""
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._inherited_dbs.append(self._db)
+            self._connect()
+
+    def get(self, key):
+        """
+        读取缓存结果
+
+        参数:
+        key (str): make_cache_key 计算的缓存键
+
+        返回:
+        dict: 缓存的结果（副本），未命中时返回None
+        """
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return dict(value)
+
+        if self._db is not None:
+            now = time.time()
+            with self._lock:
+                row = self._db.execute('SELECT value FROM results WHERE key = ? AND created > ?',
+                                       (key, now - self.ttl)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+                    self._db.commit()
+                    self.disk_hits += 1
+            if row is not None:
+                value = json.loads(row[0])
+                self.memory.put(key, value)
+                return dict(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        写入缓存结果
+
+        参数:
+        key (str): 缓存键
+        value (dict): 处理结果
+        """
+        self.memory.put(key, dict(value))
+
+        if self._db is not None:
+            data = json.dumps(value, ensure_ascii=False)
+            now = time.time()
+            with self._lock:
+                self._db.execute('INSERT OR REPLACE INTO results (key, value, size, created, accessed) '
+                                 'VALUES (?, ?, ?, ?, ?)', (key, data, len(data.encode('utf-8')), now, now))
+                self._db.commit()
+                self._puts += 1
+                # 每写入一定次数检查一次容量，避免每次写入都统计全表
+                if self._puts % 64 == 1:
+                    self._evict_disk(now)
+
+    def _evict_disk(self, now):
+        """删除过期条目，并按最近访问时间淘汰超出容量的条目"""
+        cursor = self._db.execute('DELETE FROM results WHERE created <= ?', (now - self.ttl,))
+        self.disk_evictions += cursor.rowcount
+        count, total = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        if count > self.disk_max_entries or total > self.disk_max_bytes:
+            rows = self._db.execute('SELECT key, size FROM results ORDER BY accessed').fetchall()
+            evicted = []
+            for key, size in rows:
+                if count <= self.disk_max_entries and total <= self.disk_max_bytes:
+                    break
+                evicted.append((key,))
+                count -= 1
+                total -= size
+            self._db.executemany('DELETE FROM results WHERE key = ?', evicted)
+            self.disk_evictions += len(evicted)
+        self._db.commit()
+
+    def stats(self):
+        """
+        返回缓存统计信息
+
+        返回:
+        dict: 内存层统计、磁盘层命中和淘汰次数、总命中率
+        """
+        memory = self.memory.stats()
+        with self._lock:
+            hits = memory['hits'] + self.disk_hits
+            total = hits + self.misses
+            stats = {
+                'memory': memory,
+                'disk_enabled': self._db is not None,
+                'disk_hits': self.disk_hits,
+                'disk_evictions': self.disk_evictions,
+                'hits': hits,
+                'misses': self.misses,
+                'hit_rate': hits / total if total else 0.0
+            }
+            if self._db is not None:
+                count, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+                stats['disk_entries'] = count
+                stats['disk_bytes'] = size
+        return stats
+
+    def close(self):
+        """关闭磁盘层"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _after_fork_in_child():
+    for cache in list(_disk_caches):
+        cache._reconnect_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,254 @@
+import time
+from metrics import METRICS
+
+# 改写方法、规避方法与处理阶段（即运行指标中的阶段名）的对应关系
+REWRITE_STAGES = {
+    'synonym': 'rewriter.synonym_replacement',
+    'restructure': 'rewriter.sentence_restructuring',
+    'word_order': 'rewriter.word_order_adjustment',
+}
+AVOID_STAGES = {
+    'human_features': 'avoider.add_human_writing_features',
+    'sentence_diversity': 'avoider.diversify_sentence_length',
+    'reduce_patterns': 'avoider.reduce_ai_patterns',
+    'adjust_perplexity': 'avoider.adjust_perplexity',
+}
+
+# 各阶段每个字符的默认耗时（秒），取自 benchmark.py 在冷缓存下的测量结果（包含分词和词性标注）；
+# 开启运行指标后改用实际观测到的吞吐量
+DEFAULT_STAGE_COSTS = {
+    'rewriter.synonym_replacement': 13e-6,
+    'rewriter.sentence_restructuring': 14e-6,
+    'rewriter.word_order_adjustment': 13e-6,
+    'avoider.add_human_writing_features': 6e-6,
+    'avoider.diversify_sentence_length': 3.5e-6,
+    'avoider.reduce_ai_patterns': 1.3e-6,
+    'avoider.adjust_perplexity': 7e-6,
+}
+
+# 改写的各方法只作用于部分句子：同义词替换的比例约为 intensity，句式重构和词序调整约为 intensity²
+INTENSITY_EXPONENTS = {
+    'rewriter.synonym_replacement': 1,
+    'rewriter.sentence_restructuring': 2,
+    'rewriter.word_order_adjustment': 2,
+}
+
+# 观测次数达到该值后才使用观测到的吞吐量
+MIN_OBSERVED_CALLS = 20
+
+FULL = 'full'
+PARTIAL = 'partial'
+SKIPPED = 'skipped'
+
+
+class PipelineCancelled(Exception):
+    """处理被取消（客户端断开连接或请求超时）"""
+
+
+def check_cancelled(cancel):
+    """
+    检查是否已请求取消处理
+
+    参数:
+    cancel (threading.Event): 取消标志，为None时不检查
+
+    异常:
+    PipelineCancelled: 已请求取消
+    """
+    if cancel is not None and cancel.is_set():
+        raise PipelineCancelled()
+
+
+def stage_names(rewrite_methods=None, avoid_methods=None):
+    """
+    返回处理方法对应的阶段名，按执行顺序排列
+
+    参数:
+    rewrite_methods (list): 改写方法
+    avoid_methods (list): 规避方法
+
+    返回:
+    list: 阶段名列表
+    """
+    return ([REWRITE_STAGES[method] for method in rewrite_methods or () if method in REWRITE_STAGES]
+            + [AVOID_STAGES[method] for method in avoid_methods or () if method in AVOID_STAGES])
+
+
+def merge_reports(reports, stages):
+    """
+    合并多个段落的阶段执行情况：所有段落都完整执行为 full，都未执行为 skipped，否则为 partial
+
+    参数:
+    reports (list): 各段落的 {阶段名: 状态}，None 表示全部完整执行（如来自缓存的结果）
+    stages (list): 阶段名列表
+
+    返回:
+    dict: {阶段名: 状态}
+    """
+    merged = {}
+    for stage in stages:
+        statuses = {FULL if report is None else report.get(stage, SKIPPED) for report in reports}
+        merged[stage] = statuses.pop() if len(statuses) == 1 else PARTIAL
+    return merged
+
+
+class StageScheduler:
+    """
+    按截止时间安排各处理阶段
+
+    开始处理前按文档长度估计各阶段耗时，从耗时最少的阶段开始，在剩余时间内能完成的阶段才执行，
+    其余阶段跳过；执行过程中各阶段逐句（或逐段）检查截止时间，到时即停止，已处理的部分保留。
+    各阶段仍按原有顺序执行，全部完整执行时结果与不设截止时间完全相同。
+    逐句检查时同时检查取消标志，客户端断开连接或请求超时后在当前句子处理完时就停止。
+    """
+
+    def __init__(self, deadline, chars, intensity=0.5, costs=None, cancel=None):
+        """
+        初始化调度器
+
+        参数:
+        deadline (float): 截止时间（time.monotonic() 的值），None 表示不限时间（只检查取消标志）
+        chars (int): 文档字符数
+        intensity (float): 处理强度
+        costs (dict): 各阶段每个字符的耗时（秒），默认使用观测值或 DEFAULT_STAGE_COSTS
+        cancel (threading.Event): 取消标志
+        """
+        self.deadline = deadline
+        self.cancel = cancel
+        self.chars = chars
+        self.intensity = intensity
+        self.costs = costs if costs is not None else self._observed_costs()
+        self.status = {}
+        self._planned = set()
+        self._current = None
+
+    @staticmethod
+    def _observed_costs():
+        costs = dict(DEFAULT_STAGE_COSTS)
+        if METRICS.enabled:
+            for stage, stats in METRICS.stage_snapshot().items():
+                if stage in costs and stats['calls'] >= MIN_OBSERVED_CALLS and stats['chars'] > 0:
+                    costs[stage] = stats['seconds'] / stats['chars']
+        return costs
+
+    def remaining(self):
+        """距离截止时间的秒数"""
+        if self.deadline is None:
+            return float('inf')
+        return self.deadline - time.monotonic()
+
+    def _past_deadline(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def expired(self):
+        """
+        是否已到截止时间，已到时把正在执行的阶段记为部分完成
+
+        异常:
+        PipelineCancelled: 已请求取消
+        """
+        check_cancelled(self.cancel)
+        if not self._past_deadline():
+            return False
+        if self._current is not None:
+            self.status[self._current] = PARTIAL
+        return True
+
+    def estimate(self, stage):
+        """
+        估计阶段的耗时
+
+        参数:
+        stage (str): 阶段名
+
+        返回:
+        float: 秒数
+        """
+        fraction = self.intensity ** INTENSITY_EXPONENTS.get(stage, 0)
+        return self.costs.get(stage, 0.0) * self.chars * fraction
+
+    def plan(self, stages):
+        """
+        从耗时最少的阶段开始，选出能在剩余时间内完成的阶段
+
+        参数:
+        stages (list): 需要执行的阶段名
+
+        返回:
+        list: 选中的阶段名
+        """
+        budget = self.remaining()
+        for stage in sorted(stages, key=self.estimate):
+            cost = self.estimate(stage)
+            if cost <= budget:
+                budget -= cost
+                self._planned.add(stage)
+            else:
+                self.status[stage] = SKIPPED
+        return [stage for stage in stages if stage in self._planned]
+
+    def assign(self, stages, planned):
+        """
+        使用已经为整篇文档选好的阶段，不再按本段的长度重新估计
+
+        逐段处理时先按整篇文档的字符数调用一次 plan()，再把结果分给各段落，
+        否则每个段落都按自己的长度对照全部剩余时间安排，前面的段落会用完时间。
+
+        参数:
+        stages (list): 需要执行的阶段名
+        planned (list): 选中的阶段名（plan() 的返回值）
+
+        返回:
+        list: 选中的阶段名
+        """
+        self._planned = set(planned)
+        for stage in stages:
+            if stage not in self._planned:
+                self.status[stage] = SKIPPED
+        return [stage for stage in stages if stage in self._planned]
+
+    def should_run(self, stage):
+        """
+        阶段开始前调用：计划中且尚未到截止时间时返回True，否则记为跳过
+
+        参数:
+        stage (str): 阶段名
+
+        返回:
+        bool: 是否执行该阶段
+
+        异常:
+        PipelineCancelled: 已请求取消
+        """
+        check_cancelled(self.cancel)
+        if stage in self._planned and not self._past_deadline():
+            self._current = stage
+            return True
+        self.status[stage] = SKIPPED
+        return False
+
+    def finish(self, stage, complete=True):
+        """
+        阶段结束后调用，记录执行结果（执行过程中 expired() 返回过True的阶段记为部分完成）
+
+        参数:
+        stage (str): 阶段名
+        complete (bool): 是否处理了全部内容
+        """
+        if not complete or self.status.get(stage) == PARTIAL:
+            self.status[stage] = PARTIAL
+        else:
+            self.status[stage] = FULL
+        self._current = None
+
+    def report(self, stages):
+        """
+        返回各阶段的执行情况
+
+        参数:
+        stages (list): 阶段名列表
+
+        返回:
+        dict: {阶段名: 'full' | 'partial' | 'skipped'}
+        """
+        return {stage: self.status.get(stage, SKIPPED) for stage in stages}
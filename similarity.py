@@ -0,0 +1,269 @@
+import os
+import time
+import numpy as np
+from metrics import METRICS
+
+# 字符n-gram的长度（中文按字计算，忽略空白字符）
+CHAR_NGRAM = 3
+
+# 词语shingle的长度（连续的词数）
+TOKEN_SHINGLE = 2
+
+# MinHash签名的长度：保留的最小哈希值个数，相似度估计的标准误差约为 sqrt(J(1-J)/SIGNATURE_SIZE)
+SIGNATURE_SIZE = 256
+
+# full 计算字符和词语两种相似度，char 只计算字符相似度（不需要分词，开销最小）
+SIMILARITY_MODES = ('full', 'char')
+
+# 与原文比较的各阶段输出
+STAGE_FIELDS = ('cleaned_text', 'rewritten_text', 'final_text')
+
+# 设置环境变量 SIMILARITY_SCORING=full 或 char 后，未指定 similarity 参数的请求也计算相似度
+DEFAULT_MODE = os.environ.get('SIMILARITY_SCORING') or None
+
+# n-gram多项式哈希的乘数和64位混合函数（splitmix64）的常数，运算按 2^64 取模
+_MULTIPLIER = np.uint64(0x100000001B3)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def parse_similarity(value):
+    """
+    解析请求中的 similarity 参数
+
+    参数:
+    value (bool or str): True 或 'full' 计算字符和词语相似度，'char' 只计算字符相似度，
+                         False 不计算，None 时使用环境变量 SIMILARITY_SCORING 的设置
+
+    返回:
+    str: 'full'、'char'，不计算时返回None
+
+    异常:
+    ValueError: 格式不正确
+    """
+    if value is None:
+        value = DEFAULT_MODE
+    if value is None or value is False:
+        return None
+    if value is True:
+        return 'full'
+    if value not in SIMILARITY_MODES:
+        raise ValueError(f'similarity 只能是 true、false、{"、".join(SIMILARITY_MODES)}')
+    return value
+
+
+def _mix(hashes):
+    """splitmix64的混合步骤，使哈希值的各位均匀分布"""
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes = hashes * _MIX1
+    hashes = hashes ^ (hashes >> np.uint64(27))
+    hashes = hashes * _MIX2
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def shingle_hashes(codes, n):
+    """
+    计算序列中每个长度为 n 的窗口的64位哈希值
+
+    每次把整个数组乘以常数再加上下一位，共 n 次向量运算，耗时与序列长度成正比。
+
+    参数:
+    codes (numpy.ndarray): uint64 序列（字符的码位或词的编号）
+    n (int): 窗口长度，序列比窗口短时整个序列作为一个shingle
+
+    返回:
+    numpy.ndarray: uint64 哈希值，序列为空时返回空数组
+    """
+    n = min(n, len(codes))
+    if n == 0:
+        return np.empty(0, dtype=np.uint64)
+    count = len(codes) - n + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(n):
+        hashes = hashes * _MULTIPLIER + codes[offset:offset + count]
+    return _mix(hashes)
+
+
+def char_shingles(text, n=CHAR_NGRAM):
+    """
+    文本的字符n-gram哈希值，忽略空白字符（清洗时调整的空格和换行不影响相似度）
+
+    参数:
+    text (str): 文本
+    n (int): n-gram长度
+
+    返回:
+    numpy.ndarray: uint64 哈希值
+    """
+    compact = ''.join(text.split())
+    codes = np.frombuffer(compact.encode('utf-32-le'), dtype='<u4').astype(np.uint64)
+    return shingle_hashes(codes, n)
+
+
+def tokenize(text, segment):
+    """
+    按段落分词，去掉空白的词
+
+    参数:
+    text (str): 文本
+    segment (callable): 分词函数，如 TextPreprocessor.segment（带缓存）
+
+    返回:
+    list: 词语
+    """
+    tokens = []
+    for line in text.splitlines():
+        if line.strip():
+            tokens.extend(token for token in segment(line) if not token.isspace())
+    return tokens
+
+
+def token_shingles(tokens, vocabulary, k=TOKEN_SHINGLE):
+    """
+    词语shingle的哈希值
+
+    参数:
+    tokens (list): 词语
+    vocabulary (dict): 词语到编号的映射，比较的两段文本必须使用同一个映射，新词会加入其中
+    k (int): 每个shingle的词数
+
+    返回:
+    numpy.ndarray: uint64 哈希值
+    """
+    ids = np.fromiter((vocabulary.setdefault(token, len(vocabulary)) for token in tokens),
+                      dtype=np.uint64, count=len(tokens))
+    return shingle_hashes(ids, k)
+
+
+def signature(hashes, size=SIGNATURE_SIZE):
+    """
+    计算MinHash签名（bottom-k）：去重后最小的 size 个哈希值
+
+    用 numpy.partition 在线性时间内选出候选值，只对候选值排序，不需要对全部shingle排序或建立集合。
+
+    参数:
+    hashes (numpy.ndarray): shingle哈希值
+    size (int): 签名长度
+
+    返回:
+    numpy.ndarray: 升序排列的 uint64 签名，不同的shingle少于 size 个时为全部shingle
+    """
+    if len(hashes) <= size:
+        return np.unique(hashes)
+    candidates = size
+    while True:
+        smallest = np.unique(np.partition(hashes, candidates - 1)[:candidates])
+        # 重复的shingle较多时候选值去重后可能不足 size 个，扩大候选范围重新选择
+        if len(smallest) >= size or candidates == len(hashes):
+            return smallest[:size]
+        candidates = min(len(hashes), candidates * 4)
+
+
+def estimate_jaccard(signature_a, signature_b, size=SIGNATURE_SIZE):
+    """
+    由两个MinHash签名估计两个shingle集合的Jaccard相似度
+
+    取两个签名合并后最小的 size 个值，其中同时出现在两个签名中的比例即为估计值；
+    两个集合合计不超过 size 个不同的shingle时结果是精确的。
+
+    参数:
+    signature_a, signature_b (numpy.ndarray): signature() 返回的签名
+    size (int): 签名长度
+
+    返回:
+    float: 相似度（0-1），两个集合都为空时为1
+    """
+    union = np.union1d(signature_a, signature_b)[:size]
+    if len(union) == 0:
+        return 1.0
+    shared = np.isin(union, signature_a, assume_unique=True) & np.isin(union, signature_b, assume_unique=True)
+    return float(np.count_nonzero(shared)) / len(union)
+
+
+def char_similarity(original, modified, n=CHAR_NGRAM):
+    """
+    两段文本字符n-gram的相似度（MinHash估计的Jaccard相似度）
+
+    参数:
+    original (str): 原文
+    modified (str): 修改后的文本
+    n (int): n-gram长度
+
+    返回:
+    float: 相似度（0-1）
+    """
+    return estimate_jaccard(signature(char_shingles(original, n)), signature(char_shingles(modified, n)))
+
+
+def token_similarity(original, modified, segment, k=TOKEN_SHINGLE):
+    """
+    两段文本词语shingle的相似度（MinHash估计的Jaccard相似度）
+
+    参数:
+    original (str): 原文
+    modified (str): 修改后的文本
+    segment (callable): 分词函数
+    k (int): 每个shingle的词数，为1时 1 - 相似度 是词语集合变化率的估计（两段文本合计不超过 SIGNATURE_SIZE 个不同的词时精确）
+
+    返回:
+    float: 相似度（0-1）
+    """
+    vocabulary = {}
+    return estimate_jaccard(signature(token_shingles(tokenize(original, segment), vocabulary, k)),
+                            signature(token_shingles(tokenize(modified, segment), vocabulary, k)))
+
+
+def similarity_report(result, mode='full', segment=None):
+    """
+    计算处理结果中各阶段输出与原文的相似度
+
+    原文的签名只计算一次，每个阶段的输出只需计算一次签名，总耗时与文本长度成正比。
+
+    参数:
+    result (dict): run_pipeline 等返回的结果（包含 original_text 和各阶段的输出）
+    mode (str): 'full' 计算字符和词语相似度，'char' 只计算字符相似度
+    segment (callable): 分词函数，mode 为 'full' 时必须提供
+
+    返回:
+    dict: {阶段输出的字段名: {'char': 相似度, 'token': 相似度}}，如 {'final_text': {'char': 0.42, 'token': 0.31}}
+    """
+    start = time.perf_counter()
+    original = result['original_text']
+    char_original = signature(char_shingles(original))
+    vocabulary = {}
+    if mode == 'full':
+        token_original = signature(token_shingles(tokenize(original, segment), vocabulary))
+
+    report = {}
+    for field in STAGE_FIELDS:
+        text = result.get(field)
+        if text is None:
+            continue
+        scores = {'char': estimate_jaccard(char_original, signature(char_shingles(text)))}
+        if mode == 'full':
+            scores['token'] = estimate_jaccard(token_original,
+                                               signature(token_shingles(tokenize(text, segment), vocabulary)))
+        report[field] = {name: round(score, 4) for name, score in scores.items()}
+
+    if METRICS.enabled:
+        METRICS.observe_stage('similarity', time.perf_counter() - start, len(original))
+        for measure, score in report.get('final_text', {}).items():
+            METRICS.observe_similarity(measure, score)
+    return report
+
+
+def with_similarity(result, mode, segment=None):
+    """
+    在处理结果中加上 similarity 字段，出错的结果原样返回
+
+    参数:
+    result (dict): 处理结果
+    mode (str): parse_similarity 返回的模式，为None时原样返回
+    segment (callable): 分词函数
+
+    返回:
+    dict: 新的结果（不修改传入的结果，缓存中的结果不受影响）
+    """
+    if mode is None or 'error' in result:
+        return result
+    return dict(result, similarity=similarity_report(result, mode, segment))
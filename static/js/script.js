@@ -1,5 +1,7 @@
 // 全局变量
 let processingInProgress = false;
+// 本页面使用的随机种子：修改部分段落后再次处理时，未修改的段落直接使用上次的结果
+const sessionSeed = Math.floor(Math.random() * 2147483647);
 
 // DOM元素
 document.addEventListener('DOMContentLoaded', function() {
@@ -68,8 +70,42 @@ document.addEventListener('DOMContentLoaded', function() {
         loadingOverlay.classList.remove('hidden');
         processingInProgress = true;
         
-        // 发送API请求
-        fetch('/process', {
+        // 清空上次的结果
+        originalText.value = '';
+        cleanedText.value = '';
+        rewrittenText.value = '';
+        finalText.value = '';
+        
+        // 切换到最终结果标签页
+        tabButtons.forEach(btn => btn.classList.remove('active'));
+        tabPanes.forEach(pane => pane.classList.remove('active'));
+        document.querySelector('.tab-btn[data-tab="final"]').classList.add('active');
+        document.getElementById('final-tab').classList.add('active');
+        
+        // 将一段结果追加到各个结果框
+        function appendParagraph(data) {
+            const separator = data.index > 0 ? '\n' : '';
+            originalText.value += separator + data.original_text;
+            cleanedText.value += separator + data.cleaned_text;
+            rewrittenText.value += separator + data.rewritten_text;
+            finalText.value += separator + data.final_text;
+        }
+        
+        // 处理一行NDJSON
+        function handleLine(line) {
+            if (!line.trim()) return;
+            const data = JSON.parse(line);
+            if (data.error) {
+                throw new Error(data.error);
+            }
+            if (data.done) return;
+            appendParagraph(data);
+            // 收到第一段结果后隐藏加载动画，后续段落陆续显示
+            loadingOverlay.classList.add('hidden');
+        }
+        
+        // 发送API请求，逐段接收处理结果
+        fetch('/process_stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -78,27 +114,34 @@ document.addEventListener('DOMContentLoaded', function() {
                 text: text,
                 rewrite_methods: rewriteMethods,
                 avoid_methods: avoidMethods,
-                intensity: intensity
+                intensity: intensity,
+                seed: sessionSeed,
+                incremental: true
             })
         })
         .then(response => {
             if (!response.ok) {
                 throw new Error('处理请求失败');
             }
-            return response.json();
-        })
-        .then(data => {
-            // 更新结果
-            originalText.value = data.original_text;
-            cleanedText.value = data.cleaned_text;
-            rewrittenText.value = data.rewritten_text;
-            finalText.value = data.final_text;
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let buffer = '';
             
-            // 切换到最终结果标签页
-            tabButtons.forEach(btn => btn.classList.remove('active'));
-            tabPanes.forEach(pane => pane.classList.remove('active'));
-            document.querySelector('.tab-btn[data-tab="final"]').classList.add('active');
-            document.getElementById('final-tab').classList.add('active');
+            function read() {
+                return reader.read().then(({ done, value }) => {
+                    if (done) {
+                        handleLine(buffer);
+                        return;
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.forEach(handleLine);
+                    return read();
+                });
+            }
+            
+            return read();
         })
         .catch(error => {
             console.error('Error:', error);
@@ -0,0 +1,250 @@
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+
+# 编译后的同义词词典路径，可通过环境变量 SYNONYM_LEXICON 指定，文件存在时 TextRewriter 自动加载
+DEFAULT_LEXICON_PATH = os.environ.get('SYNONYM_LEXICON',
+                                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon', 'synonyms.lex'))
+
+# 文件格式（小端序）：
+#   头部    MAGIC(8字节) + 词条数 count(uint32) + 保留(uint32)
+#   键偏移  (count + 1) 个 uint32，键按UTF-8字节序排列
+#   值偏移  (count + 1) 个 uint32
+#   键数据  各个键的UTF-8编码依次拼接
+#   值数据  各个键的同义词以 \t 连接后的UTF-8编码依次拼接
+# 偏移均相对于各自数据区的起始位置
+MAGIC = b'SYNLEX01'
+HEADER = struct.Struct('<8sII')
+SEPARATOR = '\t'
+
+# 同义词词林扩展版的行首编码，如 "Aa01A01="，只有以 = 结尾的行是同义词
+CILIN_CODE_PATTERN = re.compile(r'^[A-Za-z]{2}\d{2}[A-Za-z]\d{2}[=#@]$')
+
+
+class SynonymLexicon:
+    """
+    以mmap方式只读打开的编译同义词词典
+
+    打开时只读取文件头，查找时在排序后的键上二分查找，只访问用到的页。
+    多个工作进程打开同一个文件时共享操作系统的页缓存，词典再大每个进程的常驻内存也基本不变。
+    """
+
+    def __init__(self, path):
+        """
+        打开编译后的词典
+
+        参数:
+        path (str): build_lexicon 生成的文件路径
+
+        异常:
+        ValueError: 文件格式不正确
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f'{path} 不是有效的同义词词典文件')
+        magic, self._count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} 不是有效的同义词词典文件')
+        table_size = 4 * (self._count + 1)
+        key_table = HEADER.size
+        value_table = key_table + table_size
+        self._view = memoryview(self._mm)
+        if sys.byteorder == 'little':
+            # 偏移表直接映射为整数数组，不需要逐个解码
+            self._key_offsets = self._view[key_table:value_table].cast('I')
+            self._value_offsets = self._view[value_table:value_table + table_size].cast('I')
+        else:
+            self._key_offsets = struct.unpack_from(f'<{self._count + 1}I', self._mm, key_table)
+            self._value_offsets = struct.unpack_from(f'<{self._count + 1}I', self._mm, value_table)
+        self._keys = value_table + table_size
+        self._values = self._keys + self._key_offsets[self._count]
+
+    def _key(self, index):
+        offsets = self._key_offsets
+        return self._mm[self._keys + offsets[index]:self._keys + offsets[index + 1]]
+
+    def _find(self, word):
+        """二分查找词语的序号，找不到时返回-1"""
+        target = word.encode('utf-8')
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self._key(mid)
+            if key < target:
+                lo = mid + 1
+            elif key > target:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def get(self, word, default=None):
+        """
+        查找词语的同义词
+
+        参数:
+        word (str): 词语
+        default: 找不到时的返回值
+
+        返回:
+        tuple: 同义词元组，找不到时返回default
+        """
+        index = self._find(word)
+        if index < 0:
+            return default
+        start = self._values + self._value_offsets[index]
+        end = self._values + self._value_offsets[index + 1]
+        return tuple(self._mm[start:end].decode('utf-8').split(SEPARATOR))
+
+    def __getitem__(self, word):
+        synonyms = self.get(word)
+        if synonyms is None:
+            raise KeyError(word)
+        return synonyms
+
+    def __contains__(self, word):
+        return self._find(word) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def keys(self):
+        """按顺序产生全部词语"""
+        for index in range(self._count):
+            yield self._key(index).decode('utf-8')
+
+    def close(self):
+        """关闭文件映射"""
+        if isinstance(self._key_offsets, memoryview):
+            self._key_offsets.release()
+            self._value_offsets.release()
+        self._view.release()
+        self._mm.close()
+
+
+def open_lexicon(path=None):
+    """
+    打开编译后的同义词词典
+
+    参数:
+    path (str): 词典路径，默认为 DEFAULT_LEXICON_PATH
+
+    返回:
+    SynonymLexicon: 词典对象，文件不存在时返回None
+    """
+    path = path or DEFAULT_LEXICON_PATH
+    if not os.path.isfile(path):
+        return None
+    return SynonymLexicon(path)
+
+
+def parse_thesaurus(lines):
+    """
+    解析文本格式的同义词来源
+
+    支持两种格式，可以混用：
+    - 同义词词林扩展版："Aa01A01= 人 士 人物"，同一行的词语互为同义词（# 和 @ 行跳过）
+    - 普通词表："词语 同义词1 同义词2"，分隔符可以是空白、逗号或冒号，第一个词为键
+
+    参数:
+    lines (iterable): 文本行
+
+    返回:
+    generator: 每个元素为 (词语, [同义词, ...])
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        words = [word for word in re.split(r'[\s,，:：、]+', line) if word]
+        if CILIN_CODE_PATTERN.match(words[0]):
+            if not words[0].endswith('='):
+                continue
+            group = words[1:]
+            for word in group:
+                yield word, [other for other in group if other != word]
+        elif len(words) > 1:
+            yield words[0], words[1:]
+
+
+def build_lexicon(sources, output=None):
+    """
+    把文本格式的同义词来源编译为可mmap的词典文件，作为构建步骤在部署前执行
+
+    同一个词语出现在多处时合并同义词并去重，保留首次出现的顺序。
+
+    参数:
+    sources (list): 来源文件路径列表（UTF-8编码）
+    output (str): 输出路径，默认为 DEFAULT_LEXICON_PATH
+
+    返回:
+    tuple: (输出路径, 词条数)
+    """
+    output = output or DEFAULT_LEXICON_PATH
+
+    entries = {}
+    for source in sources:
+        with open(source, encoding='utf-8') as f:
+            for word, synonyms in parse_thesaurus(f):
+                merged = entries.setdefault(word, {})
+                for synonym in synonyms:
+                    if synonym != word and SEPARATOR not in synonym:
+                        merged[synonym] = None
+
+    items = sorted((word.encode('utf-8'), SEPARATOR.join(synonyms).encode('utf-8'))
+                   for word, synonyms in entries.items() if synonyms)
+
+    key_offsets = [0]
+    value_offsets = [0]
+    for key, value in items:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(value))
+
+    # 先写临时文件再替换，避免正在使用词典的进程读到不完整的文件
+    directory = os.path.dirname(os.path.abspath(output))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(items), 0))
+        f.write(struct.pack(f'<{len(key_offsets)}I', *key_offsets))
+        f.write(struct.pack(f'<{len(value_offsets)}I', *value_offsets))
+        for key, _ in items:
+            f.write(key)
+        for _, value in items:
+            f.write(value)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, output)
+    return output, len(items)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='同义词词典编译工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='把文本格式的同义词来源编译为词典文件')
+    build_parser.add_argument('sources', nargs='+', help='来源文件（同义词词林扩展版或每行 "词语 同义词..."）')
+    build_parser.add_argument('-o', '--output', default=None, help='输出路径')
+
+    lookup_parser = subparsers.add_parser('lookup', help='在编译后的词典中查找词语')
+    lookup_parser.add_argument('words', nargs='+', help='要查找的词语')
+    lookup_parser.add_argument('--lexicon', default=None, help='词典路径')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        path, count = build_lexicon(args.sources, args.output)
+        print(f"同义词词典已生成: {path}（{count} 个词条）")
+    else:
+        lexicon = open_lexicon(args.lexicon)
+        if lexicon is None:
+            print("词典文件不存在，请先运行 python synonym_lexicon.py build")
+            sys.exit(1)
+        for word in args.words:
+            synonyms = lexicon.get(word)
+            print(f"{word}: {' '.join(synonyms) if synonyms else '（无）'}")
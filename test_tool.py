@@ -1,17 +1,24 @@
+import gzip
+import io
+import re
+import zlib
 import sys
+import threading
+import time
 from text_preprocessor import TextPreprocessor
 from text_rewriter import TextRewriter
 from ai_detection_avoider import AIDetectionAvoider
+from admission import AdmissionController, RequestRejected
+from document_io import iter_file_paragraphs
+from http_codec import UnsupportedEncoding, decompress, iter_decompress, parse_fields
+from lexicon_matcher import LexiconMatcher
+from pipeline import BatchProcessor, run_pipeline_paragraphs, share_worker_models, stream_pipeline
+from result_cache import ResultCache
+from scheduler import FULL, SKIPPED, StageScheduler
+from similarity import char_similarity
 
-def test_with_sample():
-    """使用样本文本测试工具的有效性"""
-    # 创建处理器实例
-    preprocessor = TextPreprocessor()
-    rewriter = TextRewriter()
-    avoider = AIDetectionAvoider()
-    
-    # 样本论文文本
-    sample_text = """
+# 样本论文文本
+SAMPLE_TEXT = """
     人工智能技术在近年来取得了显著的发展，尤其是在自然语言处理领域。
     大型语言模型的出现使得机器能够生成高质量的文本内容，这为学术写作带来了新的挑战。
     一方面，AI可以帮助研究者提高写作效率；另一方面，过度依赖AI可能导致学术不端行为。
@@ -22,6 +29,15 @@ def test_with_sample():
     实验结果表明，该方法能够有效区分人类创作和AI生成的学术文本，准确率达到95%以上。
     总而言之，随着AI技术的不断发展，学术界需要建立更完善的规范和技术手段来应对这一挑战。
     """
+
+def test_with_sample():
+    """使用样本文本测试工具的有效性"""
+    # 创建处理器实例
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter()
+    avoider = AIDetectionAvoider()
+    
+    sample_text = SAMPLE_TEXT
     
     print("原始文本:")
     print(sample_text)
@@ -45,7 +61,7 @@ def test_with_sample():
     print(final_text)
     print("\n" + "="*50 + "\n")
     
-    # 计算文本变化率
+    # 计算文本变化率：两段文本词语集合的对称差占并集的比例（精确计算）
     def calculate_change_rate(original, modified):
         """计算文本变化率"""
         original_words = preprocessor.segment(original)
@@ -65,6 +81,7 @@ def test_with_sample():
     
     print(f"改写阶段文本变化率: {rewrite_change_rate:.2%}")
     print(f"最终文本变化率: {final_change_rate:.2%}")
+    print(f"最终文本与原文的字符相似度（MinHash估计）: {char_similarity(cleaned_text, final_text):.2%}")
     
     # 评估结果
     print("\n评估结果:")
@@ -92,6 +109,256 @@ def test_with_sample():
     else:
         print("✗ AI特征模式未减少，规避AI检测效果有限")
 
+def test_parallel_matches_serial():
+    """同一随机种子下，串行、并行（进程池）、逐段流式和批量接口的处理结果完全相同"""
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter(preprocessor=preprocessor)
+    avoider = AIDetectionAvoider(preprocessor=preprocessor, rewriter=rewriter)
+    models = (preprocessor, rewriter, avoider)
+    share_worker_models(*models)
+    
+    serial = run_pipeline_paragraphs(SAMPLE_TEXT, *models, seed=42)
+    pool = BatchProcessor(workers=2)
+    try:
+        parallel = run_pipeline_paragraphs(SAMPLE_TEXT, *models, seed=42, pool=pool)
+        batch = pool.process([{'text': SAMPLE_TEXT, 'seed': 42}])[0]
+    finally:
+        pool.shutdown()
+    streamed = list(stream_pipeline(SAMPLE_TEXT, *models, seed=42))
+    
+    assert parallel == serial
+    assert batch == serial
+    assert '\n'.join(result['final_text'] for result in streamed) == serial['final_text']
+    print("✓ 并行处理与串行处理结果一致")
+
+def test_incremental_reuses_unchanged_paragraphs():
+    """增量处理时在文首插入一段，只重新处理新插入的段落，结果与完整处理相同"""
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter(preprocessor=preprocessor)
+    avoider = AIDetectionAvoider(preprocessor=preprocessor, rewriter=rewriter)
+    models = (preprocessor, rewriter, avoider)
+    paragraphs = [line.strip() for line in SAMPLE_TEXT.splitlines() if line.strip()]
+    cache = ResultCache()
+    
+    first = run_pipeline_paragraphs('\n'.join(paragraphs), *models, seed=42, cache=cache)
+    assert first['recomputed'] == list(range(len(paragraphs)))
+    
+    edited = '\n'.join(['此外，本文还讨论了相关工作的不足之处。'] + paragraphs)
+    second = run_pipeline_paragraphs(edited, *models, seed=42, cache=cache)
+    assert second['recomputed'] == [0]
+    assert second['final_text'] == run_pipeline_paragraphs(edited, *models, seed=42)['final_text']
+    print("✓ 插入段落后只重新处理新段落")
+
+def test_deadline_plans_whole_document():
+    """设置截止时间时按整篇文档安排阶段：单个段落能在时间内完成、整篇不能完成的阶段对所有段落都跳过"""
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter(preprocessor=preprocessor)
+    avoider = AIDetectionAvoider(preprocessor=preprocessor, rewriter=rewriter)
+    text = SAMPLE_TEXT.strip()
+    paragraphs = preprocessor.split_paragraphs(text)
+    assert len(paragraphs) > 1
+    
+    # 只有 adjust_perplexity 有耗时：每段的估计耗时不超过5秒预算的90%，整篇的估计耗时超过预算
+    chars = sum(len(paragraph) for paragraph in paragraphs)
+    per_char = 5.0 / max(len(paragraph) for paragraph in paragraphs) * 0.9
+    assert chars * per_char > 5.0
+    costs = {'avoider.adjust_perplexity': per_char}
+    
+    result = run_pipeline_paragraphs(text, preprocessor, rewriter, avoider, seed=42, deadline=time.monotonic() + 5,
+                                     rewrite_methods=[], avoid_methods=['reduce_patterns', 'adjust_perplexity'],
+                                     costs=costs)
+    assert result['stages'] == {'avoider.reduce_ai_patterns': 'full', 'avoider.adjust_perplexity': 'skipped'}
+    print("✓ 截止时间按整篇文档安排阶段")
+
+def test_lexicon_matcher():
+    """多模式匹配器：重叠匹配、失败指针上的输出、忽略大小写，以及匹配后继续添加词条"""
+    matcher = LexiconMatcher(['he', 'she', 'his', 'hers'])
+    assert matcher.findall('ushers') == [(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')]
+    
+    # 'b' 只能经由 'ab' 状态的失败指针匹配到
+    matcher = LexiconMatcher(['ab', 'b'])
+    assert matcher.findall('ab') == [(0, 2, 'ab'), (1, 2, 'b')]
+    # 匹配之后再添加词条会重新构建，失败链上的输出不能重复
+    matcher.add('xyz')
+    matcher.add('q')
+    assert matcher.findall('ab xyz') == [(0, 2, 'ab'), (1, 2, 'b'), (3, 6, 'xyz')]
+    assert len(matcher) == 4
+    
+    # 同一词条的多个值都返回
+    matcher = LexiconMatcher()
+    matcher.add('研究', 'a')
+    matcher.add('研究', 'b')
+    assert matcher.findall('本研究') == [(1, 3, 'a'), (1, 3, 'b')]
+    
+    matcher = LexiconMatcher(['In Conclusion'], ignore_case=True)
+    assert matcher.findall('in conclusion, IN CONCLUSION') == [(0, 13, 'In Conclusion'), (15, 28, 'In Conclusion')]
+    assert not LexiconMatcher(['abc']).search('ABC')
+    print("✓ 多模式匹配器结果正确")
+
+def test_stage_scheduler_plan():
+    """按给定的每字符耗时从最便宜的阶段开始安排，放不进剩余时间的阶段跳过，执行顺序不变"""
+    costs = {'rewriter.synonym_replacement': 4e-3, 'avoider.reduce_ai_patterns': 1e-3,
+             'avoider.adjust_perplexity': 2e-3}
+    stages = ['rewriter.synonym_replacement', 'avoider.reduce_ai_patterns', 'avoider.adjust_perplexity']
+    
+    # 1000字符、强度1：估计耗时依次为4秒、1秒、2秒，10秒内全部完成
+    scheduler = StageScheduler(time.monotonic() + 10, 1000, intensity=1.0, costs=costs)
+    assert scheduler.plan(stages) == stages
+    
+    # 3.5秒内只放得下最便宜的两个阶段（1秒 + 2秒）
+    scheduler = StageScheduler(time.monotonic() + 3.5, 1000, intensity=1.0, costs=costs)
+    assert scheduler.plan(stages) == ['avoider.reduce_ai_patterns', 'avoider.adjust_perplexity']
+    assert scheduler.status == {'rewriter.synonym_replacement': SKIPPED}
+    
+    # 同义词替换只作用于约 intensity 比例的句子：强度0.25时估计为1秒
+    scheduler = StageScheduler(time.monotonic() + 3.5, 1000, intensity=0.25, costs=costs)
+    assert scheduler.estimate('rewriter.synonym_replacement') == 1.0
+    assert scheduler.plan(stages) == ['rewriter.synonym_replacement', 'avoider.reduce_ai_patterns']
+    
+    # 计划中的阶段执行完后记为 full，未计划的阶段 should_run 返回False
+    assert scheduler.should_run('rewriter.synonym_replacement')
+    scheduler.finish('rewriter.synonym_replacement')
+    assert not scheduler.should_run('avoider.adjust_perplexity')
+    assert scheduler.report(stages) == {'rewriter.synonym_replacement': FULL, 'avoider.reduce_ai_patterns': SKIPPED,
+                                        'avoider.adjust_perplexity': SKIPPED}
+    
+    # assign() 直接使用为整篇文档选好的阶段
+    scheduler = StageScheduler(time.monotonic() + 3.5, 10, intensity=1.0, costs=costs)
+    assert scheduler.assign(stages, ['avoider.reduce_ai_patterns']) == ['avoider.reduce_ai_patterns']
+    print("✓ 阶段调度按耗时从低到高安排")
+
+def test_admission_control():
+    """准入控制：队列已满返回429、排队超时返回503，都带有 Retry-After；名额归还时交给排队的请求"""
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=0.2)
+    held = controller.admit('test')
+    
+    outcome = []
+    
+    def queued_request():
+        try:
+            controller.admit('test').release()
+            outcome.append(200)
+        except RequestRejected as e:
+            outcome.append(e.status)
+    
+    waiter = threading.Thread(target=queued_request)
+    waiter.start()
+    while controller.queued == 0:
+        time.sleep(0.001)
+    
+    # 队列已满：立即拒绝，Retry-After 按排队请求数和平均占用时间（初始1秒）估计
+    try:
+        controller.admit('test')
+        assert False, '队列已满时应拒绝'
+    except RequestRejected as e:
+        assert e.status == 429 and e.reason == 'queue_full'
+        assert e.headers == {'Retry-After': '2'}
+    
+    # 排队超过 max_wait 仍未轮到
+    waiter.join()
+    assert outcome == [503]
+    stats = controller.stats()
+    assert stats['rejected'] == {'too_large': 0, 'queue_full': 1, 'queue_timeout': 1}
+    assert stats['active'] == 1 and stats['queued'] == 0
+    
+    # 名额归还时直接交给排队的请求
+    outcome.clear()
+    controller.max_wait = 5
+    waiter = threading.Thread(target=queued_request)
+    waiter.start()
+    while controller.queued == 0:
+        time.sleep(0.001)
+    held.release()
+    waiter.join()
+    assert outcome == [200]
+    assert controller.stats()['active'] == 0
+    
+    try:
+        AdmissionController(max_chars=10).admit('test', chars=11)
+        assert False, '过长的请求应拒绝'
+    except RequestRejected as e:
+        assert e.status == 413 and e.headers == {}
+    print("✓ 准入控制按预期拒绝和排队")
+
+def test_request_decoding():
+    """请求体解压的大小上限和不支持的压缩格式，以及 fields 参数的校验"""
+    body = '论文降重'.encode('utf-8') * 10000
+    assert decompress(gzip.compress(body), 'gzip', len(body)) == body
+    assert decompress(zlib.compress(body), 'deflate', len(body)) == body
+    assert decompress(body, 'identity', 0) == body
+    
+    # 解压后超过上限时停止，不会把整个压缩炸弹解压出来
+    bomb = gzip.compress(b'\0' * (10 * 1024 * 1024))
+    produced = 0
+    try:
+        for data in iter_decompress([bomb], 'gzip', 64 * 1024):
+            produced += len(data)
+        assert False, '超过上限时应停止'
+    except OverflowError:
+        assert produced <= 64 * 1024
+    
+    for encoding in ('br', 'compress', 'zstd'):
+        try:
+            decompress(b'x', encoding, 1024)
+            assert False, f'{encoding} 应不支持'
+        except UnsupportedEncoding:
+            pass
+    for data in (gzip.compress(body)[:-20], b'not gzip'):
+        try:
+            decompress(data, 'gzip', len(body))
+            assert False, '损坏或不完整的数据应报错'
+        except ValueError as e:
+            assert not isinstance(e, UnsupportedEncoding)
+    
+    assert parse_fields(None) is None
+    assert parse_fields('final_text, similarity') == ('final_text', 'similarity')
+    for value in (['final_txt'], 'final_text,bogus', [], [1], 'a'):
+        try:
+            parse_fields(value)
+            assert False, f'{value!r} 应报错'
+        except ValueError:
+            pass
+    print("✓ 请求体解压和字段校验正确")
+
+def test_sentence_spans_closing_punctuation():
+    """句末标点后的后引号、后括号归入前一句；ASCII引号后紧跟下一句时作为下一句的前引号"""
+    preprocessor = TextPreprocessor()
+    
+    def sentences(text):
+        return [text[start:end] for start, end in preprocessor.sentence_spans(text)]
+    
+    assert sentences('他说：“好。”然后离开。') == ['他说：“好。”', '然后离开。']
+    assert sentences('（见图1。）下一句。') == ['（见图1。）', '下一句。']
+    assert sentences('问题在哪？】接着说！！') == ['问题在哪？】', '接着说！！']
+    assert sentences('他问：“真的吗？！”」对。') == ['他问：“真的吗？！”」', '对。']
+    assert sentences('第一句。"第二句。"') == ['第一句。', '"第二句。"']
+    assert sentences('结束了！"') == ['结束了！"']
+    assert sentences('  第一句。  没有标点的结尾  ') == ['第一句。', '没有标点的结尾']
+    # 位置指向原文，首尾空白不计入句子
+    assert preprocessor.sentence_spans(' 甲。乙。') == ((1, 3), (3, 5))
+    print("✓ 句子切分正确处理后引号和后括号")
+
+def test_txt_encoding_detection():
+    """开头超过一个读取块都是ASCII的GB18030文件按GB18030解码，无法识别的编码在读取前报错"""
+    text = 'abc ' * 20000 + '\n论文降重工具。\n'
+    for encoding in ('gb18030', 'utf-8', 'utf-16'):
+        paragraphs = list(iter_file_paragraphs(io.BytesIO(text.encode(encoding)), 'paper.txt'))
+        assert paragraphs[-1] == '论文降重工具。'
+    try:
+        iter_file_paragraphs(io.BytesIO(b'abc\n\x81\xff\xff'), 'paper.txt')
+        assert False, '无法识别的编码应报错'
+    except ValueError:
+        pass
+    print("✓ 文本文件编码识别正确")
+
 if __name__ == "__main__":
-    import re
     test_with_sample()
+    test_parallel_matches_serial()
+    test_incremental_reuses_unchanged_paragraphs()
+    test_deadline_plans_whole_document()
+    test_lexicon_matcher()
+    test_stage_scheduler_plan()
+    test_admission_control()
+    test_request_decoding()
+    test_sentence_spans_closing_punctuation()
+    test_txt_encoding_detection()
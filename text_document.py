@@ -0,0 +1,147 @@
+class Token(object):
+    """
+    分词结果中的一个词语，记录词性和在所属句子中的字符偏移
+    """
+    __slots__ = ('word', 'pos', 'start', 'end')
+
+    def __init__(self, word, pos='x', start=0):
+        self.word = word
+        self.pos = pos
+        self.start = start
+        self.end = start + len(word)
+
+    def __iter__(self):
+        # 兼容 jieba.posseg 的 (词, 词性) 解包方式
+        yield self.word
+        yield self.pos
+
+    def __repr__(self):
+        return f"{self.word}/{self.pos}"
+
+
+class Sentence(object):
+    """
+    句子，保存文本和词语列表
+
+    词语列表在第一次需要时由 TextPreprocessor.tag_sentence 生成，之后各处理阶段
+    直接在词语列表上修改，不再重复分词。整体替换文本时词语列表失效。
+    start/end 为句子在原始文本中的位置，pos_mode 为生成词语列表时使用的词性标注模式
+    （None 表示使用预处理器的默认模式）。
+    """
+    __slots__ = ('_text', '_tokens', 'start', 'end', 'pos_mode')
+
+    def __init__(self, text, start=0, end=None, pos_mode=None):
+        self._text = text
+        self._tokens = None
+        self.start = start
+        self.end = start + len(text) if end is None else end
+        self.pos_mode = pos_mode
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = ''.join([token.word for token in self._tokens])
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self._text = value
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        """词语列表，尚未分词时为None"""
+        return self._tokens
+
+    @property
+    def words(self):
+        return [token.word for token in self._tokens]
+
+    def set_tokens(self, pairs):
+        """
+        用 (词, 词性) 序列替换句子的词语列表，并重新计算偏移
+        """
+        tokens = []
+        offset = 0
+        for word, pos in pairs:
+            tokens.append(Token(word, pos, offset))
+            offset += len(word)
+        self._tokens = tokens
+        self._text = None
+
+    def _reindex(self, index):
+        offset = self._tokens[index - 1].end if index > 0 else 0
+        for token in self._tokens[index:]:
+            token.start = offset
+            offset += len(token.word)
+            token.end = offset
+        self._text = None
+
+    def insert(self, index, word, pos='x'):
+        """在第index个位置插入词语"""
+        self._tokens.insert(index, Token(word, pos))
+        self._reindex(index)
+
+    def split(self, index):
+        """
+        在第index个词语处把句子一分为二，返回后半句
+        """
+        tail_tokens = self._tokens[index:]
+        split_at = tail_tokens[0].start if tail_tokens else len(self.text)
+        tail = Sentence('', self.start + split_at, self.end, self.pos_mode)
+        tail.set_tokens(tail_tokens)
+        self.end = self.start + split_at
+        self._tokens = self._tokens[:index]
+        self._text = None
+        return tail
+
+    def __len__(self):
+        return len(self.text)
+
+    def __repr__(self):
+        return f"Sentence({self.text!r})"
+
+
+class Paragraph(object):
+    """
+    段落，由若干句子组成
+    """
+    __slots__ = ('sentences', 'start', 'end')
+
+    def __init__(self, sentences, start=0, end=0):
+        self.sentences = sentences
+        self.start = start
+        self.end = end
+
+    @property
+    def text(self):
+        return ''.join([sentence.text for sentence in self.sentences])
+
+    def __repr__(self):
+        return f"Paragraph({self.text!r})"
+
+
+class Document(object):
+    """
+    文档模型：段落 → 句子 → 词语
+
+    由 TextPreprocessor.build_document 构建一次，改写和AI检测规避的各个阶段
+    都在同一个文档对象上原地修改。
+    """
+    __slots__ = ('paragraphs',)
+
+    def __init__(self, paragraphs=None):
+        self.paragraphs = paragraphs if paragraphs is not None else []
+
+    def sentences(self):
+        """按顺序遍历全部句子"""
+        for paragraph in self.paragraphs:
+            for sentence in paragraph.sentences:
+                yield sentence
+
+    @property
+    def text(self):
+        return '\n'.join([paragraph.text for paragraph in self.paragraphs])
+
+    def __repr__(self):
+        return f"Document({len(self.paragraphs)} paragraphs)"
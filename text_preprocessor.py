@@ -1,9 +1,12 @@
 import os  # 添加这行
+import random
 import jieba
 import jieba.posseg as pseg
 import re
 import nltk
-from nltk.tokenize import sent_tokenize
+from text_document import Document, Paragraph, Sentence
+from lru_cache import LRUCache
+from metrics import instrumented
 
 # 下载NLTK必要的数据包
 # 移除以下代码
@@ -15,22 +18,107 @@ from nltk.tokenize import sent_tokenize
 # 添加以下代码
 nltk.data.path.append(os.path.join(os.path.dirname(__file__), 'nltk_data'))
 
+# 分词、词性标注和分句结果缓存的默认容量，可通过环境变量配置
+DEFAULT_CACHE_ENTRIES = int(os.environ.get('PREPROCESSOR_CACHE_ENTRIES', 20000))
+DEFAULT_CACHE_BYTES = int(os.environ.get('PREPROCESSOR_CACHE_BYTES', 64 * 1024 * 1024))
+
+# 中文分句：句末标点（可连续出现，如"？！"）及紧跟其后的后引号、后括号属于同一句
+SENTENCE_TERMINATORS = '。！？?!'
+CLOSING_PUNCTUATION = '”’」』）)]】》'
+# ASCII引号不区分前后引号：句末标点之后的引号后面紧跟空白、中文、字母或数字时，视为下一句的前引号
+ASCII_QUOTES = '"\''
+_CLOSING = r'(?: [{c}] | [{q}](?![\s\u4e00-\u9fa5a-zA-Z0-9]) )*'.format(c=re.escape(CLOSING_PUNCTUATION),
+                                                                        q=re.escape(ASCII_QUOTES))
+# 分组1为去掉首尾空白后的句子
+_SENTENCE_PATTERN = re.compile(r'''\s*(
+    [^{t}\s] (?: [^{t}]*[{t}]+{c}     # 以句末标点（及后引号、后括号）结尾的句子
+              | [^{t}]*(?<!\s) )      # 没有句末标点的结尾部分
+  | [{t}]+{c}                         # 单独的句末标点
+)'''.format(t=re.escape(SENTENCE_TERMINATORS), c=_CLOSING), re.X)
+
+# 词性标注模式：accurate 使用 jieba.posseg（HMM），fast 在分词结果上查词性表，
+# 词典中没有的词按字符类别给出粗略词性。默认模式可通过环境变量 POS_MODE 配置
+POS_MODES = ('accurate', 'fast')
+DEFAULT_POS_MODE = os.environ.get('POS_MODE', 'accurate')
+
+_NUMBER_PATTERN = re.compile(r'^[0-9.]+$')
+_ENGLISH_PATTERN = re.compile(r'^[a-zA-Z0-9]+$')
+_WORD_CHAR_PATTERN = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]')
+
+
+def coarse_pos(word):
+    """
+    词性表中没有的词的粗略词性（与 jieba.posseg 对非中文词的标注一致，中文词按名词处理）
+
+    参数:
+    word (str): 词语
+
+    返回:
+    str: 'm'（数字）、'eng'（英文）、'x'（标点等）或 'n'
+    """
+    if _NUMBER_PATTERN.match(word):
+        return 'm'
+    if _ENGLISH_PATTERN.match(word):
+        return 'eng'
+    if not _WORD_CHAR_PATTERN.search(word):
+        return 'x'
+    return 'n'
+
+
+_shared_cache = None
+
+def get_shared_cache():
+    """
+    获取所有 TextPreprocessor 默认共用的结果缓存
+    
+    改写器和AI检测规避器各自持有预处理器，共用缓存后彼此的分词结果可以复用。
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = LRUCache(DEFAULT_CACHE_ENTRIES, DEFAULT_CACHE_BYTES)
+    return _shared_cache
+
+def make_rng(rng=None):
+    """
+    获取本次调用使用的随机数生成器
+    
+    各处理阶段都使用传入的 random.Random 实例而不是全局的 random 模块，
+    因此相同的输入、参数和种子总是得到相同的结果，并发调用之间也互不影响。
+    
+    参数:
+    rng (random.Random, int or str): 随机数生成器实例（原样返回）或随机种子；
+                                     为None时创建一个不设种子的新实例
+    
+    返回:
+    random.Random: 随机数生成器
+    """
+    if isinstance(rng, random.Random):
+        return rng
+    return random.Random(rng)
+
 class TextPreprocessor:
     """
     文本预处理类，提供文本清洗、分词、词性标注和句子分割等功能
     """
     
-    def __init__(self):
-        """初始化文本预处理器"""
+    def __init__(self, cache=None):
+        """
+        初始化文本预处理器
+        
+        参数:
+        cache (LRUCache): 分词、词性标注和分句结果的缓存，默认使用共享缓存；
+                          传入 LRUCache(max_entries=0) 可关闭缓存
+        """
         # 加载自定义词典（如果有）
         # jieba.load_userdict("user_dict.txt")
-        pass
+        self.cache = cache if cache is not None else get_shared_cache()
     
     # 设置 NLTK 数据路径
     nltk_data_path = os.path.join(os.path.dirname(__file__), 'nltk_data')
     nltk.data.path.append(nltk_data_path)
 
     # 修复正则表达式中的转义字符
+    @instrumented('preprocessor.clean_text')
     def clean_text(self, text):
         if not text:
             return ""
@@ -48,17 +136,28 @@ class TextPreprocessor:
         返回:
         list: 段落列表
         """
-        if not text:
-            return []
-            
-        # 按照换行符分割段落
-        paragraphs = re.split(r'\n+', text)
+        return list(self.iter_paragraphs(text))
+    
+    def iter_paragraphs(self, text):
+        """
+        逐个产生段落，不需要先切分整篇文本
         
-        # 过滤空段落
-        paragraphs = [p.strip() for p in paragraphs if p.strip()]
+        参数:
+        text (str): 输入文本
         
-        return paragraphs
+        返回:
+        generator: 去除首尾空白后的非空段落
+        """
+        if not text:
+            return
+            
+        # 按照换行符分割段落，过滤空段落
+        for match in re.finditer(r'[^\n]+', text):
+            paragraph = match.group(0).strip()
+            if paragraph:
+                yield paragraph
     
+    @instrumented('preprocessor.split_sentences')
     def split_sentences(self, text, language='chinese'):
         """
         将文本分割为句子
@@ -68,26 +167,44 @@ class TextPreprocessor:
         language (str): 语言，'chinese'或'english'
         
         返回:
-        list: 句子列表
+        tuple: 句子元组（缓存结果，不可修改）
         """
         if not text:
-            return []
+            return ()
             
-        if language == 'chinese':
-            # 中文句子分割
-            pattern = r'([^。！？\?!]+[。！？\?!])'
-            sentences = re.findall(pattern, text)
-            # 处理最后可能没有标点符号的句子
-            if text and not text.endswith(('。', '！', '？', '?', '!')):
-                last_part = text.split(sentences[-1])[-1] if sentences else text
-                if last_part.strip():
-                    sentences.append(last_part.strip())
-        else:
-            # 英文句子分割
-            sentences = sent_tokenize(text)
-        
-        return sentences
+        return self.cache.get_or_compute(('split_sentences', language, text),
+                                         lambda: tuple(text[start:end] for start, end in
+                                                       self.sentence_spans(text, language)))
     
+    def sentence_spans(self, text, language='chinese'):
+        """
+        返回各句子在文本中的位置，不生成句子字符串
+        
+        中文按句末标点一次扫描完成，耗时与文本长度成正比；句子首尾的空白不计入句子，
+        没有句末标点的结尾部分作为最后一句。
+        
+        参数:
+        text (str): 输入文本
+        language (str): 语言，'chinese'或'english'
+        
+        返回:
+        tuple: 每个元素为 (起始位置, 结束位置) 的元组（缓存结果，不可修改）
+        """
+        if not text:
+            return ()
+        
+        return self.cache.get_or_compute(('sentence_spans', language, text),
+                                         lambda: self._sentence_spans(text, language))
+    
+    def _sentence_spans(self, text, language):
+        if language != 'chinese':
+            # 英文句子分割（与 sent_tokenize 使用同一个Punkt模型）
+            tokenizer = nltk.data.load(f'tokenizers/punkt/{language}.pickle')
+            return tuple(tokenizer.span_tokenize(text))
+        
+        return tuple(match.span(1) for match in _SENTENCE_PATTERN.finditer(text))
+    
+    @instrumented('preprocessor.segment')
     def segment(self, text):
         """
         对文本进行分词
@@ -96,33 +213,126 @@ class TextPreprocessor:
         text (str): 输入文本
         
         返回:
-        list: 分词结果列表
+        tuple: 分词结果元组（缓存结果，不可修改）
         """
         if not text:
-            return []
+            return ()
             
         # 使用jieba进行分词
-        words = jieba.lcut(text)
-        
-        return words
+        return self.cache.get_or_compute(('segment', text), lambda: tuple(jieba.lcut(text)))
     
-    def pos_tagging(self, text):
+    @instrumented('preprocessor.pos_tagging')
+    def pos_tagging(self, text, mode=None):
         """
         对文本进行词性标注
         
         参数:
         text (str): 输入文本
+        mode (str): 'accurate'（jieba.posseg，HMM标注）或 'fast'（分词后查词性表，速度更快，
+                    各处理阶段只用到的粗粒度词性基本一致），默认为 DEFAULT_POS_MODE
         
         返回:
-        list: 词性标注结果列表，每个元素为(词, 词性)的元组
+        tuple: 词性标注结果，每个元素为(词, 词性)的元组（缓存结果，不可修改）
+        
+        异常:
+        ValueError: 不支持的标注模式
         """
+        mode = mode or DEFAULT_POS_MODE
+        if mode not in POS_MODES:
+            raise ValueError(f'不支持的词性标注模式: {mode}')
         if not text:
-            return []
+            return ()
             
+        if mode == 'fast':
+            # 在（缓存的）分词结果上查 jieba 词典的词性表，不运行HMM
+            word_tags = pseg.dt.word_tag_tab
+            return self.cache.get_or_compute(('pos_tagging_fast', text),
+                                             lambda: tuple((word, word_tags.get(word) or coarse_pos(word))
+                                                           for word in self.segment(text)))
         # 使用jieba进行词性标注
-        words_pos = pseg.cut(text)
+        return self.cache.get_or_compute(('pos_tagging', text),
+                                         lambda: tuple((pair.word, pair.flag) for pair in pseg.cut(text)))
+    
+    def cache_stats(self):
+        """
+        返回分词、词性标注和分句结果缓存的统计信息
+        
+        返回:
+        dict: 条目数、字节数、命中/未命中/淘汰次数和命中率
+        """
+        return self.cache.stats()
+    
+    def tag_sentence(self, sentence):
+        """
+        为句子生成词语列表（已有词语列表时直接返回）
+        
+        参数:
+        sentence (Sentence): 句子对象
+        
+        返回:
+        list: 句子的词语列表
+        """
+        if sentence.tokens is None:
+            sentence.set_tokens(self.pos_tagging(sentence.text, sentence.pos_mode))
+        return sentence.tokens
+    
+    def build_sentence(self, text, start=0, pos_mode=None):
+        """
+        构建单个句子对象并完成分词
+        
+        参数:
+        text (str): 句子文本
+        start (int): 句子在原文中的起始位置
+        pos_mode (str): 词性标注模式，见 pos_tagging
+        
+        返回:
+        Sentence: 句子对象
+        """
+        sentence = Sentence(text, start, pos_mode=pos_mode)
+        self.tag_sentence(sentence)
+        return sentence
+    
+    def build_paragraph(self, text, start=0, pos_mode=None):
+        """
+        构建段落对象，句子的词语列表在首次使用时生成
+        
+        参数:
+        text (str): 段落文本
+        start (int): 段落在原文中的起始位置
+        pos_mode (str): 词性标注模式，见 pos_tagging
+        
+        返回:
+        Paragraph: 段落对象
+        """
+        sentences = [Sentence(text[begin:end], start + begin, start + end, pos_mode)
+                     for begin, end in self.sentence_spans(text)]
+        return Paragraph(sentences, start, start + len(text))
+    
+    @instrumented('preprocessor.build_document')
+    def build_document(self, text, pos_mode=None):
+        """
+        构建文档模型（段落 → 句子 → 词语），供改写和AI检测规避各阶段共用
+        
+        参数:
+        text (str): 输入文本（通常为清洗后的文本）
+        pos_mode (str): 各句子生成词语列表时使用的词性标注模式，见 pos_tagging
+        
+        返回:
+        Document: 文档对象
+        """
+        document = Document()
+        if not text:
+            return document
+        
+        for match in re.finditer(r'[^\n]+', text):
+            paragraph = match.group(0)
+            stripped = paragraph.strip()
+            if not stripped:
+                continue
+            start = match.start() + paragraph.index(stripped)
+            document.paragraphs.append(self.build_paragraph(stripped, start, pos_mode))
         
-        return list(words_pos)
+        return document
     
     def process_text(self, text):
         """
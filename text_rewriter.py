@@ -1,18 +1,32 @@
 import jieba
-import random
 import re
-from text_preprocessor import TextPreprocessor
+from string import Formatter
+from text_preprocessor import TextPreprocessor, make_rng
+from text_document import Sentence
+from lexicon_matcher import LexiconMatcher
+from synonym_lexicon import open_lexicon
+from metrics import instrumented
+from scheduler import REWRITE_STAGES
 
 class TextRewriter:
     """
     文本改写类，提供同义词替换、句式重构、语序调整等功能
     """
     
-    def __init__(self):
-        """初始化文本改写器"""
-        self.preprocessor = TextPreprocessor()
+    def __init__(self, preprocessor=None, lexicon_path=None):
+        """
+        初始化文本改写器
+        
+        参数:
+        preprocessor (TextPreprocessor): 共用的预处理器，默认新建
+        lexicon_path (str): 编译后的同义词词典路径（synonym_lexicon.py build 生成），
+                            默认为 SYNONYM_LEXICON 环境变量或 lexicon/synonyms.lex，文件不存在时只使用内置词典
+        """
+        self.preprocessor = preprocessor or TextPreprocessor()
+        self.lexicon_path = lexicon_path
         self.load_synonym_dict()
         self.load_sentence_patterns()
+        self._pattern_cache = {}
     
     def load_synonym_dict(self):
         """
@@ -59,6 +73,12 @@ class TextRewriter:
             "基本": ["基本上", "大体上", "大致上", "根本上", "本质上"],
             "通常": ["一般", "常常", "往往", "经常", "普遍"],
         }
+        
+        # 同义词词典中的词语建成多模式匹配器，一次扫描即可判断句子中是否有可替换的词
+        self.synonym_matcher = LexiconMatcher(self.synonym_dict)
+        
+        # 大型同义词词典以mmap方式打开，查找时才读取用到的部分
+        self.synonym_lexicon = open_lexicon(self.lexicon_path)
     
     def load_sentence_patterns(self):
         """
@@ -100,30 +120,48 @@ class TextRewriter:
             ]
         }
     
-    def get_synonym(self, word, pos=None):
+    def get_synonyms(self, word):
+        """
+        获取词语的全部同义词，内置词典优先，其次查找编译后的同义词词典
+        
+        参数:
+        word (str): 原词
+        
+        返回:
+        list or tuple: 同义词序列，没有找到时为空
+        """
+        synonyms = self.synonym_dict.get(word)
+        if synonyms:
+            return synonyms
+        if self.synonym_lexicon is not None:
+            return self.synonym_lexicon.get(word, ())
+        return ()
+    
+    def get_synonym(self, word, pos=None, rng=None):
         """
         获取词语的同义词
         
         参数:
         word (str): 原词
         pos (str): 词性，可选
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 同义词，如果没有找到则返回原词
         """
-        if word in self.synonym_dict:
-            synonyms = self.synonym_dict[word]
-            if synonyms:
-                return random.choice(synonyms)
+        synonyms = self.get_synonyms(word)
+        if synonyms:
+            return make_rng(rng).choice(synonyms)
         return word
     
-    def synonym_replacement(self, text, replacement_rate=0.3):
+    def synonym_replacement(self, text, replacement_rate=0.3, rng=None):
         """
         使用同义词替换算法改写文本
         
         参数:
         text (str): 输入文本
         replacement_rate (float): 替换率，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 改写后的文本
@@ -131,28 +169,47 @@ class TextRewriter:
         if not text:
             return ""
             
-        # 使用jieba进行分词和词性标注
-        words_pos = self.preprocessor.pos_tagging(text)
+        sentence = self.preprocessor.build_sentence(text)
+        self.replace_synonyms(sentence, replacement_rate, make_rng(rng))
+        return sentence.text
+    
+    @instrumented('rewriter.synonym_replacement')
+    def replace_synonyms(self, sentence, replacement_rate=0.3, rng=None):
+        """
+        在句子的词语列表上原地进行同义词替换
+        
+        参数:
+        sentence (Sentence): 句子对象
+        replacement_rate (float): 替换率，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        """
+        rng = make_rng(rng)
+        
+        # 句子中不含同义词词典中的任何词语时无需分词（使用大型词典时无法预先判断）
+        if self.synonym_lexicon is None and not self.synonym_matcher.search(sentence.text):
+            return
+        
+        tokens = self.preprocessor.tag_sentence(sentence)
         
         # 替换同义词
-        new_words = []
-        for word, pos in words_pos:
+        changed = False
+        for token in tokens:
             # 根据替换率决定是否替换该词
-            if random.random() < replacement_rate and len(word) > 1:  # 只替换长度大于1的词
-                new_word = self.get_synonym(word, pos)
-                new_words.append(new_word)
-            else:
-                new_words.append(word)
+            if rng.random() < replacement_rate and len(token.word) > 1:  # 只替换长度大于1的词
+                new_word = self.get_synonym(token.word, token.pos, rng)
+                if new_word != token.word:
+                    token.word = new_word
+                    changed = True
         
-        # 合并词语
-        return ''.join(new_words)
+        if changed:
+            sentence.set_tokens(tokens)
     
     def extract_sentence_components(self, sentence):
         """
         提取句子的主要成分（主语、谓语、宾语等）
         
         参数:
-        sentence (str): 输入句子
+        sentence (str or Sentence): 输入句子
         
         返回:
         dict: 句子成分字典
@@ -160,7 +217,10 @@ class TextRewriter:
         # 这里使用简化的方法提取句子成分
         # 实际应用中可以使用更复杂的句法分析
         
-        words_pos = self.preprocessor.pos_tagging(sentence)
+        if isinstance(sentence, Sentence):
+            words_pos = self.preprocessor.tag_sentence(sentence)
+        else:
+            words_pos = self.preprocessor.pos_tagging(sentence)
         
         components = {
             "主语": "",
@@ -211,12 +271,13 @@ class TextRewriter:
         
         return components
     
-    def sentence_restructuring(self, sentence):
+    def sentence_restructuring(self, sentence, rng=None):
         """
         使用句式重构算法改写句子
         
         参数:
         sentence (str): 输入句子
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 改写后的句子
@@ -224,22 +285,93 @@ class TextRewriter:
         if not sentence or len(sentence) < 10:  # 忽略过短的句子
             return sentence
             
+        sentence_obj = Sentence(sentence)
+        self.restructure_sentence(sentence_obj, rng)
+        return sentence_obj.text
+    
+    @instrumented('rewriter.sentence_restructuring')
+    def restructure_sentence(self, sentence, rng=None):
+        """
+        在句子对象上原地进行句式重构
+        
+        新句子的词语列表由模板中预先分好词的固定部分和原句中的成分拼接而成，
+        不需要对新句子重新分词。
+        
+        参数:
+        sentence (Sentence): 句子对象
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        """
+        if len(sentence) < 10:  # 忽略过短的句子
+            return
+            
+        rng = make_rng(rng)
+        
         # 提取句子成分
         components = self.extract_sentence_components(sentence)
         
         # 随机选择一种句式类型
-        pattern_type = random.choice(list(self.sentence_patterns.keys()))
+        pattern_type = rng.choice(list(self.sentence_patterns.keys()))
         
         # 随机选择该类型的一个模板
-        pattern = random.choice(self.sentence_patterns[pattern_type])
+        pattern = rng.choice(self.sentence_patterns[pattern_type])
         
         # 应用模板
         try:
-            new_sentence = pattern.format(**components)
-            return new_sentence
-        except:
-            # 如果格式化失败，返回原句
-            return sentence
+            tokens = self._pattern_tokens(pattern, components, sentence.tokens)
+        except (KeyError, IndexError, ValueError):
+            # 如果格式化失败，保留原句
+            return
+        sentence.set_tokens(tokens)
+    
+    def _pattern_tokens(self, pattern, components, original_tokens):
+        """
+        按模板拼接新句子的 (词, 词性) 序列
+        """
+        pos_of = {token.word: token.pos for token in original_tokens}
+        tokens = []
+        for literal, field, _, _ in self._parse_pattern(pattern):
+            tokens.extend(literal)
+            if field is None:
+                continue
+            tokens.extend(self._component_tokens(components[field], pos_of))
+        return tokens
+    
+    def _component_tokens(self, value, pos_of):
+        """
+        将句子成分还原为词语序列：成分由原句词语拼接而成时直接复用原词性，
+        否则为模板默认成分（如"产生了重要影响"），只分一次词并缓存
+        """
+        tokens = []
+        rest = value
+        while rest:
+            for length in range(len(rest), 0, -1):
+                if rest[:length] in pos_of:
+                    tokens.append((rest[:length], pos_of[rest[:length]]))
+                    rest = rest[length:]
+                    break
+            else:
+                return self._literal_tokens(value)
+        return tokens
+    
+    def _parse_pattern(self, pattern):
+        """
+        解析句式模板，固定部分预先分词并缓存
+        """
+        parsed = self._pattern_cache.get(pattern)
+        if parsed is None:
+            parsed = [(self._literal_tokens(literal), field, spec, conversion)
+                      for literal, field, spec, conversion in Formatter().parse(pattern)]
+            self._pattern_cache[pattern] = parsed
+        return parsed
+    
+    def _literal_tokens(self, text):
+        if not text:
+            return []
+        tokens = self._pattern_cache.get(text)
+        if tokens is None:
+            tokens = self.preprocessor.pos_tagging(text)
+            self._pattern_cache[text] = tokens
+        return tokens
     
     def word_order_adjustment(self, sentence):
         """
@@ -254,35 +386,48 @@ class TextRewriter:
         if not sentence or len(sentence) < 10:  # 忽略过短的句子
             return sentence
             
+        sentence_obj = Sentence(sentence)
+        self.adjust_word_order(sentence_obj)
+        return sentence_obj.text
+    
+    @instrumented('rewriter.word_order_adjustment')
+    def adjust_word_order(self, sentence):
+        """
+        在句子对象上原地调整词序
+        
+        参数:
+        sentence (Sentence): 句子对象
+        """
+        if len(sentence) < 10:  # 忽略过短的句子
+            return
+            
         # 分词
-        words = self.preprocessor.segment(sentence)
+        tokens = self.preprocessor.tag_sentence(sentence)
         
         # 找到句子中的短语并调整其位置
-        if len(words) > 5:
+        if len(tokens) > 5:
             # 简单的调整方法：交换两个短语的位置
-            mid = len(words) // 2
+            mid = len(tokens) // 2
             
             # 确保不会在标点符号处分割
-            while mid < len(words) and re.match(r'[，。！？、；：""''（）【】《》]', words[mid]):
+            while mid < len(tokens) and re.match(r'[，。！？、；：""''（）【】《》]', tokens[mid].word):
                 mid += 1
             
-            if mid < len(words):
+            if mid < len(tokens):
                 # 交换前后两部分
-                new_words = words[mid:] + words[:mid]
+                new_tokens = tokens[mid:] + tokens[:mid]
                 
                 # 确保句子以适当的标点符号结束
-                if new_words[-1] not in ['。', '！', '？', '；', '…']:
+                if new_tokens[-1].word not in ['。', '！', '？', '；', '…']:
                     # 找到原句中的结束标点
-                    for i in range(len(words)-1, -1, -1):
-                        if words[i] in ['。', '！', '？', '；', '…']:
-                            new_words.append(words[i])
+                    for i in range(len(tokens)-1, -1, -1):
+                        if tokens[i].word in ['。', '！', '？', '；', '…']:
+                            new_tokens.append(tokens[i])
                             break
                 
-                return ''.join(new_words)
-        
-        return sentence
+                sentence.set_tokens(new_tokens)
     
-    def rewrite_text(self, text, methods=None, intensity=0.5):
+    def rewrite_text(self, text, methods=None, intensity=0.5, rng=None):
         """
         综合使用多种方法改写文本
         
@@ -290,6 +435,7 @@ class TextRewriter:
         text (str): 输入文本
         methods (list): 使用的改写方法列表，可选值：'synonym', 'restructure', 'word_order'
         intensity (float): 改写强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
         
         返回:
         str: 改写后的文本
@@ -297,38 +443,62 @@ class TextRewriter:
         if not text:
             return ""
             
-        if methods is None:
-            methods = ['synonym', 'restructure', 'word_order']
-        
         # 清洗文本
         cleaned_text = self.preprocessor.clean_text(text)
         
-        # 分句
-        sentences = self.preprocessor.split_sentences(cleaned_text)
+        # 构建文档模型并改写
+        document = self.preprocessor.build_document(cleaned_text)
+        self.rewrite_document(document, methods=methods, intensity=intensity, rng=rng)
+        
+        return document.text
+    
+    @instrumented('rewriter.rewrite')
+    def rewrite_document(self, document, methods=None, intensity=0.5, rng=None, scheduler=None):
+        """
+        在文档模型上原地改写，每个句子最多分词一次
+        
+        参数:
+        document (Document): TextPreprocessor.build_document 构建的文档
+        methods (list): 使用的改写方法列表，可选值：'synonym', 'restructure', 'word_order'
+        intensity (float): 改写强度，范围0-1
+        rng (random.Random or int): 随机数生成器或随机种子，可选
+        scheduler (StageScheduler): 截止时间调度器，传入时只执行计划中的方法，到截止时间后停止改写
+        
+        返回:
+        Document: 改写后的文档（即传入的对象）
+        """
+        if methods is None:
+            methods = ['synonym', 'restructure', 'word_order']
+        
+        rng = make_rng(rng)
+        if scheduler is not None:
+            methods = [method for method in methods
+                       if method in REWRITE_STAGES and scheduler.should_run(REWRITE_STAGES[method])]
+        complete = True
         
         # 改写每个句子
-        new_sentences = []
-        for sentence in sentences:
-            new_sentence = sentence
-            
+        for sentence in document.sentences():
+            if scheduler is not None and scheduler.expired():
+                complete = False
+                break
             # 根据改写强度决定是否改写该句
-            if random.random() < intensity:
+            if rng.random() < intensity:
                 # 同义词替换
                 if 'synonym' in methods:
-                    new_sentence = self.synonym_replacement(new_sentence, replacement_rate=intensity)
+                    self.replace_synonyms(sentence, replacement_rate=intensity, rng=rng)
                 
                 # 句式重构
-                if 'restructure' in methods and random.random() < intensity:
-                    new_sentence = self.sentence_restructuring(new_sentence)
+                if 'restructure' in methods and rng.random() < intensity:
+                    self.restructure_sentence(sentence, rng)
                 
                 # 词序调整
-                if 'word_order' in methods and random.random() < intensity:
-                    new_sentence = self.word_order_adjustment(new_sentence)
-            
-            new_sentences.append(new_sentence)
+                if 'word_order' in methods and rng.random() < intensity:
+                    self.adjust_word_order(sentence)
         
-        # 合并句子
-        return ''.join(new_sentences)
+        if scheduler is not None:
+            for method in methods:
+                scheduler.finish(REWRITE_STAGES[method], complete)
+        return document
 
 # 示例用法
 if __name__ == "__main__":
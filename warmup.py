@@ -0,0 +1,163 @@
+import argparse
+import json
+import marshal
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import jieba
+import jieba.posseg
+
+# 预先生成的jieba词典缓存目录（与 nltk_data 放在一起），可通过环境变量 JIEBA_CACHE_DIR 指定
+DEFAULT_CACHE_DIR = os.environ.get('JIEBA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jieba_cache'))
+CACHE_FILE_NAME = 'jieba.cache'
+
+# 预热使用的示例句子，覆盖分词和词性标注
+WARMUP_TEXT = "论文降重是指通过各种技术手段，降低论文与已有文献的相似度。"
+
+
+def configure_jieba(cache_dir=None):
+    """
+    让jieba从预先生成的词典缓存加载
+
+    缓存文件存在时，jieba直接读取它而不是解析词典并把缓存写入临时目录，
+    因此在只读文件系统上也能正常启动。缓存不存在时保持jieba的默认行为。
+
+    参数:
+    cache_dir (str): 缓存目录，默认为 DEFAULT_CACHE_DIR
+
+    返回:
+    bool: 是否使用了预先生成的缓存
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    if jieba.dt.initialized or not os.path.isfile(os.path.join(cache_dir, CACHE_FILE_NAME)):
+        return False
+    jieba.dt.tmp_dir = cache_dir
+    jieba.dt.cache_file = CACHE_FILE_NAME
+    return True
+
+
+def warm_up(preprocessor=None, cache_dir=None):
+    """
+    预热：加载jieba前缀词典，并完整执行一次分词和词性标注
+
+    应在应用启动时调用，使第一个真实请求不再承担模型加载的开销。
+
+    参数:
+    preprocessor (TextPreprocessor): 预处理器，可选
+    cache_dir (str): 词典缓存目录，可选
+
+    返回:
+    float: 预热耗时（秒）
+    """
+    start = time.perf_counter()
+    configure_jieba(cache_dir)
+    jieba.initialize()
+    if preprocessor is not None:
+        preprocessor.segment(WARMUP_TEXT)
+        preprocessor.pos_tagging(WARMUP_TEXT)
+    else:
+        jieba.lcut(WARMUP_TEXT)
+        list(jieba.posseg.cut(WARMUP_TEXT))
+    return time.perf_counter() - start
+
+
+def build_cache(cache_dir=None):
+    """
+    生成jieba前缀词典缓存，作为构建步骤在部署前执行
+
+    参数:
+    cache_dir (str): 输出目录，默认为 DEFAULT_CACHE_DIR
+
+    返回:
+    str: 缓存文件路径
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, CACHE_FILE_NAME)
+
+    tokenizer = jieba.Tokenizer()
+    freq, total = tokenizer.gen_pfdict(tokenizer.get_dict_file())
+
+    # 先写临时文件再替换，避免留下不完整的缓存
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        marshal.dump((freq, total), f)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def _measure_first_request(warm, cache_dir):
+    """在当前进程中测量启动耗时和第一个请求的耗时（由 startup_report 在子进程中调用）"""
+    start = time.perf_counter()
+    from pipeline import run_pipeline
+    from text_preprocessor import TextPreprocessor
+    from text_rewriter import TextRewriter
+    from ai_detection_avoider import AIDetectionAvoider
+    preprocessor = TextPreprocessor()
+    rewriter = TextRewriter()
+    avoider = AIDetectionAvoider()
+    warmup_seconds = 0.0
+    configure_jieba(cache_dir)
+    if warm:
+        warmup_seconds = warm_up(preprocessor, cache_dir)
+    startup_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run_pipeline(WARMUP_TEXT * 3, preprocessor, rewriter, avoider)
+    first_request_seconds = time.perf_counter() - start
+
+    return {
+        'startup_seconds': startup_seconds,
+        'warmup_seconds': warmup_seconds,
+        'first_request_seconds': first_request_seconds,
+        'prebuilt_cache': jieba.dt.cache_file == CACHE_FILE_NAME
+    }
+
+
+def startup_report(cache_dir=None):
+    """
+    分别在全新的子进程中测量冷启动和预热后的第一个请求耗时
+
+    参数:
+    cache_dir (str): 词典缓存目录，可选
+
+    返回:
+    dict: {'cold': {...}, 'warm': {...}}
+    """
+    report = {}
+    for mode in ('cold', 'warm'):
+        command = [sys.executable, os.path.abspath(__file__), '_measure', mode]
+        if cache_dir:
+            command += ['--cache-dir', cache_dir]
+        output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        report[mode] = json.loads(output.strip().splitlines()[-1])
+    return report
+
+
+if __name__ == "__main__":
+    jieba.setLogLevel(60)
+
+    parser = argparse.ArgumentParser(description='jieba模型预热和词典缓存工具')
+    parser.add_argument('command', choices=['build', 'report', '_measure'],
+                        help='build: 生成词典缓存；report: 输出冷启动与预热后的首个请求耗时')
+    parser.add_argument('mode', nargs='?', default='cold', help=argparse.SUPPRESS)
+    parser.add_argument('--cache-dir', default=None, help='词典缓存目录')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        path = build_cache(args.cache_dir)
+        print(f"词典缓存已生成: {path}")
+    elif args.command == '_measure':
+        print(json.dumps(_measure_first_request(args.mode == 'warm', args.cache_dir)))
+    else:
+        report = startup_report(args.cache_dir)
+        for mode, label in (('cold', '冷启动'), ('warm', '预热后')):
+            result = report[mode]
+            print(f"{label}: 启动耗时 {result['startup_seconds'] * 1000:.1f} ms"
+                  f"（其中预热 {result['warmup_seconds'] * 1000:.1f} ms），"
+                  f"首个请求耗时 {result['first_request_seconds'] * 1000:.1f} ms，"
+                  f"使用预生成缓存: {'是' if result['prebuilt_cache'] else '否'}")